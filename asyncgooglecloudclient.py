@@ -0,0 +1,418 @@
+"""
+	@file : asyncgooglecloudclient.py
+	@desc : The AsyncGoogleCloudClient class is the asyncio version of GoogleCloudClient. It talks to the
+	compute REST API over a pooled aiohttp session, reusing keep-alive connections, with a bounded number
+	of requests in flight. Every query and lifecycle method is a coroutine, so many calls can be awaited
+	together from one event loop.
+
+	Example:
+	>>> async def main():
+	... 	async with AsyncGoogleCloudClient('project-name') as client:
+	... 		servers = await client.get_rest_servers('RUNNING')
+	... 		await client.stop_instances([(s['name'], s['zone'].rsplit('/', 1)[-1]) for s in servers])
+	>>> asyncio.run(main())
+"""
+
+from googlecloudclient import INSTANCE_FIELDS, OPERATION_FIELDS, OPERATION_WAIT_WINDOW, POLL_INITIAL_DELAY, \
+	POLL_BACKOFF, POLL_MAX_DELAY, REST_SERVER_PATTERN, MACHINE_TYPE, BulkResult, OperationTimeoutError, instance_config, \
+	instance_filter, retry_delay, is_rate_limit_error
+from rateLimiter import RateLimiter
+from googleapiclient.errors import HttpError
+from contextlib import nullcontext
+import google.auth
+import google.auth.transport.requests
+import aiohttp
+import asyncio
+import httplib2
+import json
+import uuid
+import time
+import re
+
+COMPUTE_API_ENDPOINT = 'https://compute.googleapis.com/compute/v1/'
+COMPUTE_SCOPES = ['https://www.googleapis.com/auth/compute']
+
+# How many requests may be in flight at once. Operation long polls, which hold a connection for up to 2
+# minutes while sending nothing, are not counted, see _request
+MAX_CONNECTIONS = 100
+# Seconds an idle keep-alive connection is kept open
+KEEPALIVE_TIMEOUT = 30
+
+def read_startup_script():
+	# Blocking, so coroutines run it in the default executor
+	with open('startup.sh', 'r') as startup_script:
+		return startup_script.read()
+
+class AsyncGoogleCloudClient:
+
+	def __init__(self, project, credentials=None, api_endpoint=COMPUTE_API_ENDPOINT, max_connections=MAX_CONNECTIONS, rate_limiter=None):
+		"""
+		The constructor will set the project name and the credentials. The http session is opened when
+		the client is entered with 'async with', and closed when it exits.
+		Args:
+			project (str): The project name
+			credentials (Credentials): [optional] By default the application default credentials are used
+			api_endpoint (str): [optional] The root url of the compute API
+			max_connections (int): [optional] How many requests may be in flight at once
+			rate_limiter (RateLimiter): [optional] The read and write budget, share one with the
+			GoogleCloudClients of the same project, so together they stay within its limits
+		"""
+
+		self.project = project
+		self.api_endpoint = api_endpoint
+		self.max_connections = max_connections
+		self.rate_limiter = rate_limiter or RateLimiter()
+		if credentials is None:
+			credentials, _ = google.auth.default(scopes=COMPUTE_SCOPES)
+		self._credentials = credentials
+		self._session = None
+		self._semaphore = None
+		self._token_lock = None
+		# Image selfLinks and the startup script, per image, and the names handed out by next_rest_server_names
+		self._templates = {}
+		self._template_lock = None
+		self._reserved_names = set()
+		self._names_lock = None
+
+	async def __aenter__(self):
+		# The semaphore bounds the requests in flight, the connector would also hold up the long polls
+		connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=KEEPALIVE_TIMEOUT)
+		self._session = aiohttp.ClientSession(connector=connector)
+		self._semaphore = asyncio.Semaphore(self.max_connections)
+		self._token_lock = asyncio.Lock()
+		self._template_lock = asyncio.Lock()
+		self._names_lock = asyncio.Lock()
+		return self
+
+	async def __aexit__(self, *exc_info):
+		await self._session.close()
+		self._session = None
+
+	async def _authorization(self):
+		# Credentials refresh over a blocking transport, so it runs in the default executor
+		async with self._token_lock:
+			if not self._credentials.valid:
+				await asyncio.get_running_loop().run_in_executor(
+					None, self._credentials.refresh, google.auth.transport.requests.Request())
+		headers = {}
+		self._credentials.apply(headers)
+		return headers
+
+	async def _request(self, method, path, params=None, body=None, long_poll=False):
+		"""
+		This function will send a request to the compute API and return the decoded response. Calls that
+		fail with a transient error are retried like GoogleCloudClient's, see retry_delay. Each attempt
+		first waits for the rate limiter, and a rate limited call holds back every call of its kind. Writes
+		carry a requestId, so a retried write the API already received is not applied twice.
+		Args:
+			method (str): The http method
+			path (str): The path below projects/<project>/
+			params (dict): [optional] Query parameters, None values are left out
+			body (dict): [optional] The json body
+			long_poll (bool): [optional] The request may be held open for minutes, such as an operation's
+			wait, it is not counted against max_connections, so it does not hold up the other requests
+		Returns:
+			dict: The response body
+		Raises:
+			HttpError: If the API responds with an error status, like the synchronous client
+		"""
+
+		url = self.api_endpoint + 'projects/' + self.project + '/' + path
+		params = {key: value for key, value in (params or {}).items() if value is not None}
+		# Waiting on an operation only reads it, like GoogleCloudClient's _kind
+		kind = 'read' if method == 'GET' or path.endswith('/wait') else 'write'
+		attempt = 0
+		while True:
+			# Waited for outside the semaphore, so a held back call does not take a connection
+			wait = self.rate_limiter.reserve(reads=1) if kind == 'read' else self.rate_limiter.reserve(writes=1)
+			if wait > 0:
+				await asyncio.sleep(wait)
+			try:
+				async with (nullcontext() if long_poll else self._semaphore):
+					headers = await self._authorization()
+					try:
+						async with self._session.request(method, url, params=params, json=body, headers=headers) as response:
+							content = await response.read()
+					except aiohttp.ClientConnectionError as error:
+						raise ConnectionError(str(error)) from error
+					if response.status >= 400:
+						raise HttpError(httplib2.Response(dict(response.headers, status=response.status, reason=response.reason)), content, uri=str(response.url))
+				return json.loads(content) if content else {}
+			except (HttpError, ConnectionError, TimeoutError) as error:
+				delay = retry_delay(error, attempt)
+				if delay is None:
+					raise
+				if is_rate_limit_error(error):
+					self.rate_limiter.penalize(kind, delay)
+				await asyncio.sleep(delay)
+				attempt += 1
+
+	async def _list(self, path, params, key):
+		# Follows nextPageToken, collecting the page items found under key
+		items = []
+		params = dict(params)
+		while True:
+			response = await self._request('GET', path, params)
+			items.extend(key(response))
+			if 'nextPageToken' not in response:
+				return items
+			params['pageToken'] = response['nextPageToken']
+
+	async def get_zone_names_list(self):
+		"""
+		This function will return a list of the names of all zones.
+		Returns: list (str): ['asia-east1-c', 'us-central1-c', ... ]
+		"""
+
+		zones = await self._list('zones', {}, lambda response: response.get('items', []))
+		return [zone['description'] for zone in zones]
+
+	async def get_instances_in_zone(self, zone):
+		"""
+		This function will return a list of json data for all instances in a specific zone.
+		See GoogleCloudClient.get_instances_in_zone.
+		"""
+
+		return await self._list('zones/' + zone + '/instances', {'fields': 'nextPageToken,items(' + INSTANCE_FIELDS + ')'},
+			lambda response: response.get('items', []))
+
+	async def get_instance_data(self, zone, instance):
+		"""
+		This function will return all data associated with an instance.
+		See GoogleCloudClient.get_instance_data.
+		"""
+
+		return await self._request('GET', 'zones/' + zone + '/instances/' + instance)
+
+	async def list_instances(self, filter_by=None):
+		"""
+		This function will return a list of data about the instances in the project that match a filter,
+		using a single paginated aggregatedList call. See GoogleCloudClient.list_instances.
+		"""
+
+		params = {'filter': filter_by, 'fields': 'nextPageToken,items/*/instances(' + INSTANCE_FIELDS + ')'}
+		return await self._list('aggregated/instances', params,
+			lambda response: [instance for scoped_list in response.get('items', {}).values() for instance in scoped_list.get('instances', [])])
+
+	async def get_all_instances(self):
+		"""
+		This function will return a list data about all instances in the project.
+		See GoogleCloudClient.get_all_instances.
+		"""
+
+		return await self.list_instances()
+
+	async def query_instances(self, status=None, name_pattern=None, labels=None):
+		"""
+		This function will return a list of data about the instances that match every given condition,
+		sent to the API as a filter expression. See GoogleCloudClient.query_instances.
+		"""
+
+		return await self.list_instances(instance_filter(status, name_pattern, labels))
+
+	async def get_instances(self, status):
+		"""
+		This function will return a list of instances with a specific status.
+		See GoogleCloudClient.get_instances.
+		"""
+
+		return await self.query_instances(status=status)
+
+	async def get_instance_name_list(self):
+		"""
+		This function will return a list of the names of all instances in the project.
+		See GoogleCloudClient.get_instance_name_list.
+		"""
+
+		return [instance['name'] for instance in await self.list_instances()]
+
+	async def get_rest_servers(self, status):
+		"""
+		This function will return a list of data about all rest servers with a specific status.
+		See GoogleCloudClient.get_rest_servers.
+		"""
+
+		return await self.query_instances(status=status, name_pattern=REST_SERVER_PATTERN)
+
+	async def get_all_running_rest_server_internal_ips(self):
+		"""
+		This function will return a list of internal ip addresses for all running rest servers in the project.
+		Returns:
+			list (str): ['10.128.0.5']
+		"""
+
+		return [instance['networkInterfaces'][0]['networkIP'] for instance in await self.get_rest_servers('RUNNING')]
+
+	async def get_count_of_servers_with_name(self, server_name):
+		"""
+		This function will return the number of servers that contain server_name as a substring of its name.
+		See GoogleCloudClient.get_count_of_servers_with_name.
+		"""
+
+		instances = await self.query_instances(name_pattern='.*' + re.escape(server_name) + '.*')
+		return [instance['name'].count(server_name) for instance in instances].count(1)
+
+	async def get_operations_in_zone(self, zone):
+		"""
+		This function will return data about recent operations in a specific zone.
+		See GoogleCloudClient.get_operations_in_zone.
+		"""
+
+		return await self._request('GET', 'zones/' + zone + '/operations')
+
+	async def get_instance_operations(self, instance_json, operation_type):
+		"""
+		This function will return operation data for a specific instance, and a specific operation type.
+		See GoogleCloudClient.get_instance_operations.
+		"""
+
+		zone = instance_json['zone'].rsplit('/', 1)[-1]
+		filter_by = '(targetId eq '+instance_json['id']+')(operationType eq '+operation_type+')'
+		return await self._request('GET', 'zones/' + zone + '/operations', {'filter': filter_by, 'fields': OPERATION_FIELDS})
+
+	async def get_operation_result(self, operation):
+		"""
+		This function will return the result of an operation.
+		See GoogleCloudClient.get_operation_result.
+		"""
+
+		zone = operation['zone'].rsplit('/', 1)[-1]
+		return await self._request('GET', 'zones/' + zone + '/operations/' + operation['name'])
+
+	async def wait_for_operation(self, operation, timeout=None, long_poll=True):
+		"""
+		This function will wait for a provided operation to finish, and report any errors if they occur.
+		It long-polls the operation's wait method, falling back to polling with a growing delay, like
+		GoogleCloudClient.wait_for_operation.
+		Args:
+			operation (json): Data about the current operation
+			timeout (float): [optional] Seconds to wait before raising OperationTimeoutError
+			long_poll (bool): [optional] Set to False to always poll the operation
+		Returns:
+			dict: Details about the operation
+		"""
+
+		deadline = None if timeout is None else time.monotonic() + timeout
+		zone = operation['zone'].rsplit('/', 1)[-1]
+		result = operation
+		delay = POLL_INITIAL_DELAY
+		while result['status'] != 'DONE':
+			remaining = None if deadline is None else deadline - time.monotonic()
+			if remaining is not None and remaining <= 0:
+				raise OperationTimeoutError(result, timeout)
+			if long_poll and (remaining is None or remaining >= OPERATION_WAIT_WINDOW):
+				try:
+					result = await self._request('POST', 'zones/' + zone + '/operations/' + operation['name'] + '/wait', long_poll=True)
+					continue
+				except HttpError:
+					long_poll = False
+			if result is not operation:
+				await asyncio.sleep(delay if remaining is None else min(delay, remaining))
+				delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+			result = await self.get_operation_result(operation)
+		if 'error' in result:
+			raise Exception(result['error'])
+		return result
+
+	async def start_instance(self, name, zone):
+		"""
+		This function will start an instance.
+		See GoogleCloudClient.start_instance.
+		"""
+
+		return await self._request('POST', 'zones/' + zone + '/instances/' + name + '/start', {'requestId': str(uuid.uuid4())})
+
+	async def stop_instance(self, name, zone):
+		"""
+		This function will stop an instance.
+		See GoogleCloudClient.stop_instance.
+		"""
+
+		return await self._request('POST', 'zones/' + zone + '/instances/' + name + '/stop', {'requestId': str(uuid.uuid4())})
+
+	async def get_instance_template(self, my_image):
+		"""
+		This function will return the image's selfLink and the startup script in 'startup.sh', read once
+		per image. The script is read in the default executor, so the event loop is not blocked.
+		See GoogleCloudClient.get_instance_template.
+		"""
+
+		async with self._template_lock:
+			if my_image not in self._templates:
+				image = await self._request('GET', 'global/images/' + my_image)
+				startup_script = await asyncio.get_running_loop().run_in_executor(None, read_startup_script)
+				self._templates[my_image] = (image['selfLink'], startup_script)
+			return self._templates[my_image]
+
+	async def next_rest_server_names(self, count):
+		"""
+		This function will return count unused REST server names, skipping names that exist or that this
+		client already handed out, so servers created at the same time never get the same name.
+		See GoogleCloudClient.next_rest_server_names.
+		"""
+
+		async with self._names_lock:
+			existing = await self.get_instance_name_list()
+			used = set(existing) | self._reserved_names
+			number = [name.count('restserver') for name in existing].count(1)
+			names = []
+			while len(names) < count:
+				name = 'restserver-' + str(number)
+				if name not in used:
+					names.append(name)
+				number += 1
+			self._reserved_names.update(names)
+			return names
+
+	async def create_instance_from_image(self, my_image, zone, name=None, machine_type=MACHINE_TYPE):
+		"""
+		This function will create a new instance, from a previously made image, in a specific zone.
+		See GoogleCloudClient.create_instance_from_image.
+		"""
+
+		source_disk_image, startup_script = await self.get_instance_template(my_image)
+		if name is None:
+			name = (await self.next_rest_server_names(1))[0]
+		config = instance_config(name, zone, source_disk_image, startup_script, machine_type)
+		return await self._request('POST', 'zones/' + zone + '/instances', {'requestId': str(uuid.uuid4())}, config)
+
+	async def run_operations(self, operations, timeout=None):
+		"""
+		This function will submit many operations and wait on them together. The number of requests in
+		flight is bounded by the client's max_connections. A failure is recorded in that operation's
+		result, it does not stop the others.
+		Args:
+			operations (list): (name, coroutine function, args) tuples, such as stop_instance
+			timeout (float): [optional] Seconds to wait on each operation, see wait_for_operation
+		Returns:
+			list (BulkResult): One result for each operation, in the order they were given
+		"""
+
+		async def run(function, args):
+			return await self.wait_for_operation(await function(*args), timeout=timeout)
+
+		outcomes = await asyncio.gather(*[run(function, args) for _, function, args in operations], return_exceptions=True)
+		return [BulkResult(name, None, outcome) if isinstance(outcome, Exception) else BulkResult(name, outcome, None)
+			for (name, _, _), outcome in zip(operations, outcomes)]
+
+	async def start_instances(self, instances, timeout=None):
+		"""
+		This function will start many instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to start
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return await self.run_operations([(name, self.start_instance, (name, zone)) for name, zone in instances], timeout)
+
+	async def stop_instances(self, instances, timeout=None):
+		"""
+		This function will stop many instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to stop
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return await self.run_operations([(name, self.stop_instance, (name, zone)) for name, zone in instances], timeout)
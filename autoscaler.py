@@ -0,0 +1,451 @@
+"""
+	@file : autoscaler.py
+	@desc : This script keeps a project's REST servers in line with the traffic, by target tracking: every
+	interval it reads the requests the load balancer served, and scales (see scale.scale) so that each
+	REST server serves about target_rps requests per second, and the 95th percentile latency stays below
+	target_latency. The fleet only scales when the target changes:
+	- traffic within tolerance of the target does not change the count
+	- after scaling up, it does not scale again for scale_up_cooldown seconds
+	- it only scales down to the highest count recommended over the last scale_down_cooldown seconds, so
+	a short dip in traffic does not stop servers that are needed again a minute later
+
+	The traffic is read from the nginx request log, one json object per request (see the log_format in
+	the 'default' template), or from nginx's stub_status page, which has the request count but no
+	latencies. A recorded request log can be replayed offline with -replay, to try out the targets
+	without calling the API.
+
+	@arg  : project (str): name of the google cloud project
+	@arg  : zone (str): The default zone for new servers, see scale.py
+	@arg  : -log (str) [optional] the nginx request log to read, by default REQUEST_LOG
+	@arg  : -stats (str) [optional] read the nginx stub_status page at this url instead of the log
+	@arg  : -replay (str) [optional] replay a recorded request log and print the decisions, the API is not called
+	@arg  : -target_rps (float) [optional] requests per second each REST server should serve
+	@arg  : -target_latency (float) [optional] seconds the 95th percentile latency should stay below
+	@arg  : -min (int) [optional] the fewest REST servers to run
+	@arg  : -max (int) [optional] the most REST servers to run
+	@arg  : -interval (float) [optional] seconds between decisions
+	@arg  : -warm_pool (int) [optional] keep this many REST servers SUSPENDED, see scale.py
+	@arg  : -profile (str) [optional] write the API calls and the time of each step to this file on exit,
+	see profiler.py
+	@arg  :	-e  (flag) [optional] email each scaling, gathered into digests, see sendEmail.Notifier
+	@arg  : -fr (flag) [optional] [required if -e is true] should precede the senders email address
+	@arg  : -to (flag) [optional] [required if -e is true] should precede the recipients email address
+
+	Example:
+	>>> python3 autoscaler.py project us-central1-c -log /var/log/nginx/requests.log
+	>>> python3 autoscaler.py project us-central1-c -stats http://10.128.0.2/nginx_status -target_rps 40
+	>>> python3 autoscaler.py project us-central1-c -replay requests.log -interval 30
+	>>> python3 autoscaler.py project us-central1-c -e -fr sender@gmail.com -to recipient@gmail.com
+"""
+
+from googlecloudclient import GoogleCloudClient
+from sendEmail import Notifier
+from argparse import ArgumentParser
+from sys import argv
+from colorama import init, Fore
+from collections import deque
+import urllib.request
+import math
+import time
+import json
+import os
+import re
+import scale
+
+# Where the 'default' template has nginx log each request, named *.log so the nginx logrotate entry
+# rotates it with the other logs
+REQUEST_LOG = '/var/log/nginx/requests.log'
+
+# Defaults for the Autoscaler: requests per second each REST server should serve, the 95th percentile
+# latency in seconds to stay below, and how far either may be from its target before the count changes
+TARGET_RPS = 50
+TARGET_LATENCY = 0.5
+TOLERANCE = 0.1
+LATENCY_PERCENTILE = 0.95
+# Seconds of traffic each decision is based on, and seconds between decisions
+WINDOW = 60
+INTERVAL = 15
+# Seconds to wait after scaling up before scaling again, and the seconds of recommendations a scale
+# down is based on. Scaling down is slower, stopping a server that is needed again costs a boot
+SCALE_UP_COOLDOWN = 60
+SCALE_DOWN_COOLDOWN = 300
+MIN_SERVERS = 1
+MAX_SERVERS = 10
+
+class RequestLogSource:
+
+	def __init__(self, path=REQUEST_LOG):
+		"""
+		The constructor will start reading a request log at its end, so only new requests are counted.
+		Args:
+			path (str): [optional] The request log, one json object per line with 'time' (seconds since
+			the epoch) and 'request_time' (seconds)
+		"""
+
+		self.path = path
+		self._inode = os.stat(path).st_ino if os.path.exists(path) else None
+		self._offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+	def read(self):
+		"""
+		This function will read the requests logged since the last read. A log that was rotated, moved
+		away or truncated, is read from its start.
+		Returns:
+			tuple (int, list): The number of requests, and their latencies
+		"""
+
+		if not os.path.exists(self.path):
+			return 0, []
+		stat = os.stat(self.path)
+		if stat.st_ino != self._inode or stat.st_size < self._offset:
+			self._inode = stat.st_ino
+			self._offset = 0
+		with open(self.path, 'rb') as log:
+			log.seek(self._offset)
+			data = log.read()
+		# A line still being written is read next time
+		data = data[:data.rfind(b'\n') + 1]
+		self._offset += len(data)
+		latencies = [latency for _, latency in parse_request_log(data.decode('utf-8', 'replace').splitlines())]
+		return len(latencies), latencies
+
+class StubStatusSource:
+
+	def __init__(self, url):
+		"""
+		The constructor will set up reading an nginx stub_status page. The page only counts requests, so
+		decisions are based on the request rate alone.
+		Args:
+			url (str): The url of the page, such as http://10.128.0.2/nginx_status
+		"""
+
+		self.url = url
+		self._requests = None
+
+	def read(self):
+		"""
+		This function will read the requests served since the last read.
+		Returns:
+			tuple (int, list): The number of requests, and no latencies
+		"""
+
+		with urllib.request.urlopen(self.url, timeout=5) as response:
+			page = response.read().decode()
+		# server accepts handled requests
+		#  1156 1156 4491
+		requests = int(re.search(r'^\s*\d+\s+\d+\s+(\d+)\s*$', page, re.MULTILINE).group(1))
+		# The first read, and a restarted nginx, only set the starting point
+		served = 0 if self._requests is None or requests < self._requests else requests - self._requests
+		self._requests = requests
+		return served, []
+
+def parse_request_log(lines):
+	"""
+	This function will parse the lines of a request log, skipping the lines that are not requests.
+	Args:
+		lines (iterable): The lines of the log
+	Returns:
+		generator (tuple): (time, latency) of each request
+	"""
+
+	for line in lines:
+		try:
+			request = json.loads(line)
+			yield float(request['time']), float(request['request_time'])
+		except (ValueError, KeyError, TypeError):
+			continue
+
+def percentile(values, share):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(math.ceil(share * len(values))) - 1)]
+
+class Autoscaler:
+
+	def __init__(self, target_rps=TARGET_RPS, target_latency=TARGET_LATENCY, min_servers=MIN_SERVERS, max_servers=MAX_SERVERS,
+		tolerance=TOLERANCE, window=WINDOW, scale_up_cooldown=SCALE_UP_COOLDOWN, scale_down_cooldown=SCALE_DOWN_COOLDOWN):
+		"""
+		The constructor will set up the targets. The Autoscaler does not read the clock, every call is
+		given the time, so a recorded trace can be replayed as fast as it can be read.
+		Args:
+			target_rps (float): [optional] Requests per second each REST server should serve
+			target_latency (float): [optional] Seconds the 95th percentile latency should stay below
+			min_servers (int): [optional] The fewest REST servers to run
+			max_servers (int): [optional] The most REST servers to run
+			tolerance (float): [optional] How far, as a share of the target, traffic may be from the
+			target before the count changes
+			window (float): [optional] Seconds of traffic each decision is based on
+			scale_up_cooldown (float): [optional] Seconds after scaling up before scaling again
+			scale_down_cooldown (float): [optional] Seconds of recommendations a scale down is based on
+		"""
+
+		self.target_rps = target_rps
+		self.target_latency = target_latency
+		self.min_servers = min_servers
+		self.max_servers = max_servers
+		self.tolerance = tolerance
+		self.window = window
+		self.scale_up_cooldown = scale_up_cooldown
+		self.scale_down_cooldown = scale_down_cooldown
+		self._observations = deque()
+		self._recommendations = deque()
+		self._started = None
+		self._observed = None
+		self._scaled_up_at = None
+
+	def observe(self, now, requests, latencies=()):
+		"""
+		This function will record the traffic served since the last observation, and the time it was
+		served over, so an observation that spans a long scale is not taken as a burst. The first
+		observation starts the clock, its requests are not counted, as the time they were served over is
+		not known.
+		Args:
+			now (float): The time, in seconds
+			requests (int): The number of requests served
+			latencies (list): [optional] The latencies of the requests, in seconds
+		"""
+
+		if self._started is None:
+			self._started = self._observed = now
+			return
+		self._observations.append((now, now - self._observed, requests, list(latencies)))
+		self._observed = now
+		while self._observations[0][0] <= now - self.window:
+			self._observations.popleft()
+
+	def load(self, now):
+		"""
+		This function will return the traffic of the observations that end within the window, the rate
+		being over the time they cover.
+		Args:
+			now (float): The time, in seconds
+		Returns:
+			tuple (float, float): The requests per second, and the 95th percentile latency in seconds, or
+			None if no latencies were observed
+		"""
+
+		seconds = sum(observation[1] for observation in self._observations)
+		requests = sum(observation[2] for observation in self._observations)
+		latencies = [latency for observation in self._observations for latency in observation[3]]
+		return requests / seconds if seconds > 0 else 0, percentile(latencies, LATENCY_PERCENTILE) if len(latencies) > 0 else None
+
+	def recommend(self, now, current):
+		"""
+		This function will return the count the traffic calls for, without the cooldowns. The rate calls
+		for rate / target_rps servers, and the latency for current * latency / target_latency, the higher
+		one wins. A count whose load is within tolerance of the target is kept.
+		Args:
+			now (float): The time, in seconds
+			current (int): The number of REST servers running
+		Returns:
+			int: The number of REST servers to run
+		"""
+
+		rate, latency = self.load(now)
+		if current == 0:
+			return max(self.min_servers, min(self.max_servers, int(math.ceil(rate / self.target_rps))))
+		ratio = rate / (current * self.target_rps)
+		if latency is not None:
+			ratio = max(ratio, latency / self.target_latency)
+		if abs(ratio - 1) <= self.tolerance:
+			desired = current
+		else:
+			# Enough servers to bring the load within tolerance above the target, not exactly onto it
+			desired = int(math.ceil(current * ratio / (1 + self.tolerance)))
+		return max(self.min_servers, min(self.max_servers, desired))
+
+	def decide(self, now, current):
+		"""
+		This function will return the number of REST servers to scale to, if it should change. Tell the
+		Autoscaler with scaled once the scaling is done, the scale up cooldown starts then.
+		Args:
+			now (float): The time, in seconds
+			current (int): The number of REST servers running
+		Returns:
+			int: The number of REST servers to scale to, or None to keep current
+		"""
+
+		recommendation = self.recommend(now, current)
+		self._recommendations.append((now, recommendation))
+		while self._recommendations[0][0] <= now - self.scale_down_cooldown:
+			self._recommendations.popleft()
+		if recommendation > current:
+			if self._scaled_up_at is not None and now - self._scaled_up_at < self.scale_up_cooldown:
+				return None
+			return recommendation
+		# Scale down to the highest recent recommendation, once there is a cooldown's worth of them
+		desired = max(count for _, count in self._recommendations)
+		if desired < current and now - self._started >= self.scale_down_cooldown:
+			if self._scaled_up_at is None or now - self._scaled_up_at >= self.scale_down_cooldown:
+				return desired
+		return None
+
+	def scaled(self, now, current, desired):
+		"""
+		This function will record a scaling that was carried out, see decide. A scaling that failed is
+		not recorded, so it is decided again at the next interval.
+		Args:
+			now (float): The time of the decision, in seconds
+			current (int): The number of REST servers before
+			desired (int): The number of REST servers after
+		"""
+
+		if desired > current:
+			self._scaled_up_at = now
+
+def replay(path, autoscaler, interval=INTERVAL, current=None):
+	"""
+	This function will replay a recorded request log through an Autoscaler, as if each decision was
+	carried out at once. The latencies are the ones recorded, they do not change with the count.
+	Args:
+		path (str): The request log
+		autoscaler (obj): An Autoscaler
+		interval (float): [optional] Seconds between decisions
+		current (int): [optional] The number of REST servers at the start, by default the autoscaler's minimum
+	Returns:
+		list (dict): {'time', 'rps', 'latency', 'current', 'desired'} for each decision
+	"""
+
+	with open(path, 'r') as log:
+		requests = sorted(parse_request_log(log))
+	current = autoscaler.min_servers if current is None else current
+	decisions = []
+	if len(requests) == 0:
+		return decisions
+	start = requests[0][0]
+	autoscaler.observe(start, 0)
+	index = 0
+	now = start + interval
+	while index < len(requests):
+		latencies = []
+		while index < len(requests) and requests[index][0] < now:
+			latencies.append(requests[index][1])
+			index += 1
+		autoscaler.observe(now, len(latencies), latencies)
+		rate, latency = autoscaler.load(now)
+		desired = autoscaler.decide(now, current)
+		decisions.append({'time': now - start, 'rps': rate, 'latency': latency, 'current': current, 'desired': desired})
+		if desired is not None:
+			autoscaler.scaled(now, current, desired)
+			current = desired
+		now += interval
+	return decisions
+
+def print_decisions(decisions):
+	print('{:>8}{:>10}{:>10}{:>9}{:>9}'.format('time', 'rps', 'p95', 'current', 'desired'))
+	for decision in decisions:
+		latency = '-' if decision['latency'] is None else '{:.3f}'.format(decision['latency'])
+		desired = '' if decision['desired'] is None else decision['desired']
+		print('{:>8.0f}{:>10.1f}{:>10}{:>9}{:>9}'.format(decision['time'], decision['rps'], latency, decision['current'], desired))
+
+def run(client, zone, source, autoscaler, interval=INTERVAL, warm_pool=0, checks=None, notifier=None):
+	"""
+	This function will read the traffic every interval seconds, and scale the REST servers when the
+	Autoscaler decides to, see scale.scale. A scaling that fails is reported, and decided again at the
+	next interval. A warm pool refill still running from the last scale is waited for before the
+	running REST servers are counted, so the servers it is still warming are not counted as serving.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+		zone (str): The default zone for new servers
+		source (obj): Where the traffic is read from, a RequestLogSource or a StubStatusSource
+		autoscaler (obj): An Autoscaler
+		interval (float): [optional] Seconds between decisions
+		warm_pool (int): [optional] How many REST servers to keep SUSPENDED, see scale.py
+		checks (int): [optional] Stop after this many decisions, by default run until interrupted
+		notifier (obj): [optional] A sendEmail.Notifier to tell about each scaling
+	Returns:
+		Nothing
+	"""
+	from googleapiclient.errors import HttpError
+	refill = None
+	count = 0
+	autoscaler.observe(time.monotonic(), 0)
+	try:
+		# Sets the starting point of a stub_status page, the log is already read from its end
+		source.read()
+	except (OSError, ValueError, AttributeError):
+		pass
+	while checks is None or count < checks:
+		count += 1
+		time.sleep(interval)
+		now = time.monotonic()
+		try:
+			with client.profiler.phase('read traffic'):
+				requests, latencies = source.read()
+		except (OSError, ValueError, AttributeError) as error:
+			# Without traffic figures nothing is decided, a missing figure is not the same as no traffic
+			print(Fore.YELLOW + 'Could not read the traffic, trying again in {} seconds: {}'.format(interval, error))
+			continue
+		autoscaler.observe(now, requests, latencies)
+		if refill is not None:
+			with client.profiler.phase('wait for warm pool'):
+				refill.join()
+			refill = None
+		try:
+			current = len(client.get_rest_servers('RUNNING'))
+		except HttpError as error:
+			print(Fore.YELLOW + 'Could not read the running REST servers, trying again in {} seconds: {}'.format(interval, error))
+			continue
+		desired = autoscaler.decide(now, current)
+		if desired is None:
+			continue
+		rate, latency = autoscaler.load(now)
+		reason = '{:.1f} requests per second, 95th percentile {}, scaling from {} to {} REST servers'.format(
+			rate, '-' if latency is None else '{:.3f}s'.format(latency), current, desired)
+		print(reason)
+		try:
+			with client.profiler.phase('scale'):
+				refill = scale.scale(client.project, desired, zone, client=client, warm_pool=warm_pool, max_instances=autoscaler.max_servers)
+		except Exception as error:
+			# API errors that outlived the retries, failed operations and failed pushes to the load
+			# balancer are all decided again at the next interval
+			print(Fore.YELLOW + 'Could not scale to {} REST servers, trying again in {} seconds: {}'.format(desired, interval, error))
+			if notifier is not None:
+				notifier.notify('{} failed to scale to {} REST servers'.format(client.project, desired), '{}\n{}'.format(reason, error))
+			continue
+		autoscaler.scaled(now, current, desired)
+		if notifier is not None:
+			notifier.notify('{} scaled to {} REST servers'.format(client.project, desired), reason)
+	if refill is not None:
+		refill.join()
+
+def main(project, zone, log, stats, replay_path, autoscaler, interval, warm_pool=0, profile=None, from_email=None, to_email=None):
+	init(autoreset=True)
+	if replay_path is not None:
+		print_decisions(replay(replay_path, autoscaler, interval))
+		return
+	client = GoogleCloudClient(project, cache_ttl=scale.INVENTORY_CACHE_TTL)
+	source = StubStatusSource(stats) if stats is not None else RequestLogSource(log)
+	notifier = Notifier(from_email, to_email) if to_email is not None else None
+	try:
+		print('Autoscaling the REST servers of {}, press Ctrl+C to stop'.format(project))
+		run(client, zone, source, autoscaler, interval, warm_pool, notifier=notifier)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		if notifier is not None:
+			notifier.close()
+		if profile is not None:
+			client.profiler.dump(profile, 'autoscaler')
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='This script will scale the REST servers of a Google Cloud project \
+	to follow the traffic on the load balancer.')
+	parser.add_argument('project', help='the name of your google cloud project')
+	parser.add_argument('zone', help='the zone to create an instance in, if needed')
+	parser.add_argument('-log', default=REQUEST_LOG, help='the nginx request log to read')
+	parser.add_argument('-stats', help='read the nginx stub_status page at this url instead of the log')
+	parser.add_argument('-replay', help='replay a recorded request log and print the decisions')
+	parser.add_argument('-target_rps', type=float, default=TARGET_RPS, help='requests per second each REST server should serve')
+	parser.add_argument('-target_latency', type=float, default=TARGET_LATENCY, help='seconds the 95th percentile latency should stay below')
+	parser.add_argument('-min', type=int, default=MIN_SERVERS, help='the fewest REST servers to run')
+	parser.add_argument('-max', type=int, default=MAX_SERVERS, help='the most REST servers to run')
+	parser.add_argument('-interval', type=float, default=INTERVAL, help='seconds between decisions')
+	parser.add_argument('-warm_pool', type=int, default=0, help='the number of REST servers to keep suspended, ready to resume')
+	parser.add_argument('-profile', help='write a profile of the API calls to this file, .json or .prom')
+	parser.add_argument('-e', help='flag to email each scaling, gathered into digests', action='store_true')
+	parser.add_argument('-fr', required='-e' in argv, help='sender email')
+	parser.add_argument('-to', required='-e' in argv, help='recipient email')
+	args = parser.parse_args()
+	autoscaler = Autoscaler(args.target_rps, args.target_latency, args.min, args.max)
+	main(args.project, args.zone, args.log, args.stats, args.replay, autoscaler, args.interval, args.warm_pool, args.profile,
+		args.fr if args.e else None, args.to if args.e else None)
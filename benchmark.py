@@ -0,0 +1,109 @@
+"""
+	@file : benchmark.py
+	@desc : This script will time scale.py, cleaner.py and updateLoadBalancer.py against a fakeCompute.py
+	server, for projects of a few sizes, and report the wall time and the compute API calls of each run.
+	Nothing talks to GCP, the load balancer config is written to a temporary directory, and every REST
+	server passes its health check without being probed.
+
+	Each project holds a load balancer, stopped REST servers (a tenth of the instances, at least 5, half of
+	them labeled persistent=true) and workers for the rest. The scenarios are:
+	scale-up: scale.py from 0 to 10 running REST servers, starting stopped ones and creating the rest
+	scale-down: scale.py from 10 back to 0
+	cleaner: cleaner.py -np_rest, stopping the non persistent REST servers
+	lb-sync: updateLoadBalancer.py pushing the upstream of the running REST servers
+
+	@arg  : -sizes (int) [optional] the project sizes, by default 10 100 1000
+	@arg  : -latency (float) [optional] seconds the fake API adds to every request
+	@arg  : -operation_duration (float) [optional] seconds before a fake operation is DONE
+	@arg  : -error_rate (float) [optional] the share of fake API requests that fail with a transient error
+	@arg  : -json [optional] print the results as json
+
+	Example:
+	>>> python3 benchmark.py -sizes 10 100 -latency 0.05
+"""
+
+from fakeCompute import FakeCompute, FakeComputeServer, seed
+from googlecloudclient import GoogleCloudClient
+from loadBalancerTransport import LocalTransport
+from google.auth.credentials import AnonymousCredentials
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+import updateLoadBalancer
+import tempfile
+import cleaner
+import scale
+import json
+import time
+import io
+import os
+
+PROJECT = 'benchmark'
+SIZES = [10, 100, 1000]
+
+def new_client(server):
+	return GoogleCloudClient(PROJECT, cache_ttl=scale.INVENTORY_CACHE_TTL, api_endpoint=server.url, credentials=AnonymousCredentials())
+
+def run_scenarios(size, latency=0, operation_duration=0.5, error_rate=0):
+	"""
+	This function will run every scenario, in order, against one fake project.
+	Args:
+		size (int): How many instances the project holds
+		latency (float): [optional] Seconds the fake API adds to every request
+		operation_duration (float): [optional] Seconds before a fake operation is DONE
+		error_rate (float): [optional] The share of requests that fail with a transient error
+	Returns:
+		list (dict): {'size', 'scenario', 'seconds', 'calls', 'bytes'} for each scenario
+	"""
+
+	fake = FakeCompute(latency=latency, operation_duration=operation_duration, error_rate=error_rate)
+	rest_servers = max(size // 10, 5)
+	results = []
+	with FakeComputeServer(fake) as server, tempfile.TemporaryDirectory() as directory:
+		seed(fake, PROJECT, max(size, rest_servers + 1), rest_servers, rest_servers // 2, 'TERMINATED')
+		transport = LocalTransport(directory)
+		pushed_configs_file = updateLoadBalancer.PUSHED_CONFIGS_FILE
+		updateLoadBalancer.PUSHED_CONFIGS_FILE = os.path.join(directory, 'pushed-configs.json')
+		# The fake servers' ips do not exist, probing them would only time out
+		probe_backends = updateLoadBalancer.probe_backends
+		can_reach = scale.can_reach
+		updateLoadBalancer.probe_backends = scale.probe_backends = lambda ips: {ip: 0.001 for ip in ips}
+		scale.can_reach = lambda ip: True
+		scenarios = [
+			('scale-up', lambda: scale.scale(PROJECT, 10, 'us-central1-c', client=new_client(server), transport=transport)),
+			('lb-sync', lambda: updateLoadBalancer.update_load_balancer_upstream(new_client(server), 'us-central1-c', 'loadbalancer-0', 'fibonacci', force=True, transport=transport)),
+			('cleaner', lambda: cleaner.main(PROJECT, False, False, True, False, None, None, client=new_client(server))),
+			('scale-down', lambda: scale.scale(PROJECT, 0, 'us-central1-c', client=new_client(server), transport=transport))
+		]
+		try:
+			for scenario, run in scenarios:
+				fake.calls.clear()
+				fake.bytes_sent = 0
+				start = time.perf_counter()
+				with redirect_stdout(io.StringIO()):
+					run()
+				results.append({'size': size, 'scenario': scenario, 'seconds': time.perf_counter() - start,
+					'calls': sum(fake.calls.values()), 'bytes': fake.bytes_sent, 'by_method': dict(fake.calls)})
+		finally:
+			updateLoadBalancer.PUSHED_CONFIGS_FILE = pushed_configs_file
+			updateLoadBalancer.probe_backends = scale.probe_backends = probe_backends
+			scale.can_reach = can_reach
+	return results
+
+def print_results(results):
+	print('{:>6}  {:<12}{:>10}{:>8}{:>12}'.format('size', 'scenario', 'seconds', 'calls', 'bytes'))
+	for result in results:
+		print('{size:>6}  {scenario:<12}{seconds:>10.3f}{calls:>8}{bytes:>12}'.format(**result))
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='This script will benchmark the scripts against a fake compute API.')
+	parser.add_argument('-sizes', type=int, nargs='+', default=SIZES, help='the number of instances in each project')
+	parser.add_argument('-latency', type=float, default=0, help='seconds the fake API adds to every request')
+	parser.add_argument('-operation_duration', type=float, default=0.5, help='seconds before a fake operation is DONE')
+	parser.add_argument('-error_rate', type=float, default=0, help='the share of requests that fail with a transient error')
+	parser.add_argument('-json', action='store_true', help='print the results as json')
+	args = parser.parse_args()
+	results = [result for size in args.sizes for result in run_scenarios(size, args.latency, args.operation_duration, args.error_rate)]
+	if args.json:
+		print(json.dumps(results, indent=2))
+	else:
+		print_results(results)
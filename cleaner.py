@@ -4,7 +4,8 @@
 	a few different ways to shut down servers. These options can be selected by using arguments
 	when calling the script.
 
-	@arg  : project (str) [required] name of the google cloud project
+	@arg  : project (str) [required] name of the google cloud project, or the names of many projects, which
+	are cleaned at the same time, see fleet.py
 	@arg  : -all (flag) provide this argument to shut down all servers
 	@arg  : -rest (flag) provide this argument to shut down all REST servers
 	@arg  : -np_rest (flag) provide this argument to shut down all REST servers not labeled as persistent
@@ -13,15 +14,25 @@
 	@arg  : -fr (flag) [optional] [required if -e is true] should precede the senders email address
 	@arg  : -to (flag) [optional] [required if -e is true] should precede the recipients email address
 	NOTE  : If -e option is indicated, then -fr and -to are required	
+	@arg  : -profile (str) [optional] write the API calls and the time of each step to this file, as
+	json, or in the Prometheus text format if it ends with '.prom', see profiler.py
+	@arg  : -inventory (str) [optional] keep the inventory in a local SQLite store between runs, and only
+	fetch what changed since the last run, see inventoryStore.py. The path is optional
+	@arg  : -workers (int) [optional] with many projects, the most projects cleaned at the same time
 
 	Examples:
 	>>> python3 cleaner.py project -all
 	>>> python3 cleaner.py project -rest
 	>>> python3 cleaner.py project -np_rest
 	>>> python3 cleaner.py project -all -e -fr sender@gmail.com -to recipient@gmail.com
+	>>> python3 cleaner.py project -np_rest -profile /var/lib/node_exporter/cleaner.prom
+	>>> python3 cleaner.py project -np_rest -inventory
+	>>> python3 cleaner.py project-a project-b project-c -np_rest -workers 4
 """
 
 from googlecloudclient import GoogleCloudClient
+from fleet import fleet_clients, run_fleet, FLEET_WORKERS
+from inventoryStore import InventoryStore, INVENTORY_PATH
 from argparse import ArgumentParser
 from sys import argv
 from colorama import init, Fore
@@ -30,6 +41,7 @@ from sendEmail import *
 def shut_down_servers(client, servers):
 	"""
 	This function will shut down all instances within the argument list object, servers.
+	The stop operations are submitted together, see GoogleCloudClient.run_operations.
 	Args:
 		client (obj): An instantiated GoogleCloudClient object
 		servers (list) (json): see the following link
@@ -38,46 +50,96 @@ def shut_down_servers(client, servers):
 		list (str): The names of the servers that have been shut down
 	"""
 	servers_shut_down = []
-	for instance in servers:
-		print('{:<70}'.format('Shutting down {} ...'.format(instance['name'])), end='', flush=True),
-		zone_name = instance['zone'].rsplit('/', 1)[-1]
-		instance_name = instance['name']
-		operation = client.stop_instance(instance_name, zone_name)
-		result = client.wait_for_operation(operation)
-		if result['status'] == 'DONE':
+	print('{:<70}'.format('Shutting down {} servers ...'.format(len(servers))), end='', flush=True),
+	results = client.stop_instances([(instance['name'], instance['zone'].rsplit('/', 1)[-1]) for instance in servers])
+	print(Fore.GREEN + '[COMPLETE]')
+	for result in results:
+		print('{:<70}'.format('Shutting down {} ...'.format(result.name)), end='', flush=True),
+		if result.error is None:
 			print(Fore.GREEN + '[COMPLETE]')
-			servers_shut_down.append(instance_name)
+			servers_shut_down.append(result.name)
+		else:
+			print(Fore.RED + '[FAILED]')
+			print(Fore.CYAN + str(result.error))
 	print('{:<70}'.format('Shutdown status'), end='', flush=True),
 	print(Fore.GREEN + '[COMPLETE]')
 	return servers_shut_down
 
-def main(project, all, rest, non_persistent_rest, email, from_email, to_email):
+def clean_project(client, all, rest, non_persistent_rest):
+	"""
+	This function will find the servers to shut down in the client's project, and shut them down.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+		all, rest, non_persistent_rest (bool): Which servers to shut down, only one should be True
+	Returns:
+		tuple (int, list): The number of servers found, and the names of the servers that have been shut down
+	"""
+	with client.profiler.phase('find servers'):
+		if all:
+			print('Beginning to shut down all servers in {}'.format(client.project))
+			servers_to_shut_down = client.get_instances('RUNNING')
+		elif rest:
+			print('Beginning to shut down all REST servers in {}'.format(client.project))
+			servers_to_shut_down = client.get_rest_servers('RUNNING')
+		elif non_persistent_rest:
+			print('Beginning to shut down all non persistent REST servers in {}'.format(client.project))
+			servers_to_shut_down = client.get_running_rest_servers_without_label('persistent', 'true')
+	with client.profiler.phase('shut down servers'):
+		return len(servers_to_shut_down), shut_down_servers(client, servers_to_shut_down)
+
+def print_report(results):
+	"""
+	This function will print what was shut down in each project, see fleet.run_fleet.
+	Args:
+		results (list) (FleetResult): The result of each project, (found, shut down names) or an error
+	"""
+	print('{:<40}{:>8}{:>11}{:>8}{:>10}'.format('project', 'found', 'shut down', 'failed', 'seconds'))
+	for result in results:
+		if result.error is None:
+			found, shut_down = result.result
+			print('{:<40}{:>8}{:>11}{:>8}{:>10.1f}'.format(result.name, found, len(shut_down), found - len(shut_down), result.seconds))
+		else:
+			print(Fore.RED + '{:<40}{:>8}{:>11}{:>8}{:>10.1f}  {}'.format(result.name, '-', '-', '-', result.seconds, result.error))
+
+def main(project, all, rest, non_persistent_rest, email, from_email, to_email, client=None, profile=None, inventory=None, workers=FLEET_WORKERS):
 	init(autoreset=True)
-	client = GoogleCloudClient(project)
-	if all:
-		print('Beginning to shut down all servers in {}'.format(project))
-		servers_to_shut_down = client.get_instances('RUNNING')
-	elif rest:
-		print('Beginning to shut down all REST servers in {}'.format(project))
-		servers_to_shut_down = client.get_rest_servers('RUNNING')
-	elif non_persistent_rest:
-		print('Beginning to shut down all non persistent REST servers in {}'.format(project))
-		servers_to_shut_down = client.get_running_rest_servers_without_label('persistent', 'true')
-	servers_shut_down = shut_down_servers(client, servers_to_shut_down)
-	if email:
-		send_email(project + ' Instances Shut Down', str(servers_shut_down), from_email, to_email)
+	projects = [project] if isinstance(project, str) else list(project)
+	store = None if inventory is None else InventoryStore(inventory)
+	if len(projects) > 1:
+		clients = fleet_clients(projects, inventory=store)
+		client = clients[0]
+	else:
+		client = client or GoogleCloudClient(projects[0], inventory=store)
+		clients = [client]
+	try:
+		if len(clients) == 1:
+			_, servers_shut_down = clean_project(client, all, rest, non_persistent_rest)
+			report = servers_shut_down
+		else:
+			results = run_fleet([(c.project, lambda c=c: clean_project(c, all, rest, non_persistent_rest)) for c in clients], workers)
+			print_report(results)
+			report = {result.name: result.result[1] if result.error is None else 'FAILED: {}'.format(result.error) for result in results}
+		if email:
+			with client.profiler.phase('send email'):
+				send_email(', '.join(projects) + ' Instances Shut Down', str(report), from_email, to_email)
+	finally:
+		if profile is not None:
+			client.profiler.dump(profile, 'cleaner')
 
 if __name__ == "__main__":
 	parser = ArgumentParser(
 		description='This script will shut down all REST servers not labeled as persistent in \
 		a Google Cloud project - with an option to send an email containing the names of the  \
 		servers shut down ')
-	parser.add_argument('project', help='the name of your google cloud project')
+	parser.add_argument('project', nargs='+', help='the name of your google cloud project, or of many projects')
 	parser.add_argument('-all', help='flag to indicate all servers in project will be shut down', action='store_true')
 	parser.add_argument('-rest', help='flag to indicate all REST servers will be shut down', action='store_true')
 	parser.add_argument('-np_rest', help='flag to indicate all non-persistent REST servers will be shut down', action='store_true')
 	parser.add_argument('-e', help='flag to send an email containing the names of servers shut down', action='store_true')
 	parser.add_argument('-fr', required='-e' in argv, help='sender email')
 	parser.add_argument('-to', required='-e' in argv, help='recipient email')
+	parser.add_argument('-profile', help='write a profile of the API calls to this file, .json or .prom')
+	parser.add_argument('-inventory', nargs='?', const=INVENTORY_PATH, help='keep the inventory in a local store, at this path if given')
+	parser.add_argument('-workers', type=int, default=FLEET_WORKERS, help='with many projects, the most projects cleaned at the same time')
 	args = parser.parse_args()
-	main(args.project, args.all, args.rest, args.np_rest, args.e, args.fr, args.to)
+	main(args.project, args.all, args.rest, args.np_rest, args.e, args.fr, args.to, profile=args.profile, inventory=args.inventory, workers=args.workers)
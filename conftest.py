@@ -0,0 +1,40 @@
+"""
+	@file : conftest.py
+	@desc : The pytest fixtures the tests share: a fakeCompute.py server and clients pointed at it, a
+	LocalTransport standing in for the load balancer, and health checks that answer without a network.
+"""
+
+from google.auth.credentials import AnonymousCredentials
+from googlecloudclient import GoogleCloudClient
+from fakeCompute import FakeCompute, FakeComputeServer
+from loadBalancerTransport import LocalTransport
+import updateLoadBalancer
+import pytest
+import scale
+
+@pytest.fixture
+def fake():
+	fake = FakeCompute(operation_duration=0.1)
+	with FakeComputeServer(fake) as server:
+		fake.url = server.url
+		yield fake
+
+@pytest.fixture
+def new_client(fake):
+	return lambda project='p': GoogleCloudClient(project, cache_ttl=60, api_endpoint=fake.url, credentials=AnonymousCredentials())
+
+@pytest.fixture
+def transport(tmp_path, monkeypatch):
+	monkeypatch.setattr(updateLoadBalancer, 'PUSHED_CONFIGS_FILE', str(tmp_path / 'pushed-configs.json'))
+	return LocalTransport(str(tmp_path))
+
+@pytest.fixture
+def silent_ips(monkeypatch):
+	# The project's network is reachable, and every REST server answers its health check at once,
+	# except the ones whose ip is added to the set
+	silent = set()
+	probe = lambda ips: {ip: None if ip in silent else 0.001 for ip in ips}
+	monkeypatch.setattr(updateLoadBalancer, 'probe_backends', probe)
+	monkeypatch.setattr(scale, 'probe_backends', probe)
+	monkeypatch.setattr(scale, 'can_reach', lambda ip: True)
+	return silent
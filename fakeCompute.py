@@ -0,0 +1,528 @@
+"""
+	@file : fakeCompute.py
+	@desc : A local stand-in for the compute API endpoints GoogleCloudClient and AsyncGoogleCloudClient use,
+	so the scripts can run, and be benchmarked, without a GCP project. It keeps zones, regions with
+	quotas, images, instances and operations in memory, and serves:
+	zones and regions list, instances list/aggregatedList/get/start/stop/suspend/resume/insert/bulkInsert,
+	images get, zoneOperations list/get/wait, globalOperations aggregatedList, and multipart batch requests.
+
+	The behaviour can be tuned: latency added to every request, page size, how long operations take
+	before they are DONE, regional quota limits, zones whose inserts fail with a quota error, and a
+	share of requests that fail with a transient error (503 backendError or 403 rateLimitExceeded).
+	Every request is counted by API method in 'calls', response bytes in 'bytes_sent', and the connections
+	clients opened in 'connections'. Like the real API, responses are gzipped for clients that accept gzip
+	and have '(gzip)' in their User-Agent.
+
+	@arg  : -port (int) [optional] port to listen on, by default 8080
+	@arg  : -instances (int) [optional] number of instances to start with
+	@arg  : -latency (float) [optional] seconds added to every request
+	@arg  : -operation_duration (float) [optional] seconds before an operation is DONE
+	@arg  : -error_rate (float) [optional] the share of requests that fail with a transient error
+
+	Examples:
+	>>> python3 fakeCompute.py -instances 100 -latency 0.05
+	>>> client = GoogleCloudClient('project', api_endpoint='http://127.0.0.1:8080/compute/v1/', credentials=AnonymousCredentials())
+
+	>>> with FakeComputeServer(FakeCompute(latency=0.02)) as server:
+	... 	client = GoogleCloudClient('project', api_endpoint=server.url, credentials=AnonymousCredentials())
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timezone
+import threading
+import operator
+import gzip
+import random
+import json
+import time
+import re
+
+ZONES = [
+	'us-central1-a', 'us-central1-b', 'us-central1-c', 'us-central1-f',
+	'us-east1-b', 'us-east1-c', 'us-east1-d',
+	'europe-west1-b', 'europe-west1-c', 'europe-west1-d',
+	'asia-east1-a', 'asia-east1-b', 'asia-east1-c'
+]
+# The default limit of each regional quota the client reads
+QUOTA_LIMIT = 10000
+# The most items a list call returns when the caller does not set maxResults, the API's own default
+PAGE_SIZE = 500
+# The longest a zoneOperations().wait call blocks before returning an unfinished operation
+WAIT_WINDOW = 120
+# Machine types whose instances cannot be suspended, suspending them fails as the API does
+UNSUSPENDABLE_MACHINE_TYPES = ('f1-micro', 'g1-small')
+# The comparison operators filters may use besides eq and ne
+COMPARISONS = {'=': operator.eq, '!=': operator.ne, '>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt}
+
+class FakeComputeError(Exception):
+
+	def __init__(self, status, reason, message):
+		super().__init__(message)
+		self.status = status
+		self.reason = reason
+
+def _timestamp(seconds):
+	return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec='milliseconds')
+
+def _select_fields(item, fields):
+	# Keeps the top level attributes named in a partial response mask such as 'items/*/instances(name,zone)'
+	match = re.search(r'\(([^)]*(?:\([^)]*\)[^)]*)*)\)\s*$', fields or '')
+	if match is None:
+		return item
+	names = {re.split(r'[/(]', name.strip())[0] for name in re.split(r',(?![^(]*\))', match.group(1))}
+	return {key: value for key, value in item.items() if key in names}
+
+def _matches(item, filter_by):
+	# Understands the '(field eq value)(field ne value)' filters the clients send, values are regular
+	# expressions, and '(field >= "value") OR (...)' comparisons, which compare strings, so timestamps
+	# compare correctly when they have the same offset
+	if ' OR ' in (filter_by or ''):
+		return any(_matches(item, part) for part in filter_by.split(' OR '))
+	for field, comparison, value in re.findall(r'\((\S+) (eq|ne|!=|>=|<=|=|>|<) ([^)]*)\)', filter_by or ''):
+		actual = item
+		for key in field.split('.'):
+			actual = actual.get(key) if isinstance(actual, dict) else None
+		if comparison in COMPARISONS:
+			if actual is None or not COMPARISONS[comparison](str(actual), value.strip('"')):
+				return False
+			continue
+		found = actual is not None and re.fullmatch(value, str(actual)) is not None
+		if found != (comparison == 'eq'):
+			return False
+	return True
+
+class FakeCompute:
+
+	def __init__(self, latency=0, page_size=PAGE_SIZE, operation_duration=0.5, quota_limit=QUOTA_LIMIT, full_zones=(),
+		wait_window=WAIT_WINDOW, zones=ZONES, images=('lab02-restserver',), error_rate=0):
+		"""
+		The constructor will set up an empty project.
+		Args:
+			latency (float): [optional] Seconds added to every request
+			page_size (int): [optional] The most items a list call returns, unless maxResults is smaller
+			operation_duration (float): [optional] Seconds from submitting an operation until it is DONE
+			quota_limit (float or dict): [optional] The limit of every regional quota, or a dict of limits
+			by region name
+			full_zones (list): [optional] Zones where every insert fails with a quotaExceeded error
+			wait_window (float): [optional] The longest zoneOperations().wait blocks
+			zones (list): [optional] The names of the zones
+			images (list): [optional] The names of the images
+			error_rate (float): [optional] The share of requests, from 0 to 1, that fail with a transient error
+		"""
+
+		self.latency = latency
+		self.page_size = page_size
+		self.operation_duration = operation_duration
+		self.quota_limit = quota_limit
+		self.full_zones = set(full_zones)
+		self.wait_window = wait_window
+		self.zones = list(zones)
+		self.images = set(images)
+		self.error_rate = error_rate
+		self.instances = {}
+		self.operations = {}
+		self.calls = Counter()
+		self.bytes_sent = 0
+		self.connections = 0
+		self.base_url = 'http://localhost/compute/v1/'
+		self._next_id = 1000
+		self._lock = threading.RLock()
+
+	def _id(self):
+		self._next_id += 1
+		return str(self._next_id)
+
+	def _link(self, project, *path):
+		return self.base_url + 'projects/' + project + '/' + '/'.join(path)
+
+	def region(self, zone):
+		return zone.rsplit('-', 1)[0]
+
+	def add_instance(self, project, name, zone, status='RUNNING', labels=None, created=None, machine_type='f1-micro'):
+		"""
+		This function will add an instance directly, without an operation, to seed the project.
+		Args:
+			project (str): The project name
+			name (str): The instance name
+			zone (str): The zone it is located in
+			status (str): [optional] RUNNING, TERMINATED, SUSPENDED ...
+			labels (dict): [optional] The instance labels
+			created (float): [optional] The creation time in seconds since the epoch, by default now
+			machine_type (str): [optional] The name of the machine type
+		Returns:
+			dict: The instance
+		"""
+
+		with self._lock:
+			created = time.time() if created is None else created
+			number = len(self.instances)
+			instance = {
+				'kind': 'compute#instance',
+				'id': self._id(),
+				'name': name,
+				'zone': self._link(project, 'zones', zone),
+				'status': status,
+				'machineType': self._link(project, 'zones', zone, 'machineTypes', machine_type),
+				'creationTimestamp': _timestamp(created),
+				'networkInterfaces': [{
+					'network': self._link(project, 'global', 'networks', 'default'),
+					'networkIP': '10.{}.{}.{}'.format(number // 65536 % 256, number // 256 % 256, number % 256 + 2),
+					'accessConfigs': [{'type': 'ONE_TO_ONE_NAT', 'name': 'External NAT', 'natIP': '35.{}.{}.{}'.format(number // 65536 % 256, number // 256 % 256, number % 256 + 2)}]
+				}],
+				'selfLink': self._link(project, 'zones', zone, 'instances', name)
+			}
+			if labels:
+				instance['labels'] = dict(labels)
+			self.instances[(project, zone, name)] = instance
+			return instance
+
+	def _advance(self):
+		# Finishes every operation whose time has come, and applies it to its instance
+		now = time.time()
+		for operation in self.operations.values():
+			if operation['status'] != 'DONE' and operation['_done_at'] <= now:
+				operation['status'] = 'DONE'
+				operation['progress'] = 100
+				operation['endTime'] = _timestamp(now)
+				for apply in operation.pop('_apply'):
+					apply(now)
+
+	def _operation(self, project, zone, operation_type, instance=None, apply=()):
+		now = time.time()
+		name = 'operation-' + self._id()
+		operation = {
+			'kind': 'compute#operation',
+			'id': self._id(),
+			'name': name,
+			'zone': self._link(project, 'zones', zone),
+			'operationType': operation_type,
+			'status': 'RUNNING',
+			'progress': 0,
+			'insertTime': _timestamp(now),
+			'startTime': _timestamp(now),
+			'selfLink': self._link(project, 'zones', zone, 'operations', name),
+			'_done_at': now + self.operation_duration,
+			'_apply': list(apply)
+		}
+		if instance is not None:
+			operation['targetLink'] = instance['selfLink']
+			operation['targetId'] = instance['id']
+		self.operations[(project, zone, name)] = operation
+		self._advance()
+		return operation
+
+	def _public(self, operation):
+		return {key: value for key, value in operation.items() if not key.startswith('_')}
+
+	def _instance(self, project, zone, name):
+		if (project, zone, name) not in self.instances:
+			raise FakeComputeError(404, 'notFound', "The resource 'projects/{}/zones/{}/instances/{}' was not found".format(project, zone, name))
+		return self.instances[(project, zone, name)]
+
+	def _page(self, items, query, fields):
+		start = int(query.get('pageToken', 0))
+		size = min(int(query.get('maxResults', self.page_size)), self.page_size)
+		page = {'items': [_select_fields(item, fields) for item in items[start:start + size]]}
+		if start + size < len(items):
+			page['nextPageToken'] = str(start + size)
+		return page
+
+	def _usage(self, project, region):
+		return sum(1 for (p, zone, _) in self.instances if p == project and self.region(zone) == region)
+
+	def _limit(self, region):
+		if isinstance(self.quota_limit, dict):
+			return self.quota_limit.get(region, QUOTA_LIMIT)
+		return self.quota_limit
+
+	def _insert(self, project, zone, names, config, operation_type):
+		if zone in self.full_zones or self._usage(project, self.region(zone)) + len(names) > self._limit(self.region(zone)):
+			raise FakeComputeError(403, 'quotaExceeded', "Quota 'INSTANCES' exceeded. Limit: {} in region {}.".format(
+				self._limit(self.region(zone)), self.region(zone)))
+		for name in names:
+			if (project, zone, name) in self.instances:
+				raise FakeComputeError(409, 'alreadyExists', "The resource 'projects/{}/zones/{}/instances/{}' already exists".format(project, zone, name))
+		machine_type = config.get('machineType', 'f1-micro').rsplit('/', 1)[-1]
+		created = [self.add_instance(project, name, zone, 'PROVISIONING', config.get('labels'), machine_type=machine_type) for name in names]
+
+		def running(now):
+			for instance in created:
+				instance['status'] = 'RUNNING'
+				instance['lastStartTimestamp'] = _timestamp(now)
+
+		return self._operation(project, zone, operation_type, created[0] if len(created) == 1 else None, [running])
+
+	def _lifecycle(self, project, zone, name, action):
+		instance = self._instance(project, zone, name)
+		if action == 'suspend' and instance['machineType'].rsplit('/', 1)[-1] in UNSUSPENDABLE_MACHINE_TYPES:
+			raise FakeComputeError(400, 'badRequest', "Instance '{}' with machine type '{}' cannot be suspended.".format(
+				name, instance['machineType'].rsplit('/', 1)[-1]))
+		status = {'start': 'RUNNING', 'stop': 'TERMINATED', 'suspend': 'SUSPENDED', 'resume': 'RUNNING'}[action]
+		timestamp = {'start': 'lastStartTimestamp', 'stop': 'lastStopTimestamp', 'suspend': 'lastSuspendedTimestamp', 'resume': 'lastStartTimestamp'}[action]
+		instance['status'] = {'start': 'STAGING', 'stop': 'STOPPING', 'suspend': 'SUSPENDING', 'resume': 'STAGING'}[action]
+
+		def finish(now):
+			instance['status'] = status
+			instance[timestamp] = _timestamp(now)
+
+		return self._operation(project, zone, action, instance, [finish])
+
+	def handle(self, method, path, query, body):
+		"""
+		This function will answer one API request.
+		Args:
+			method (str): GET or POST
+			path (str): The url path, such as /compute/v1/projects/p/zones
+			query (dict): The query parameters
+			body (dict): The decoded json body, or None
+		Returns:
+			tuple (str, dict): The API method name, for counting, and the response
+		Raises:
+			FakeComputeError: For the errors the API would return
+		"""
+
+		match = re.fullmatch(r'/compute/v1/projects/([^/]+)/(.*)', path)
+		if match is None:
+			raise FakeComputeError(404, 'notFound', 'Unknown path ' + path)
+		project, rest = match.groups()
+		parts = rest.split('/')
+		fields = query.get('fields')
+		with self._lock:
+			self._advance()
+			if method == 'GET' and parts == ['zones']:
+				zones = [{'kind': 'compute#zone', 'name': zone, 'description': zone, 'status': 'UP',
+					'region': self._link(project, 'regions', self.region(zone))} for zone in self.zones]
+				return 'zones.list', self._page(zones, query, fields)
+			if method == 'GET' and parts == ['regions']:
+				regions = []
+				for region in sorted({self.region(zone) for zone in self.zones}):
+					usage = self._usage(project, region)
+					regions.append({'kind': 'compute#region', 'name': region, 'quotas': [
+						{'metric': metric, 'limit': float(self._limit(region)), 'usage': float(usage)} for metric in ('INSTANCES', 'CPUS', 'IN_USE_ADDRESSES')]})
+				return 'regions.list', self._page(regions, query, fields)
+			if method == 'GET' and parts == ['aggregated', 'instances']:
+				instances = [instance for (p, _, _), instance in self.instances.items() if p == project and _matches(instance, query.get('filter'))]
+				page = self._page(instances, query, fields)
+				items = {}
+				for instance in page.pop('items'):
+					items.setdefault('zones/' + instance.get('zone', '').rsplit('/', 1)[-1], {'instances': []})['instances'].append(instance)
+				page['items'] = items
+				return 'instances.aggregatedList', page
+			if method == 'GET' and parts == ['aggregated', 'operations']:
+				operations = [self._public(operation) for (p, _, _), operation in self.operations.items() if p == project and _matches(operation, query.get('filter'))]
+				page = self._page(operations, query, fields)
+				items = {}
+				for operation in page.pop('items'):
+					items.setdefault('zones/' + operation.get('zone', '').rsplit('/', 1)[-1], {'operations': []})['operations'].append(operation)
+				page['items'] = items
+				return 'globalOperations.aggregatedList', page
+			if method == 'GET' and parts[:1] == ['global'] and parts[1:2] == ['images'] and len(parts) == 3:
+				if parts[2] not in self.images:
+					raise FakeComputeError(404, 'notFound', "The resource 'projects/{}/global/images/{}' was not found".format(project, parts[2]))
+				return 'images.get', {'kind': 'compute#image', 'name': parts[2], 'selfLink': self._link(project, 'global', 'images', parts[2])}
+			if parts[:1] != ['zones'] or len(parts) < 3:
+				raise FakeComputeError(404, 'notFound', 'Unknown path ' + path)
+			zone = parts[1]
+			if zone not in self.zones:
+				raise FakeComputeError(404, 'notFound', "The resource 'projects/{}/zones/{}' was not found".format(project, zone))
+			if parts[2] == 'instances':
+				if method == 'GET' and len(parts) == 3:
+					instances = [instance for (p, z, _), instance in self.instances.items() if p == project and z == zone and _matches(instance, query.get('filter'))]
+					return 'instances.list', self._page(instances, query, fields)
+				if method == 'GET' and len(parts) == 4:
+					return 'instances.get', _select_fields(self._instance(project, zone, parts[3]), fields)
+				if method == 'POST' and len(parts) == 3:
+					return 'instances.insert', self._public(self._insert(project, zone, [body['name']], body, 'insert'))
+				if method == 'POST' and parts[3:] == ['bulkInsert']:
+					names = list(body.get('perInstanceProperties', {}))
+					return 'instances.bulkInsert', self._public(self._insert(project, zone, names, body.get('instanceProperties', {}), 'bulkInsert'))
+				if method == 'POST' and len(parts) == 5 and parts[4] in ('start', 'stop', 'suspend', 'resume'):
+					return 'instances.' + parts[4], self._public(self._lifecycle(project, zone, parts[3], parts[4]))
+			if parts[2] == 'operations':
+				if method == 'GET' and len(parts) == 3:
+					operations = [self._public(operation) for (p, z, _), operation in self.operations.items() if p == project and z == zone and _matches(operation, query.get('filter'))]
+					page = self._page(operations, query, fields)
+					if len(page['items']) == 0:
+						del page['items']
+					return 'zoneOperations.list', page
+				if (project, zone, parts[3]) not in self.operations:
+					raise FakeComputeError(404, 'notFound', "The resource 'projects/{}/zones/{}/operations/{}' was not found".format(project, zone, parts[3]))
+				operation = self.operations[(project, zone, parts[3])]
+				if method == 'GET' and len(parts) == 4:
+					return 'zoneOperations.get', self._public(operation)
+				if method == 'POST' and parts[4:] == ['wait']:
+					deadline = time.time() + self.wait_window
+			else:
+				raise FakeComputeError(404, 'notFound', 'Unknown path ' + path)
+		# Waiting happens outside the lock, so other requests are served meanwhile
+		while True:
+			with self._lock:
+				self._advance()
+				if operation['status'] == 'DONE' or time.time() >= deadline:
+					return 'zoneOperations.wait', self._public(operation)
+				remaining = min(operation['_done_at'], deadline) - time.time()
+			time.sleep(max(remaining, 0.001))
+
+	def answer(self, method, url, body):
+		"""
+		This function will answer one API request, counting it and turning errors into responses.
+		Args:
+			method (str): GET or POST
+			url (str): The request url, with its query
+			body (bytes): The request body
+		Returns:
+			tuple (int, dict): The http status and the response body
+		"""
+
+		parsed = urlparse(url)
+		query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+		try:
+			if random.random() < self.error_rate:
+				raise random.choice([FakeComputeError(503, 'backendError', 'Backend Error'),
+					FakeComputeError(403, 'rateLimitExceeded', 'Rate Limit Exceeded')])
+			api_method, response = self.handle(method, parsed.path, query, json.loads(body) if body else None)
+			status = 200
+		except FakeComputeError as error:
+			api_method, status = 'error', error.status
+			response = {'error': {'code': error.status, 'message': str(error), 'errors': [{'reason': error.reason, 'message': str(error)}]}}
+		with self._lock:
+			self.calls[api_method] += 1
+		return status, response
+
+class _Handler(BaseHTTPRequestHandler):
+
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, *args):
+		pass
+
+	def setup(self):
+		super().setup()
+		with self.server.fake._lock:
+			self.server.fake.connections += 1
+
+	def _respond(self, status, content, content_type='application/json'):
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		if 'gzip' in self.headers.get('Accept-Encoding', '') and '(gzip)' in self.headers.get('User-Agent', ''):
+			content = gzip.compress(content, compresslevel=6)
+			self.send_header('Content-Encoding', 'gzip')
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+		with self.server.fake._lock:
+			self.server.fake.bytes_sent += len(content)
+
+	def _serve(self, method):
+		fake = self.server.fake
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if fake.latency:
+			time.sleep(fake.latency)
+		if self.path.startswith('/batch/'):
+			return self._batch(body)
+		status, response = fake.answer(method, self.path, body)
+		self._respond(status, json.dumps(response).encode())
+
+	def _batch(self, body):
+		# Each part of a multipart/mixed batch holds one http request, answered in a part of the response
+		fake = self.server.fake
+		boundary = re.search(r'boundary="?([^";]+)"?', self.headers['Content-Type']).group(1)
+		parts = []
+		for part in body.decode().split('--' + boundary)[1:-1]:
+			content_id = re.search(r'Content-ID: <([^>]*)>', part, re.IGNORECASE).group(1)
+			request = part.split('\r\n\r\n', 1)[1] if '\r\n\r\n' in part else part.split('\n\n', 1)[1]
+			request_line, _, rest = request.partition('\n')
+			method, url, _ = request_line.strip().split(' ')
+			request_body = rest.split('\r\n\r\n', 1)[1].strip() if '\r\n\r\n' in rest else ''
+			status, response = fake.answer(method, url, request_body.encode())
+			parts.append('--batch_response\r\nContent-Type: application/http\r\nContent-ID: <response-{}>\r\n\r\n'
+				'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n\r\n{}\r\n'.format(content_id, status, 'OK' if status == 200 else 'Error', json.dumps(response)))
+		with fake._lock:
+			fake.calls['batch'] += 1
+		self._respond(200, (''.join(parts) + '--batch_response--\r\n').encode(), 'multipart/mixed; boundary=batch_response')
+
+	def do_GET(self):
+		self._serve('GET')
+
+	def do_POST(self):
+		self._serve('POST')
+
+class FakeComputeServer:
+
+	def __init__(self, fake, port=0):
+		"""
+		The constructor will set up a server for a FakeCompute. It listens on 127.0.0.1 once started, or
+		entered with 'with'.
+		Args:
+			fake (FakeCompute): The fake project to serve
+			port (int): [optional] The port, by default any free port
+		"""
+
+		self.fake = fake
+		self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+		self.server.daemon_threads = True
+		self.server.fake = fake
+		self.url = 'http://127.0.0.1:{}/compute/v1/'.format(self.server.server_address[1])
+		fake.base_url = self.url
+		self._thread = None
+
+	def start(self):
+		self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+def seed(fake, project, count, rest_servers=0, persistent=0, rest_status='RUNNING', zones=None):
+	"""
+	This function will fill a fake project with count instances: a load balancer in us-central1-c, the
+	given number of REST servers, the first persistent of them labeled persistent=true, and workers
+	for the rest. Instances are spread over the zones, and created a minute apart.
+	Args:
+		fake (FakeCompute): The fake project
+		project (str): The project name
+		count (int): How many instances in total
+		rest_servers (int): [optional] How many of them are REST servers
+		persistent (int): [optional] How many REST servers are labeled persistent=true
+		rest_status (str): [optional] The status of the REST servers
+		zones (list): [optional] The zones to spread instances over, by default all of them
+	"""
+
+	zones = zones or fake.zones
+	start = time.time() - 60 * count
+	fake.add_instance(project, 'loadbalancer-0', 'us-central1-c', created=start)
+	for i in range(1, count):
+		zone = zones[i % len(zones)]
+		if i <= rest_servers:
+			labels = {'persistent': 'true' if i <= persistent else 'false'}
+			fake.add_instance(project, 'restserver-' + str(i - 1), zone, rest_status, labels, created=start + 60 * i)
+		else:
+			fake.add_instance(project, 'worker-' + str(i), zone, created=start + 60 * i)
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='This script will serve a fake compute API on 127.0.0.1.')
+	parser.add_argument('-port', type=int, default=8080, help='the port to listen on')
+	parser.add_argument('-project', default='project', help='the project to seed with instances')
+	parser.add_argument('-instances', type=int, default=0, help='the number of instances to start with')
+	parser.add_argument('-rest', type=int, default=0, help='how many of them are REST servers')
+	parser.add_argument('-latency', type=float, default=0, help='seconds added to every request')
+	parser.add_argument('-operation_duration', type=float, default=0.5, help='seconds before an operation is DONE')
+	parser.add_argument('-error_rate', type=float, default=0, help='the share of requests that fail with a transient error')
+	args = parser.parse_args()
+	fake = FakeCompute(latency=args.latency, operation_duration=args.operation_duration, error_rate=args.error_rate)
+	server = FakeComputeServer(fake, args.port)
+	if args.instances > 0:
+		seed(fake, args.project, args.instances, args.rest)
+	print('Serving a fake compute API at {}'.format(server.url))
+	server.server.serve_forever()
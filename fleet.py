@@ -0,0 +1,111 @@
+"""
+	@file : fleet.py
+	@desc : Runs a script's work on many projects or load balancers at the same time, for cleaner.py and
+	updateLoadBalancer.py. The clients share one compute service, credentials, profiler and pool of
+	connections, see GoogleCloudClient.for_project, so the discovery document is built once. At most
+	FLEET_WORKERS jobs run at once, and the whole run takes about as long as its slowest job instead of
+	the sum of them all.
+
+	What each job prints is held back and printed as one block when the job finishes, so the output of
+	the jobs is not interleaved.
+
+	Example:
+	>>> clients = fleet_clients(['project-a', 'project-b'])
+	>>> results = run_fleet([(c.project, lambda c=c: len(c.get_rest_servers('RUNNING'))) for c in clients])
+	>>> [(result.name, result.result) for result in results]
+"""
+
+from googlecloudclient import GoogleCloudClient
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import threading
+import time
+import sys
+import io
+
+# The most projects or load balancers worked on at the same time
+FLEET_WORKERS = 8
+
+FleetResult = namedtuple('FleetResult', ['name', 'result', 'error', 'seconds'])
+
+class _ThreadOutput:
+
+	def __init__(self, stream):
+		# Writes from a thread that is capturing go to its buffer, other writes go to the stream
+		self.stream = stream
+		self._local = threading.local()
+		self._lock = threading.Lock()
+
+	def __getattr__(self, name):
+		return getattr(self.stream, name)
+
+	def capture(self):
+		self._local.buffer = io.StringIO()
+
+	def release(self):
+		buffer = self._local.buffer
+		self._local.buffer = None
+		with self._lock:
+			# Line by line, so colorama's autoreset resets the colour at the end of each line. A job that
+			# failed part way through a line still ends it
+			for line in buffer.getvalue().splitlines():
+				self.stream.write(line + '\n')
+			self.stream.flush()
+
+	def write(self, text):
+		buffer = getattr(self._local, 'buffer', None)
+		if buffer is not None:
+			return buffer.write(text)
+		with self._lock:
+			return self.stream.write(text)
+
+	def flush(self):
+		if getattr(self._local, 'buffer', None) is None:
+			self.stream.flush()
+
+def fleet_clients(projects, **kwargs):
+	"""
+	This function will return a client for each project, sharing one compute service, see
+	GoogleCloudClient.for_project.
+	Args:
+		projects (list): The project names
+		kwargs: [optional] Passed to the GoogleCloudClient constructor, rate_limiter is not shared
+	Returns:
+		list (GoogleCloudClient): A client for each project, in the order given
+	"""
+
+	rate_limiter = kwargs.pop('rate_limiter', None)
+	first = GoogleCloudClient(projects[0], rate_limiter=rate_limiter, **kwargs)
+	return [first] + [first.for_project(project, inventory=kwargs.get('inventory')) for project in projects[1:]]
+
+def run_fleet(jobs, workers=FLEET_WORKERS):
+	"""
+	This function will run jobs at the same time, at most workers at once. A job that fails does not
+	stop the others, its error is in its result.
+	Args:
+		jobs (list): (name, function) tuples, function() does the job
+		workers (int): [optional] The most jobs run at once
+	Returns:
+		list (FleetResult): (name, result, error, seconds) for each job, in the order given
+	"""
+
+	def run(name, function):
+		output.capture()
+		start = time.perf_counter()
+		try:
+			return FleetResult(name, function(), None, time.perf_counter() - start)
+		except Exception as error:
+			return FleetResult(name, None, error, time.perf_counter() - start)
+		finally:
+			output.release()
+
+	if len(jobs) == 0:
+		return []
+	output = _ThreadOutput(sys.stdout)
+	sys.stdout = output
+	try:
+		with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+			futures = [executor.submit(run, name, function) for name, function in jobs]
+		return [future.result() for future in futures]
+	finally:
+		sys.stdout = output.stream
@@ -7,36 +7,732 @@
 
 	Example:
 	>>> client = GoogleCloudClient('project-name')
+
+	Passing cache_ttl (seconds) turns on an inventory snapshot: the first query lists the project, and
+	every status, name and label query made within cache_ttl seconds reads from that snapshot instead.
+	Operations that finish through wait_for_operation patch the snapshot, so it stays accurate while a
+	script starts, stops and creates instances.
+	>>> client = GoogleCloudClient('project-name', cache_ttl=60)
+
+	start_instances, stop_instances and create_instances_from_image submit many operations at once and
+	wait on them together, see run_operations.
+	>>> client.stop_instances([('restserver-0', 'us-central1-c'), ('restserver-1', 'us-central1-f')])
+
+	iter_instances streams the inventory page by page as compact Instance records, so scanning a large
+	project keeps one page in memory, and can stop early.
+	>>> next(instance for instance in client.iter_instances(status='RUNNING') if instance.labels.get('role') == 'db')
+
+	Passing an InventoryStore keeps the inventory in a local SQLite file between runs, and answers
+	queries from its indexes. Each sync only fetches the instances that recent operations touched, see
+	sync_inventory.
+	>>> client = GoogleCloudClient('project-name', cache_ttl=60, inventory=InventoryStore())
+
+	Calls are kept within the project's read and write rate limits by a RateLimiter, and calls that fail
+	with a transient error (429, 5xx, rate limit exceeded, a dropped connection) are retried with a
+	jittered exponential backoff that honours Retry-After, see retry_delay. Writes carry a requestId, so
+	a retried write is never applied twice.
+
+	Requests are sent over an HttpPool of kept-alive, gzipped connections, so calls can be made from many
+	threads at once, and threads reuse each other's connections, see httpPool.py.
+	>>> client = GoogleCloudClient('project-name', http_pool=HttpPool(credentials, size=40))
+
+	Every API call is recorded by the client's profiler: count, errors, bytes received and latency by
+	API method, and the time spent in wait_for_operation, see profiler.py.
+	>>> client.profiler.dump('profile.json')
 """
 
-import googleapiclient.discovery
+from concurrent.futures import ThreadPoolExecutor
+from rateLimiter import RateLimiter
+from httpPool import HttpPool
+from profiler import Profiler
+from collections import namedtuple
+from datetime import datetime, timezone
+import threading
+import hashlib
+import random
+import email.utils
+import json
 import time
+import uuid
 import os
+import re
+
+# googleapiclient, httplib2 and google_auth_httplib2 are imported where they are used, so importing
+# this module (and running a script with --help) stays fast
+
+# The compute resources the client uses. The cached discovery document only keeps these, which makes
+# building the service much faster than building it from the full document
+COMPUTE_RESOURCES = ('zones', 'regions', 'instances', 'images', 'zoneOperations', 'globalOperations')
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/compute/v1/rest'
+
+# Where the scripts keep files between runs
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'google-cloud-scripts')
+
+# The status an instance is left in once an operation of this type is DONE
+OPERATION_RESULT_STATUS = {
+	'start': 'RUNNING',
+	'stop': 'TERMINATED',
+	'suspend': 'SUSPENDED',
+	'resume': 'RUNNING'
+}
+
+# Partial response masks, only the attributes the scripts read are downloaded
+INSTANCE_FIELDS = 'name,zone,status,id,machineType,networkInterfaces,labels,creationTimestamp,lastStartTimestamp,lastStopTimestamp,lastSuspendedTimestamp'
+OPERATION_FIELDS = 'nextPageToken,items(name,zone,status,operationType,targetLink,targetId,startTime,endTime,error)'
+
+# zoneOperations().wait returns after at most this many seconds, even if the operation is not DONE
+OPERATION_WAIT_WINDOW = 120
+# Delays used when polling zoneOperations().get instead: the first delay, growth factor, and the cap
+POLL_INITIAL_DELAY = 0.25
+POLL_BACKOFF = 1.5
+POLL_MAX_DELAY = 5
+
+# Matches the name of every REST server, see get_rest_servers
+REST_SERVER_PATTERN = '.*restserver.*'
+
+# The most requests the API accepts in one batch, see execute_batch
+BATCH_MAX_SIZE = 1000
+
+# How many operations run_operations submits and waits on at the same time by default
+BULK_MAX_WORKERS = 10
+
+# The outcome of one operation submitted by run_operations. result is the DONE operation, or None
+# if the operation could not be submitted or failed, in which case error holds the exception
+BulkResult = namedtuple('BulkResult', ['name', 'result', 'error'])
+
+# How many times a call that failed with a transient error is retried, and the backoff before each
+# retry: up to RETRY_INITIAL_DELAY * 2^attempt seconds, chosen at random, and never more than RETRY_MAX_DELAY
+RETRY_MAX_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 1
+RETRY_MAX_DELAY = 32
+# Http statuses that are worth retrying, anything else is permanent
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+# Error reasons that mean the project is rate limited, the API reports these with a 403
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+# Error reasons that mean a zone or region has no room for another instance
+CAPACITY_REASONS = ('quotaExceeded', 'QUOTA_EXCEEDED', 'ZONE_RESOURCE_POOL_EXHAUSTED',
+	'ZONE_RESOURCE_POOL_EXHAUSTED_WITH_DETAILS', 'RESOURCE_POOL_EXHAUSTED')
+
+# A sync of an InventoryStore only looks at operations from INVENTORY_SYNC_OVERLAP seconds before the
+# last sync onwards, which allows for clock skew. A store last synced more than INVENTORY_MAX_AGE seconds
+# ago, when older operations may have been dropped by the API, or fully synced more than
+# INVENTORY_FULL_SYNC_INTERVAL seconds ago, is listed again in full
+INVENTORY_SYNC_OVERLAP = 60
+INVENTORY_MAX_AGE = 6 * 3600
+INVENTORY_FULL_SYNC_INTERVAL = 24 * 3600
+
+# The machine type of new REST servers. First generation shared-core machines cannot be suspended, so
+# servers meant for a warm pool are created as SUSPENDABLE_MACHINE_TYPE instead, see can_suspend
+MACHINE_TYPE = 'f1-micro'
+SUSPENDABLE_MACHINE_TYPE = 'e2-micro'
+UNSUSPENDABLE_MACHINE_TYPES = ('f1-micro', 'g1-small')
+
+# What one REST server (a shared-core machine with an external ip) takes from its region's quotas, see plan_placement
+INSTANCE_QUOTA_COST = {
+	'INSTANCES': 1,
+	'CPUS': 1,
+	'IN_USE_ADDRESSES': 1
+}
+
+def load_discovery_document():
+	"""
+	This function will return the compute v1 discovery document, trimmed to COMPUTE_RESOURCES and the
+	schemas they use. The trimmed document is cached in CACHE_DIR, under a name made from the
+	googleapiclient version and the resource list, so upgrading the library or using another resource
+	starts a new cache file. The full document is the one shipped with googleapiclient, or is fetched
+	from DISCOVERY_URL if the library does not ship one.
+	Returns:
+		str: The discovery document
+	"""
+
+	import googleapiclient.version
+	from googleapiclient import discovery_cache
+	key = hashlib.sha1(','.join(COMPUTE_RESOURCES).encode()).hexdigest()[:8]
+	path = os.path.join(CACHE_DIR, 'compute.v1.{}.{}.json'.format(googleapiclient.version.__version__, key))
+	try:
+		with open(path, 'r') as cached:
+			return cached.read()
+	except OSError:
+		pass
+	document = discovery_cache.get_static_doc('compute', 'v1')
+	if document is None:
+		import httplib2
+		document = httplib2.Http().request(DISCOVERY_URL)[1].decode()
+	document = json.dumps(_trim_discovery_document(json.loads(document), COMPUTE_RESOURCES))
+	try:
+		os.makedirs(CACHE_DIR, exist_ok=True)
+		with open(path + '.tmp', 'w') as cached:
+			cached.write(document)
+		os.replace(path + '.tmp', path)
+	except OSError:
+		# A read-only home directory only costs the trimming on every start
+		pass
+	return document
+
+def _trim_discovery_document(document, resources):
+	def references(node, found):
+		if isinstance(node, dict):
+			for key, value in node.items():
+				if key == '$ref':
+					found.add(value)
+				else:
+					references(value, found)
+		elif isinstance(node, list):
+			for value in node:
+				references(value, found)
+		return found
+
+	document['resources'] = {name: resource for name, resource in document['resources'].items() if name in resources}
+	used = references(document['resources'], set())
+	pending = list(used)
+	while pending:
+		for schema in references(document['schemas'][pending.pop()], set()) - used:
+			used.add(schema)
+			pending.append(schema)
+	document['schemas'] = {name: schema for name, schema in document['schemas'].items() if name in used}
+	return document
+
+def build_compute_service(api_endpoint=None, credentials=None):
+	"""
+	This function will build the compute v1 service from the cached discovery document, see
+	load_discovery_document.
+	Args:
+		api_endpoint (str): [optional] The root url of the compute API, such as a fakeCompute.py server
+		credentials (Credentials): [optional] By default the application default credentials are used
+	Returns:
+		Resource: The compute service
+	"""
+
+	import googleapiclient.discovery
+	client_options = None if api_endpoint is None else {'api_endpoint': api_endpoint}
+	return googleapiclient.discovery.build_from_document(load_discovery_document(), credentials=credentials, client_options=client_options)
+
+def _matches(instance, status=None, name_pattern=None, labels=None):
+	# Checks an instance's json against the conditions of instance_filter, for the inventory snapshot
+	if status is not None and instance['status'] != status:
+		return False
+	if name_pattern is not None and not re.fullmatch(name_pattern, instance['name']):
+		return False
+	return all(instance.get('labels', {}).get(label) == value for label, value in (labels or {}).items())
+
+def _literal_prefix(pattern):
+	# The text every match of a regular expression starts with, such as 'restserver-' for 'restserver-\d+'
+	if '|' in pattern:
+		return ''
+	prefix = re.match(r'[\w\-]*', pattern).group(0)
+	# A quantifier right after the prefix applies to its last character
+	if len(pattern) > len(prefix) and pattern[len(prefix)] in '*?{':
+		prefix = prefix[:-1]
+	return prefix
+
+def _parse_timestamp(timestamp):
+	# The API returns RFC 3339 timestamps with an offset, such as 2018-03-08T14:47:28.187-08:00
+	return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def instance_filter(status=None, name_pattern=None, labels=None):
+	"""
+	This function will return the compute API filter expression used by query_instances.
+	Args:
+		status (str): [optional] The status the instances must have
+		name_pattern (str): [optional] A regular expression the whole instance name must match
+		labels (dict): [optional] Labels the instances must have, with these values
+	Example:
+	>>> instance_filter('RUNNING', '.*restserver.*')
+	'(status eq RUNNING)(name eq .*restserver.*)'
+	Returns:
+		str: The filter expression, or None if there are no conditions
+	"""
+
+	filter_by = ''
+	if status is not None:
+		filter_by += '(status eq ' + status + ')'
+	if name_pattern is not None:
+		filter_by += '(name eq ' + name_pattern + ')'
+	for label, value in (labels or {}).items():
+		filter_by += '(labels.' + label + ' eq ' + value + ')'
+	return filter_by or None
+
+def can_suspend(machine_type):
+	"""
+	This function will tell whether instances of a machine type can be suspended.
+	Args:
+		machine_type (str): The name of the machine type, or its url, as in an instance's 'machineType'
+	Returns:
+		bool: False for the types in UNSUSPENDABLE_MACHINE_TYPES
+	"""
+
+	return machine_type.rsplit('/', 1)[-1] not in UNSUSPENDABLE_MACHINE_TYPES
+
+def instance_config(name, zone, source_disk_image, startup_script, machine_type=MACHINE_TYPE):
+	"""
+	This function will return the config used to create a REST server, see create_instance_from_image.
+	Args:
+		name (str): The name of the new instance
+		zone (str): The name of the zone to create the instance in
+		source_disk_image (str): The selfLink of the image to boot from
+		startup_script (str): The contents of the startup script
+		machine_type (str): [optional] The name of the machine type
+	Returns:
+		dict: see the following link
+		https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#insert
+	"""
+
+	# Configure the machine
+	config = {
+		'name': name,
+		'machineType': 'zones/' + zone + '/machineTypes/' + machine_type,
+
+		'tags': {
+			'items': [
+				'http-server',
+				'https-server'
+			]
+		},
+
+		# Specify the boot disk and the image to use as a source
+		'disks': [
+			{
+				'boot': True,
+				'autoDelete': True,
+				'initializeParams': {
+					'sourceImage': source_disk_image,
+				},
+				'deviceName': name
+			}
+		],
+	
+		# Specify a network interface with NAT to acces the public internet
+		'networkInterfaces': [{
+			'network': 'global/networks/default',
+			'accessConfigs': [
+				{'type': 'ONE_TO_ONE_NAT', 'name': 'External NAT'}
+			]
+		}],
+
+		# Allow the instance to acces cloud storage and logging
+		'serviceAccounts': [{
+			'email': 'default',
+			'scopes': [
+				'https://www.googleapis.com/auth/devstorage.read_write',
+				'https://www.googleapis.com/auth/logging.write'
+			]
+		}],
+
+		# Metadata is readable from the instance and allows you to pass configuration
+		# from deployment scripts to instances
+		'metadata': {
+			'items': [{
+				# Startup script is automatically executed by the instance upon startup
+				'key': 'startup-script',
+				'value': startup_script
+			}]
+		}	
+	}
+	return config
+
+def error_reasons(error):
+	"""
+	This function will return the reasons an API call or an operation failed.
+	Args:
+		error (Exception): An HttpError, or the exception wait_for_operation raises for a failed operation
+	Returns:
+		list (str): ['quotaExceeded'], or ['ZONE_RESOURCE_POOL_EXHAUSTED'] ...
+	"""
+
+	from googleapiclient.errors import HttpError
+	if isinstance(error, HttpError):
+		try:
+			return [detail.get('reason') for detail in json.loads(error.content)['error']['errors']]
+		except (ValueError, KeyError, TypeError):
+			return []
+	if error.args and isinstance(error.args[0], dict):
+		return [detail.get('code') for detail in error.args[0].get('errors', [])]
+	return []
+
+def is_rate_limit_error(error):
+	from googleapiclient.errors import HttpError
+	return isinstance(error, HttpError) and (error.resp.status == 429 or any(reason in RATE_LIMIT_REASONS for reason in error_reasons(error)))
+
+def is_transient_error(error):
+	"""
+	This function will tell whether a failed call may succeed if it is sent again: a rate limit, a
+	server error, or a connection that failed or timed out. Anything else, such as a missing instance
+	or an exceeded quota, is permanent.
+	Args:
+		error (Exception): The exception the call raised
+	Returns:
+		bool: True if the call is worth retrying
+	"""
+
+	from googleapiclient.errors import HttpError
+	import httplib2
+	if isinstance(error, HttpError):
+		return error.resp.status in TRANSIENT_STATUSES or is_rate_limit_error(error)
+	return isinstance(error, (ConnectionError, TimeoutError, httplib2.HttpLib2Error))
+
+def is_capacity_error(error):
+	"""
+	This function will tell whether a call or operation failed because a zone or region has no room for
+	another instance, so it may succeed in a different zone.
+	Args:
+		error (Exception): An HttpError, or the exception wait_for_operation raises for a failed operation
+	Returns:
+		bool: True if the zone is out of quota or resources
+	"""
+
+	return any(reason in CAPACITY_REASONS for reason in error_reasons(error))
+
+def retry_delay(error, attempt):
+	"""
+	This function will return how long to wait before retrying a failed call, or None if it should not
+	be retried, because the error is permanent or the call was already retried RETRY_MAX_ATTEMPTS times.
+	The delay is chosen at random up to an exponentially growing cap (full jitter), so calls that failed
+	together are not retried together, and is at least the Retry-After the API asked for.
+	Args:
+		error (Exception): The exception the call raised
+		attempt (int): How many times the call was retried already
+	Returns:
+		float: Seconds to wait, or None
+	"""
+
+	if attempt >= RETRY_MAX_ATTEMPTS or not is_transient_error(error):
+		return None
+	delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** attempt))
+	retry_after = getattr(error, 'resp', {}).get('retry-after')
+	if retry_after is not None:
+		try:
+			delay = max(delay, float(retry_after))
+		except ValueError:
+			retry_at = email.utils.parsedate_to_datetime(retry_after)
+			delay = max(delay, retry_at.timestamp() - time.time())
+	return delay
+
+def _kind(request):
+	# The rate limit a request counts against. Waiting on an operation only reads it
+	return 'read' if request.method == 'GET' or request.methodId.endswith('.wait') else 'write'
+
+class Instance:
+	"""
+	The attributes of an instance the scripts use, without the rest of its json. Timestamps are the
+	API's RFC 3339 strings, None if the instance has none.
+	"""
+
+	__slots__ = ('name', 'zone', 'status', 'id', 'internal_ip', 'external_ip', 'labels',
+		'creation_timestamp', 'last_start_timestamp', 'last_stop_timestamp', 'last_suspended_timestamp')
+
+	def __init__(self, name, zone, status, id=None, internal_ip=None, external_ip=None, labels=None,
+		creation_timestamp=None, last_start_timestamp=None, last_stop_timestamp=None, last_suspended_timestamp=None):
+		self.name = name
+		self.zone = zone
+		self.status = status
+		self.id = id
+		self.internal_ip = internal_ip
+		self.external_ip = external_ip
+		self.labels = labels or {}
+		self.creation_timestamp = creation_timestamp
+		self.last_start_timestamp = last_start_timestamp
+		self.last_stop_timestamp = last_stop_timestamp
+		self.last_suspended_timestamp = last_suspended_timestamp
+
+	@classmethod
+	def from_json(cls, data):
+		"""
+		This function will build a record from an instance's json, as returned by the API.
+		Args:
+			data (json): The instance, with at least the attributes in INSTANCE_FIELDS
+		Returns:
+			Instance: The record
+		"""
+
+		interfaces = data.get('networkInterfaces') or [{}]
+		access_configs = interfaces[0].get('accessConfigs') or [{}]
+		return cls(data['name'], data['zone'].rsplit('/', 1)[-1], data['status'], data.get('id'),
+			interfaces[0].get('networkIP'), access_configs[0].get('natIP'), data.get('labels'),
+			data.get('creationTimestamp'), data.get('lastStartTimestamp'), data.get('lastStopTimestamp'),
+			data.get('lastSuspendedTimestamp'))
+
+	@property
+	def started(self):
+		# When the instance last started running, its creation if it was never restarted
+		return self.last_start_timestamp or self.creation_timestamp
+
+	def __repr__(self):
+		return 'Instance({!r}, {!r}, {!r})'.format(self.name, self.zone, self.status)
+
+class _CountingHttp:
+	# Wraps an http object to count the bytes of every response it receives, batches and retries included
+
+	def __init__(self, http):
+		self.http = http
+		self.received = 0
+
+	def request(self, *args, **kwargs):
+		response, content = self.http.request(*args, **kwargs)
+		self.received += len(content or b'')
+		return response, content
+
+	def __getattr__(self, name):
+		return getattr(self.http, name)
+
+class OperationTimeoutError(TimeoutError):
+	"""
+	Raised by wait_for_operation when an operation is not DONE by the caller's deadline.
+	The operation keeps running on GCP, 'operation' holds its last known state.
+	"""
+
+	def __init__(self, operation, timeout):
+		super().__init__('Operation {} was not done after {} seconds (status: {})'.format(
+			operation.get('name'), timeout, operation.get('status')))
+		self.operation = operation
 
 class GoogleCloudClient:	
 	
-	def __init__(self, project):
+	def __init__(self, project, cache_ttl=None, api_endpoint=None, credentials=None, profiler=None, rate_limiter=None, inventory=None, http_pool=None):
 		""" 
-		The constructor will initialize the compute attribute, establishing a connection to the GCP API, and
-		set the project name.
+		The constructor will set the project name. The compute attribute, the connection to the GCP API,
+		is built the first time it is used.
 		Args:
 			project (str): The project name
+			cache_ttl (float): [optional] How many seconds an inventory snapshot may be reused for.
+			The default, None, disables the snapshot and every query lists the project.
+			api_endpoint (str): [optional] The root url of the compute API, by default the real one.
+			For example 'http://127.0.0.1:8080/compute/v1/' for a fakeCompute.py server
+			credentials (Credentials): [optional] By default the application default credentials are used
+			profiler (Profiler): [optional] Where API calls are recorded, by default a new Profiler
+			rate_limiter (RateLimiter): [optional] The read and write budget, share one between clients of
+			the same project. By default a new RateLimiter with the default rates
+			inventory (InventoryStore): [optional] A local store that answers inventory queries instead of
+			the API, kept in sync by sync_inventory. It is synced before a query if this client has not
+			synced it within cache_ttl seconds
+			http_pool (HttpPool): [optional] The connections requests are sent over, by default a pool of
+			HTTP_POOL_SIZE connections made the first time it is used, with the compute service's credentials
 		"""
 
 		self.project = project
-		self.compute = googleapiclient.discovery.build('compute', 'v1')
-	
+		self.profiler = profiler or Profiler()
+		self.rate_limiter = rate_limiter or RateLimiter()
+		self.api_endpoint = api_endpoint
+		self.credentials = credentials
+		self._compute = None
+		self.cache_ttl = cache_ttl
+		self._snapshot = None
+		self._snapshot_time = 0
+		self.inventory = inventory
+		self._inventory_time = None
+		self._snapshot_lock = threading.Lock()
+		self._http_pool = http_pool
+		self._pool_lock = threading.Lock()
+		self._zones = None
+		self._region_quotas = None
+		self._placed = {}
+		self._templates = {}
+		self._template_lock = threading.Lock()
+		self._reserved_names = set()
+		self._names_lock = threading.Lock()
+
+	@property
+	def compute(self):
+		if self._compute is None:
+			self._compute = build_compute_service(self.api_endpoint, self.credentials)
+		return self._compute
+
+	def for_project(self, project, cache_ttl=None, rate_limiter=None, inventory=None):
+		"""
+		This function will return a client for another project that shares this client's compute service,
+		credentials, profiler and HttpPool, so the discovery document is only built once and the clients
+		reuse each other's connections, at most the pool's size at once besides the operation waits. The rate limits, snapshot and
+		inventory are per project, so the new client has its own.
+		Args:
+			project (str): The project name
+			cache_ttl (float): [optional] see the constructor, by default this client's
+			rate_limiter (RateLimiter): [optional] see the constructor
+			inventory (InventoryStore): [optional] see the constructor, one store can hold many projects
+		Returns:
+			GoogleCloudClient: The client for the project
+		"""
+
+		client = GoogleCloudClient(project, cache_ttl=self.cache_ttl if cache_ttl is None else cache_ttl, api_endpoint=self.api_endpoint,
+			credentials=self.credentials, profiler=self.profiler, rate_limiter=rate_limiter, inventory=inventory, http_pool=self.http_pool)
+		client._compute = self.compute
+		return client
+
+	@property
+	def http_pool(self):
+		with self._pool_lock:
+			if self._http_pool is None:
+				self._http_pool = HttpPool(getattr(self.compute._http, 'credentials', None))
+			return self._http_pool
+
+	def _execute(self, request, batched=None, long_poll=False):
+		"""
+		This function will execute a request built from the compute attribute. The http connection
+		of the compute service is not thread safe, so each attempt borrows a connection from the
+		http_pool instead, which makes it safe to call from any thread. The call first waits for the
+		rate limiter, and is retried if it fails with a transient error, see retry_delay. Every attempt is recorded by the
+		profiler, under its API method, such as 'compute.instances.list', or 'batch'.
+		Args:
+			request (HttpRequest): The request to send
+			batched (list): [optional] If request is a batch, the requests in it, which are what the
+			rate limits count
+			long_poll (bool): [optional] The request may be held open for minutes, such as
+			zoneOperations().wait, its connection is not counted against the pool's size, see HttpPool.acquire
+		Returns:
+			dict: The response body
+		"""
+
+		method = getattr(request, 'methodId', 'batch')
+		kinds = [_kind(each) for each in (batched if batched is not None else [request])]
+		attempt = 0
+		while True:
+			self.rate_limiter.acquire(kinds.count('read'), kinds.count('write'))
+			pooled = self.http_pool.acquire(long_poll)
+			http = _CountingHttp(pooled)
+			start = time.perf_counter()
+			error = None
+			try:
+				response = request.execute(http=http)
+			except Exception as caught:
+				error = caught
+			finally:
+				# The connection is given back before any backoff, so other threads can use it meanwhile
+				self.http_pool.release(pooled, long_poll)
+			self.profiler.record_call(method, time.perf_counter() - start, http.received, error=error is not None)
+			if error is None:
+				return response
+			delay = retry_delay(error, attempt)
+			if delay is None:
+				raise error
+			if is_rate_limit_error(error):
+				for kind in set(kinds):
+					self.rate_limiter.penalize(kind, delay)
+			self.profiler.record_retry(method)
+			time.sleep(delay)
+			attempt += 1
+
 	def get_zone_names_list(self):
 		""" 
 		This function will return a list of the names of all zones.
 		Returns: list (str): ['asia-east1-c', 'us-central1-c', ... ]
 		"""
 
-		return [zone['description'] for zone in self.compute.zones().list(project=self.project).execute()['items']] 
+		return [zone['description'] for zone in self._execute(self.compute.zones().list(project=self.project))['items']] 
+
+	def get_zones(self):
+		"""
+		This function will return the name, region and status of every zone. The zones are read once
+		and kept until reset_placement.
+		Returns:
+			list (json): [{'name': 'us-central1-c', 'region': '.../regions/us-central1', 'status': 'UP'}, ... ]
+		"""
+
+		if self._zones is None:
+			zones = []
+			request = self.compute.zones().list(project=self.project, fields='nextPageToken,items(name,region,status)')
+			while request is not None:
+				response = self._execute(request)
+				zones.extend(response.get('items', []))
+				request = self.compute.zones().list_next(previous_request=request, previous_response=response)
+			self._zones = zones
+		return self._zones
+
+	def get_region_quotas(self):
+		"""
+		This function will return the quotas of every region. The quotas are read once, with a single
+		call, and kept until reset_placement.
+		Returns:
+			dict: {'us-central1': {'INSTANCES': {'limit': 24.0, 'usage': 3.0}, ... }, ... }
+		"""
+
+		if self._region_quotas is None:
+			regions = []
+			request = self.compute.regions().list(project=self.project, fields='nextPageToken,items(name,quotas)')
+			while request is not None:
+				response = self._execute(request)
+				regions.extend(response.get('items', []))
+				request = self.compute.regions().list_next(previous_request=request, previous_response=response)
+			self._region_quotas = {region['name']: {quota['metric']: quota for quota in region.get('quotas', [])} for region in regions}
+		return self._region_quotas
+
+	def plan_placement(self, count, preferred_zone, exclude=()):
+		"""
+		This function will choose a zone for each of count new REST servers, before any is created.
+		A zone is eligible if it is UP and its region has quota left for another server, see
+		INSTANCE_QUOTA_COST. The preferred zone's region is filled first, then the other regions. Within
+		them, each server goes to the eligible zone with the fewest running REST servers, counting the
+		ones already planned, so new servers are spread out. Quotas and zones are read once, and servers
+		planned by earlier calls are taken off the quota, until reset_placement. Give back the servers
+		whose insert failed with release_placement.
+		Args:
+			count (int): How many servers to place
+			preferred_zone (str): The zone to use when zones are otherwise equal, its region is used first
+			exclude (list): [optional] Zones not to use, such as zones where an insert just failed
+		Example:
+		>>> c.plan_placement(3, 'us-central1-c')
+		['us-central1-c', 'us-central1-a', 'us-central1-b']
+		Returns:
+			list (str): A zone for each server. It is shorter than count if the quotas cannot fit them all
+		"""
+
+		quotas = self.get_region_quotas()
+		regions = {zone['name']: zone['region'].rsplit('/', 1)[-1] for zone in self.get_zones() if zone['status'] == 'UP' and zone['name'] not in exclude}
+		preferred_region = regions.get(preferred_zone)
+
+		def headroom(region):
+			# How many more servers fit in the region, unlimited if it reports none of the quotas we use
+			room = float('inf')
+			for metric, cost in INSTANCE_QUOTA_COST.items():
+				if metric in quotas.get(region, {}):
+					quota = quotas[region][metric]
+					fits = int((quota['limit'] - quota['usage']) // cost) - self._placed.get(region, 0)
+					room = min(room, fits)
+			return room
+
+		room = {region: headroom(region) for region in set(regions.values())}
+		load = {zone: 0 for zone in regions}
+		for instance in self.get_rest_servers('RUNNING'):
+			zone = instance['zone'].rsplit('/', 1)[-1]
+			if zone in load:
+				load[zone] += 1
+		plan = []
+		for i in range(count):
+			eligible = [zone for zone in regions if room[regions[zone]] > 0]
+			if len(eligible) == 0:
+				break
+			zone = min(eligible, key=lambda zone: (regions[zone] != preferred_region, load[zone], zone != preferred_zone, zone))
+			plan.append(zone)
+			load[zone] += 1
+			room[regions[zone]] -= 1
+			self._placed[regions[zone]] = self._placed.get(regions[zone], 0) + 1
+		return plan
+
+	def release_placement(self, zones):
+		"""
+		This function will give back the quota plan_placement took for servers that were not created.
+		Args:
+			zones (list): The planned zone of each server whose insert failed
+		"""
+
+		regions = {zone['name']: zone['region'].rsplit('/', 1)[-1] for zone in self.get_zones()}
+		for zone in zones:
+			region = regions.get(zone)
+			if self._placed.get(region, 0) > 0:
+				self._placed[region] -= 1
+
+	def reset_placement(self):
+		"""
+		This function will drop the zones, quotas and planned servers plan_placement keeps, so the next
+		plan reads the quotas' usage again. Call it at the start of each scaling, a long-lived client
+		would otherwise plan against the usage of its first call.
+		"""
+
+		self._zones = None
+		self._region_quotas = None
+		self._placed = {}
 
 	def get_instances_in_zone(self, zone):
 		""" 
 		This function will return a list of json data for all instances in a specific zone.
+		Only the attributes in INSTANCE_FIELDS are requested.
 		Args:
 			zone (str): The name of the zone to search for instances in
 		Example:
@@ -46,11 +742,27 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
 		"""
 		
-		try:
-			instances = self.compute.instances().list(project=self.project, zone=zone).execute()['items']
-		except KeyError:
-			instances = []
-		return instances
+		return list(self._list_pages(zone))
+
+	def _list_pages(self, zone=None, filter_by=None):
+		# Yields the json of each listed instance, fetching the next page only once this one is used up.
+		# Without a zone the whole project is listed with one paginated aggregatedList
+		fields = 'nextPageToken,items(' + INSTANCE_FIELDS + ')' if zone else 'nextPageToken,items/*/instances(' + INSTANCE_FIELDS + ')'
+		instances = self.compute.instances()
+		if zone is None:
+			request = instances.aggregatedList(project=self.project, filter=filter_by, fields=fields)
+		else:
+			request = instances.list(project=self.project, zone=zone, filter=filter_by, fields=fields)
+		while request is not None:
+			response = self._execute(request)
+			if zone is None:
+				# items maps 'zones/<zone>' to a scoped list, which only has 'instances' if the zone has any
+				for scoped_list in response.get('items', {}).values():
+					yield from scoped_list.get('instances', [])
+				request = instances.aggregatedList_next(previous_request=request, previous_response=response)
+			else:
+				yield from response.get('items', [])
+				request = instances.list_next(previous_request=request, previous_response=response)
 
 	def get_instance_data(self, zone, instance):
 		"""
@@ -65,20 +777,242 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#get
 		"""
 
-		return self.compute.instances().get(project=self.project, zone=zone, instance=instance).execute()
+		return self._execute(self.compute.instances().get(project=self.project, zone=zone, instance=instance))
 
-	def get_all_instances(self):
+	def get_instances_data(self, instances):
+		"""
+		This function will return all data associated with many instances, fetched in batched requests.
+		Args:
+			instances (list): (zone, name) tuples of the instances
+		Example:
+		>>> c.get_instances_data([('us-central1-c', 'lab03-controller'), ('us-central1-c', 'loadbalancer-0')])
+		Returns:
+			list (json): The data of each instance, in the order they were given, see get_instance_data
+		"""
+
+		requests = [self.compute.instances().get(project=self.project, zone=zone, instance=instance) for zone, instance in instances]
+		return self._raise_batch_errors(self.execute_batch(requests))
+
+	def get_all_instances(self, aggregated=True):
 		"""
 		This function will return a list data about all instances in the project.
+		By default the whole project is read with instances().aggregatedList, following nextPageToken
+		until every page has been fetched. Pass aggregated=False to fall back to one instances().list
+		per zone. If the client was built with a cache_ttl, a fresh snapshot is returned without
+		calling the API. Only the attributes in INSTANCE_FIELDS are requested.
+		Args:
+			aggregated (bool): Use the aggregatedList call (default), or list zone by zone
+		Returns:
+			list (json): see the following link
+			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
+		"""
+
+		if self.inventory is not None:
+			self._sync_inventory_if_stale()
+			return self.inventory.query(self.project)
+		if self._snapshot_is_fresh():
+			return list(self._snapshot)
+		if not aggregated:
+			instances = self.get_all_instances_by_zone()
+		else:
+			instances = self.list_instances()
+		if self.cache_ttl is not None:
+			self._snapshot = instances
+			self._snapshot_time = time.monotonic()
+			return list(instances)
+		return instances
+
+	def list_instances(self, filter_by=None):
+		"""
+		This function will return a list of data about the instances in the project that match a filter,
+		using a single paginated instances().aggregatedList call. It always calls the API, see
+		query_instances for the version that uses the inventory snapshot.
+		Args:
+			filter_by (str): [optional] A compute API filter expression
+		Example:
+		>>> c.list_instances('(status eq RUNNING)(name eq .*restserver.*)')
+		Returns:
+			list (json): see the following link
+			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#aggregatedList
+		"""
+
+		return list(self._list_pages(filter_by=filter_by))
+
+	def iter_instances(self, status=None, name_pattern=None, labels=None):
+		"""
+		This function will yield the instances that match every given condition, as Instance records,
+		one page at a time: the next page is only fetched once the caller has used up the last one, so
+		memory stays the same however large the project is, and a caller that stops early saves the
+		remaining calls. The conditions are sent to the API as a filter expression. When the client
+		keeps an inventory snapshot, they are checked against the snapshot instead, like query_instances.
+		Args:
+			status (str): [optional] The status the instances must have
+			name_pattern (str): [optional] A regular expression the whole instance name must match
+			labels (dict): [optional] Labels the instances must have, with these values
+		Example:
+		>>> [instance.internal_ip for instance in c.iter_instances('RUNNING', '.*restserver.*')]
+		['10.128.0.5', '10.128.0.6']
+		Returns:
+			generator (Instance): The matching instances
+		"""
+
+		if self.inventory is not None:
+			instances = self._query_inventory(status, name_pattern, labels)
+		elif self.cache_ttl is None:
+			instances = self._list_pages(filter_by=instance_filter(status, name_pattern, labels))
+		else:
+			instances = (instance for instance in self.get_all_instances() if _matches(instance, status, name_pattern, labels))
+		for instance in instances:
+			yield Instance.from_json(instance)
+
+	def query_instances(self, status=None, name_pattern=None, labels=None):
+		"""
+		This function will return a list of data about the instances that match every given condition.
+		The conditions are sent to the API as a filter expression. When the client keeps an inventory
+		snapshot, the same conditions are checked against the snapshot instead.
+		Args:
+			status (str): [optional] The status the instances must have
+			name_pattern (str): [optional] A regular expression the whole instance name must match
+			labels (dict): [optional] Labels the instances must have, with these values
+		Example:
+		>>> c.query_instances('RUNNING', '.*restserver.*', {'persistent': 'true'})
+		Returns:
+			list (json): see the following link
+			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
+		"""
+
+		if self.inventory is not None:
+			return list(self._query_inventory(status, name_pattern, labels))
+		if self.cache_ttl is None:
+			return self.list_instances(instance_filter(status, name_pattern, labels))
+		return [instance for instance in self.get_all_instances() if _matches(instance, status, name_pattern, labels)]
+
+	def _query_inventory(self, status, name_pattern, labels):
+		# The store's indexes narrow the search by status, labels and the name's literal prefix, the
+		# pattern itself is checked here
+		self._sync_inventory_if_stale()
+		prefix = None if name_pattern is None else _literal_prefix(name_pattern)
+		for instance in self.inventory.iter_query(self.project, status=status, name_prefix=prefix, labels=labels):
+			if name_pattern is None or re.fullmatch(name_pattern, instance['name']):
+				yield instance
+
+	def _sync_inventory_if_stale(self):
+		if self._inventory_time is None or self.cache_ttl is None or time.monotonic() - self._inventory_time >= self.cache_ttl:
+			self.sync_inventory()
+
+	def sync_inventory(self, full=False):
+		"""
+		This function will bring the inventory store up to date. If the project was synced recently, it
+		lists the operations since the last sync with globalOperations().aggregatedList, and fetches, in
+		batches, only the instances they touched. Instances that no longer
+		exist are removed. Otherwise, or if full is True, it lists the whole project.
+		Args:
+			full (bool): [optional] List the whole project even if the store is recent
+		Returns:
+			int: How many instances were fetched
+		"""
+
+		from googleapiclient.errors import HttpError
+		now = time.time()
+		marker, full_sync = self.inventory.last_sync(self.project)
+		if full or marker is None or now - marker > INVENTORY_MAX_AGE or now - full_sync > INVENTORY_FULL_SYNC_INTERVAL:
+			instances = self.list_instances()
+			self.inventory.replace_all(self.project, instances, now - INVENTORY_SYNC_OVERLAP)
+			self._inventory_time = time.monotonic()
+			return len(instances)
+		touched = set()
+		operations = self.compute.globalOperations()
+		# Only the operations that started or ended since the last sync are listed. The API cannot mix a
+		# comparison with the eq filters, so operations on other resources are skipped here
+		watermark = datetime.fromtimestamp(marker, timezone.utc).isoformat(timespec='milliseconds')
+		request = operations.aggregatedList(project=self.project, filter='(insertTime >= "{0}") OR (endTime >= "{0}")'.format(watermark),
+			fields='nextPageToken,items/*/operations(targetLink,insertTime,endTime)')
+		while request is not None:
+			response = self._execute(request)
+			for scoped_list in response.get('items', {}).values():
+				for operation in scoped_list.get('operations', []):
+					if '/instances/' not in operation.get('targetLink', ''):
+						continue
+					times = [_parse_timestamp(operation[key]).timestamp() for key in ('insertTime', 'endTime') if key in operation]
+					if max(times, default=now) >= marker:
+						# targetLink is .../projects/<project>/zones/<zone>/instances/<name>
+						_, zone, _, name = operation['targetLink'].rsplit('/', 4)[-4:]
+						touched.add((zone, name))
+			request = operations.aggregatedList_next(previous_request=request, previous_response=response)
+		touched = sorted(touched)
+		responses = self.execute_batch([self.compute.instances().get(project=self.project, zone=zone, instance=name, fields=INSTANCE_FIELDS) for zone, name in touched])
+		changed = []
+		deleted = []
+		for instance, response in zip(touched, responses):
+			if isinstance(response, HttpError) and response.resp.status == 404:
+				deleted.append(instance)
+			elif isinstance(response, Exception):
+				raise response
+			else:
+				changed.append(response)
+		self.inventory.apply_changes(self.project, changed, deleted, now - INVENTORY_SYNC_OVERLAP)
+		self._inventory_time = time.monotonic()
+		return len(touched)
+
+	def get_all_instances_by_zone(self):
+		"""
+		This function will return a list data about all instances in the project, listing the zones at the
+		same time, BULK_MAX_WORKERS at once. It costs one call per zone, see get_all_instances for the single call version.
 		Returns:
 			list (json): see the following link
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
 		"""
 
-		instances_in_all_zones = [self.get_instances_in_zone(zone) for zone in self.get_zone_names_list()]
-		flattened_instances = [instance for instance_list in instances_in_all_zones for instance in instance_list if len(instance) != 0]
-		return flattened_instances
+		zones = self.get_zone_names_list()
+		with ThreadPoolExecutor(max_workers=max(1, min(BULK_MAX_WORKERS, len(zones)))) as executor:
+			return [instance for instances in executor.map(self.get_instances_in_zone, zones) for instance in instances if len(instance) != 0]
  
+	def invalidate_cache(self):
+		"""
+		This function will drop the inventory snapshot, so the next query lists the project again.
+		"""
+
+		self._snapshot = None
+		self._inventory_time = None
+
+	def _snapshot_is_fresh(self):
+		return self._snapshot is not None and time.monotonic() - self._snapshot_time < self.cache_ttl
+
+	def _update_snapshot(self, operation):
+		"""
+		This function will patch the inventory snapshot, and the inventory store, with the outcome of a
+		finished operation. Start, stop, suspend and resume only change the instance status. A new
+		instance is fetched and added, anything else drops the snapshot, and has the store synced
+		before the next query.
+		Args:
+			operation (json): A DONE operation without errors
+		"""
+
+		if self._snapshot is None and self.inventory is None:
+			return
+		operation_type = operation.get('operationType')
+		zone = operation['zone'].rsplit('/', 1)[-1]
+		name = operation.get('targetLink', '').rsplit('/', 1)[-1]
+		created = self.get_instance_data(zone, name) if operation_type == 'insert' else None
+		if self.inventory is not None:
+			if created is not None:
+				self.inventory.apply_changes(self.project, [created], [])
+			elif operation_type not in OPERATION_RESULT_STATUS or not self.inventory.set_status(self.project, zone, name, OPERATION_RESULT_STATUS[operation_type]):
+				self._inventory_time = None
+		with self._snapshot_lock:
+			if self._snapshot is None:
+				return
+			if created is not None:
+				self._snapshot.append(created)
+				return
+			if operation_type in OPERATION_RESULT_STATUS:
+				for i, instance in enumerate(self._snapshot):
+					if instance['name'] == name and instance['zone'].rsplit('/', 1)[-1] == zone:
+						# Replace rather than modify, lists handed out earlier keep what they were given
+						self._snapshot[i] = dict(instance, status=OPERATION_RESULT_STATUS[operation_type])
+						return
+			self._snapshot = None
+
 	def get_instances(self, status):
 		"""
 		This function will return a list of instances with a specific status.
@@ -92,7 +1026,7 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
 		"""
 
-		return [instance for instance in self.get_all_instances() if instance['status'] == status]
+		return self.query_instances(status=status)
 
 	def get_instance_name_list(self):
 		"""
@@ -101,7 +1035,7 @@ class GoogleCloudClient:
 			list (str): ['lab03-controller', 'loadbalancer-0', 'restserver-0', ... ]
 		"""
 
-		return [instance['name'] for instance in self.get_all_instances()]
+		return [instance.name for instance in self.iter_instances()]
 
 	def get_rest_servers(self, status):
 		"""
@@ -114,7 +1048,7 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
 		"""
 
-		return [instance for instance in self.get_instances(status) if 'restserver' in instance['name']]
+		return self.query_instances(status=status, name_pattern=REST_SERVER_PATTERN)
 	
 	def get_running_rest_servers_without_label(self, label, value):
 		"""
@@ -130,6 +1064,8 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
 		"""
 
+		# The API cannot express "label missing, or set to another value" in one filter, so only the
+		# status and name are filtered on the server
 		running = self.get_rest_servers('RUNNING')
 		servers = []
 		for i in running:
@@ -142,7 +1078,7 @@ class GoogleCloudClient:
 	def get_oldest_running_rest_server(self):
 		"""
 		This function will return a json object containing data about the oldest running rest server in 
-		the project.
+		the project. See get_oldest_running_rest_servers to rank many servers at once.
 		Returns:
 			list (json): see the following link
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.zoneOperations.html#list
@@ -150,7 +1086,7 @@ class GoogleCloudClient:
 
 		running = self.get_rest_servers('RUNNING')
 		running_names = [instance['name'] for instance in running]
-		running_start_times = [self.get_instance_operations(instance, 'start') for instance in running]
+		running_start_times = self.get_instances_operations(running, 'start')
 		# Since we may have newly created instances running (that do not have a start operation yet)
 		# Make a list containing the oldest start operation for each instance that has one
 		oldest_start_operations = [instance['items'][-1] for instance in running_start_times if 'items' in instance]
@@ -158,7 +1094,7 @@ class GoogleCloudClient:
 		# Make a list containing instances that do not have a start operation
 		no_start_operations = [instance for instance in running if instance['name'] not in running_names_with_start_operation]
 		# Now get the insert operations for those instances
-		insert_times = [self.get_instance_operations(instance, 'insert') for instance in no_start_operations]
+		insert_times = self.get_instances_operations(no_start_operations, 'insert')
 		# Now add insert operations for the newly created instances to the oldest start operation list
 		for instance in insert_times:
 			oldest_start_operations.append(instance['items'][0])
@@ -169,6 +1105,36 @@ class GoogleCloudClient:
 				oldest = instance
 		return oldest
 		
+	def get_oldest_running_rest_servers(self, k):
+		"""
+		This function will return the k rest servers that have been running the longest, oldest first.
+		Servers are ranked by the lastStartTimestamp of the instance, or its creationTimestamp if it was
+		never restarted. Operations are only fetched, in one batch, for servers that have neither.
+		Args:
+			k (int): How many servers to return
+		Example:
+		>>> [instance['name'] for instance in c.get_oldest_running_rest_servers(2)]
+		['restserver-3', 'restserver-0']
+		Returns:
+			list (json): see the following link
+			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#list
+		"""
+
+		running = self.get_rest_servers('RUNNING')
+		started = [Instance.from_json(instance).started for instance in running]
+		unknown = [i for i, timestamp in enumerate(started) if timestamp is None]
+		for operation_type in ('start', 'insert'):
+			if len(unknown) == 0:
+				break
+			operations = self.get_instances_operations([running[i] for i in unknown], operation_type)
+			for i, response in zip(unknown, operations):
+				if 'items' in response:
+					started[i] = max(operation['startTime'] for operation in response['items'])
+			unknown = [i for i in unknown if started[i] is None]
+		# Servers we know nothing about are treated as the newest, so they are picked last
+		ranked = sorted(range(len(running)), key=lambda i: (0, _parse_timestamp(started[i])) if started[i] else (1, i))
+		return [running[i] for i in ranked[:k]]
+
 	def get_all_running_rest_server_internal_ips(self):
 		"""
 		This function will return a list of internal ip addresses for all running rest servers in the project.
@@ -176,7 +1142,7 @@ class GoogleCloudClient:
 			list (str): ['10.128.0.5']
 		"""
 
-		return [instance['networkInterfaces'][0]['networkIP'] for instance in self.get_instances('RUNNING') if 'restserver' in instance['name']]
+		return [instance.internal_ip for instance in self.iter_instances('RUNNING', REST_SERVER_PATTERN)]
 
 	def get_external_ip(self, zone, instance):
 		"""
@@ -191,8 +1157,18 @@ class GoogleCloudClient:
 		'35.193.133.78'
 		"""
 
-		data = self.get_instance_data(zone, instance)
-		return data['networkInterfaces'][0]['accessConfigs'][0]['natIP']
+		return Instance.from_json(self.get_instance_data(zone, instance)).external_ip
+
+	def get_external_ips(self, instances):
+		"""
+		This function will return the external ip addresses of many instances, fetched in batched requests.
+		Args:
+			instances (list): (zone, name) tuples of the instances
+		Returns:
+			list (str): The external ip address of each instance, in the order they were given
+		"""
+
+		return [Instance.from_json(data).external_ip for data in self.get_instances_data(instances)]
 
 	def get_count_of_servers_with_name(self, server_name):
 		"""
@@ -206,7 +1182,7 @@ class GoogleCloudClient:
 		5
 		"""
 
-		return [name.count(server_name) for name in self.get_instance_name_list()].count(1)
+		return sum(1 for instance in self.iter_instances(name_pattern='.*' + re.escape(server_name) + '.*') if instance.name.count(server_name) == 1)
 
 	def get_operations_in_zone(self, zone):
 		"""
@@ -220,7 +1196,7 @@ class GoogleCloudClient:
 		https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.zoneOperations.html#list
 		"""
 
-		return self.compute.zoneOperations().list(project=self.project, zone=zone).execute()
+		return self._execute(self.compute.zoneOperations().list(project=self.project, zone=zone))
 
 	def get_instance_operations(self, instance_json, operation_type):
 		"""
@@ -236,10 +1212,79 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.zoneOperations.html#list
 		"""
 
+		return self._execute(self._instance_operations_request(instance_json, operation_type))
+
+	def get_instances_operations(self, instance_jsons, operation_type):
+		"""
+		This function will return operation data of one operation type for many instances, fetched in
+		batched requests.
+		Args:
+			instance_jsons (list) (json): Information about the instances, see get_instance_operations
+			operation_type (str): The operation type
+		Returns:
+			list (dict): Details about the operations of each instance, in the order they were given
+		"""
+
+		requests = [self._instance_operations_request(instance_json, operation_type) for instance_json in instance_jsons]
+		return self._raise_batch_errors(self.execute_batch(requests))
+
+	def _instance_operations_request(self, instance_json, operation_type):
 		zone = instance_json['zone'].rsplit('/', 1)[-1]
 		instance_id = instance_json['id']
 		filter_by = '(targetId eq '+instance_id+')(operationType eq '+operation_type+')'
-		return self.compute.zoneOperations().list(project=self.project, zone=zone, filter=filter_by).execute()
+		return self.compute.zoneOperations().list(project=self.project, zone=zone, filter=filter_by, fields=OPERATION_FIELDS)
+
+	def execute_batch(self, requests):
+		"""
+		This function will send many requests as multipart batch requests, at most BATCH_MAX_SIZE
+		requests per batch. Requests in a batch that fail with a transient error are sent again in a
+		later batch, see retry_delay.
+		Args:
+			requests (list): Requests built from the compute attribute, but not executed
+		Example:
+		>>> c.execute_batch([c.compute.instances().get(project='project', zone='us-central1-c', instance='restserver-0')])
+		Returns:
+			list: The response of each request, in the order they were given. A request that failed is
+			represented by its exception (usually HttpError)
+		"""
+
+		responses = [None] * len(requests)
+
+		def callback(request_id, response, exception):
+			responses[int(request_id)] = response if exception is None else exception
+			# The latency and bytes of batched calls are recorded under 'batch'
+			self.profiler.record_call(requests[int(request_id)].methodId, error=exception is not None)
+
+		for first in range(0, len(requests), BATCH_MAX_SIZE):
+			pending = list(range(first, min(first + BATCH_MAX_SIZE, len(requests))))
+			attempt = 0
+			while len(pending) > 0:
+				batch = self._new_batch_http_request(callback)
+				for i in pending:
+					batch.add(requests[i], request_id=str(i))
+				self._execute(batch, [requests[i] for i in pending])
+				delays = {i: retry_delay(responses[i], attempt) for i in pending if isinstance(responses[i], Exception)}
+				pending = [i for i, delay in delays.items() if delay is not None]
+				if len(pending) > 0:
+					for i in pending:
+						self.profiler.record_retry(requests[i].methodId)
+					time.sleep(max(delays[i] for i in pending))
+					attempt += 1
+		return responses
+
+	def _new_batch_http_request(self, callback):
+		if self.api_endpoint is None:
+			return self.compute.new_batch_http_request(callback=callback)
+		# The service only moves its regular endpoint, batches would still go to googleapis.com
+		from googleapiclient.http import BatchHttpRequest
+		from urllib.parse import urljoin
+		return BatchHttpRequest(callback=callback, batch_uri=urljoin(self.api_endpoint, '/batch/compute/v1'))
+
+	def _raise_batch_errors(self, responses):
+		for response in responses:
+			if isinstance(response, Exception):
+				raise response
+		return responses
 
 	def get_operation_result(self, operation):
 		"""
@@ -252,13 +1297,19 @@ class GoogleCloudClient:
 		"""
 
 		zone = operation['zone'].rsplit('/',1)[-1]
-		return self.compute.zoneOperations().get(project=self.project, zone=zone, operation=operation['name']).execute()
+		return self._execute(self.compute.zoneOperations().get(project=self.project, zone=zone, operation=operation['name']))
 
-	def wait_for_operation(self, operation):
+	def wait_for_operation(self, operation, timeout=None, long_poll=True):
 		"""
 		This function will wait for a provided operation to finish, and report any errors if they occur.
+		It long-polls zoneOperations().wait, which returns as soon as GCE reports the operation DONE. If the
+		wait call is unavailable, or the deadline is closer than the server's wait window, it polls
+		zoneOperations().get with a growing delay instead.
 		Args:
 			operation (json): Data about the current operation
+			timeout (float): [optional] Seconds to wait before raising OperationTimeoutError, by default
+			there is no deadline
+			long_poll (bool): [optional] Set to False to always poll zoneOperations().get
 		Example:
 			* see scale.py
 		Returns:
@@ -266,13 +1317,35 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.zoneOperations.html#get
 		"""
 
-		while True:
+		with self.profiler.phase('wait_for_operation'):
+			result = self._wait(operation, timeout, long_poll)
+		if 'error' in result:
+			self.invalidate_cache()
+			raise Exception(result['error'])
+		self._update_snapshot(result)
+		return result
+
+	def _wait(self, operation, timeout, long_poll):
+		from googleapiclient.errors import HttpError
+		deadline = None if timeout is None else time.monotonic() + timeout
+		zone = operation['zone'].rsplit('/', 1)[-1]
+		result = operation
+		delay = POLL_INITIAL_DELAY
+		while result['status'] != 'DONE':
+			remaining = None if deadline is None else deadline - time.monotonic()
+			if remaining is not None and remaining <= 0:
+				raise OperationTimeoutError(result, timeout)
+			if long_poll and (remaining is None or remaining >= OPERATION_WAIT_WINDOW):
+				try:
+					result = self._execute(self.compute.zoneOperations().wait(project=self.project, zone=zone, operation=operation['name']), long_poll=True)
+					continue
+				except HttpError:
+					long_poll = False
+			if result is not operation:
+				time.sleep(delay if remaining is None else min(delay, remaining))
+				delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
 			result = self.get_operation_result(operation)
-			if result['status'] == 'DONE':
-				if 'error' in result:
-					raise Exception(result['error'])
-				return result
-			time.sleep(1)
+		return result
 
 	def start_instance(self, name, zone):
 		"""
@@ -284,7 +1357,7 @@ class GoogleCloudClient:
 			dict: Details about the operation
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#start
 		"""
-		return self.compute.instances().start(project=self.project, zone=zone, instance=name).execute()
+		return self._execute(self.compute.instances().start(project=self.project, zone=zone, instance=name, requestId=str(uuid.uuid4())))
 
 	def stop_instance(self, name, zone):
 		"""
@@ -297,9 +1370,36 @@ class GoogleCloudClient:
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#start
 		"""
 
-		return self.compute.instances().stop(project=self.project, zone=zone, instance=name).execute()
+		return self._execute(self.compute.instances().stop(project=self.project, zone=zone, instance=name, requestId=str(uuid.uuid4())))
 
-	def create_instance_from_image(self, my_image, zone):
+	def suspend_instance(self, name, zone):
+		"""
+		This function will suspend an instance. Its memory is kept, so once resumed it carries on where
+		it was, without booting or running its startup script again.
+		Args:
+			name (str): The name of the instance to suspend
+			zone (str): The zone it is located in
+		Returns:
+			dict: Details about the operation
+			https://cloud.google.com/compute/docs/reference/rest/v1/instances/suspend
+		"""
+
+		return self._execute(self.compute.instances().suspend(project=self.project, zone=zone, instance=name, requestId=str(uuid.uuid4())))
+
+	def resume_instance(self, name, zone):
+		"""
+		This function will resume a suspended instance.
+		Args:
+			name (str): The name of the instance to resume
+			zone (str): The zone it is located in
+		Returns:
+			dict: Details about the operation
+			https://cloud.google.com/compute/docs/reference/rest/v1/instances/resume
+		"""
+
+		return self._execute(self.compute.instances().resume(project=self.project, zone=zone, instance=name, requestId=str(uuid.uuid4())))
+
+	def create_instance_from_image(self, my_image, zone, name=None, machine_type=MACHINE_TYPE):
 		"""
 		This function will create a new instance, from a previously made image, in a specific zone.
 		It will attach to the instance a startup script named 'startup.sh' that should be located
@@ -307,72 +1407,191 @@ class GoogleCloudClient:
 		Args:
 			my_image (str): The name of the image to use
 			zone (str): The name of the zone to create the instance in
+			name (str): [optional] The name of the new instance. By default it is 'restserver-N', where N
+			is the number of REST servers in the project
+			machine_type (str): [optional] The name of the machine type, see can_suspend
 		Returns:
 			dict: Details about the operation
 			https://developers.google.com/resources/api-libraries/documentation/compute/v1/python/latest/compute_v1.instances.html#insert
 		"""
 
-		# Get the image requested
-		image = self.compute.images().get(project=self.project, image=my_image).execute()
-		source_disk_image = image['selfLink']
-		
-		# Configure the machine
-		machine_type = 'zones/' + zone + '/machineTypes/f1-micro'
-
-		# Read in the startup-script
-		startup_script = open('startup.sh', 'r').read()
-
-		# Setup the config
-		config = {
-			'name': 'restserver-'+str(self.get_count_of_servers_with_name('restserver')),
-			'machineType': machine_type,
-
-			'tags': {
-				'items': [
-					'http-server',
-					'https-server'
-				]
-			},
-
-			# Specify the boot disk and the image to use as a source
-			'disks': [
-				{
-					'boot': True,
-					'autoDelete': True,
-					'initializeParams': {
-						'sourceImage': source_disk_image,
-					},
-					'deviceName':'restserver-'+str(self.get_count_of_servers_with_name('restserver'))
-				}
-			],
-		
-			# Specify a network interface with NAT to acces the public internet
-			'networkInterfaces': [{
-				'network': 'global/networks/default',
-				'accessConfigs': [
-					{'type': 'ONE_TO_ONE_NAT', 'name': 'External NAT'}
-				]
-			}],
-
-			# Allow the instance to acces cloud storage and logging
-			'serviceAccounts': [{
-				'email': 'default',
-				'scopes': [
-					'https://www.googleapis.com/auth/devstorage.read_write',
-					'https://www.googleapis.com/auth/logging.write'
-				]
-			}],
-
-			# Metadata is readable from the instance and allows you to pass configuration
-			# from deployment scripts to instances
-			'metadata': {
-				'items': [{
-					# Startup script is automatically executed by the instance upon startup
-					'key': 'startup-script',
-					'value': startup_script
-				}]
-			}	
-		}
-	
+		source_disk_image, startup_script = self.get_instance_template(my_image)
+		if name is None:
+			name = self.next_rest_server_names(1)[0]
+		config = instance_config(name, zone, source_disk_image, startup_script, machine_type)
+
 		# Now create the instace and return it
-		return self.compute.instances().insert(project=self.project, zone=zone, body=config).execute()
+		return self._execute(self.compute.instances().insert(project=self.project, zone=zone, body=config, requestId=str(uuid.uuid4())))
+
+	def get_instance_template(self, my_image):
+		"""
+		This function will return what every REST server created from an image shares: the image's
+		selfLink and the startup script in 'startup.sh'. Both are read once per image and kept for the
+		life of the client, so creating many servers costs one images().get.
+		Args:
+			my_image (str): The name of the image to use
+		Returns:
+			tuple (str, str): The image's selfLink, and the startup script
+		"""
+
+		with self._template_lock:
+			if my_image not in self._templates:
+				image = self._execute(self.compute.images().get(project=self.project, image=my_image))
+				with open('startup.sh', 'r') as startup_script:
+					self._templates[my_image] = (image['selfLink'], startup_script.read())
+			return self._templates[my_image]
+
+	def next_rest_server_names(self, count):
+		"""
+		This function will return count unused REST server names, from a single inventory read. Names
+		follow the 'restserver-N' convention, with N counting up from the number of REST servers in the
+		project, and skip names that exist or that this client already handed out, so servers created
+		at the same time never get the same name.
+		Args:
+			count (int): How many names to return
+		Example:
+		>>> c.next_rest_server_names(2)
+		['restserver-4', 'restserver-5']
+		Returns:
+			list (str): The names
+		"""
+
+		with self._names_lock:
+			existing = self.get_instance_name_list()
+			used = set(existing) | self._reserved_names
+			number = [name.count('restserver') for name in existing].count(1)
+			names = []
+			while len(names) < count:
+				name = 'restserver-' + str(number)
+				if name not in used:
+					names.append(name)
+				number += 1
+			self._reserved_names.update(names)
+			return names
+
+	def bulk_insert_instances(self, my_image, zone, names, machine_type=MACHINE_TYPE):
+		"""
+		This function will create many REST servers in one zone with a single instances().bulkInsert call.
+		Either all of them are created, or none.
+		Args:
+			my_image (str): The name of the image to use
+			zone (str): The name of the zone to create the instances in
+			names (list): The names of the new instances
+			machine_type (str): [optional] The name of the machine type
+		Returns:
+			dict: Details about the operation
+			https://cloud.google.com/compute/docs/reference/rest/v1/instances/bulkInsert
+		"""
+
+		source_disk_image, startup_script = self.get_instance_template(my_image)
+		properties = instance_config(None, zone, source_disk_image, startup_script, machine_type)
+		# Instance properties name the machine type, and leave the instance and device names out
+		del properties['name']
+		del properties['disks'][0]['deviceName']
+		properties['machineType'] = machine_type
+		body = {
+			'count': len(names),
+			'minCount': len(names),
+			'instanceProperties': properties,
+			'perInstanceProperties': {name: {} for name in names}
+		}
+		return self._execute(self.compute.instances().bulkInsert(project=self.project, zone=zone, body=body, requestId=str(uuid.uuid4())))
+
+	def run_operations(self, operations, max_workers=BULK_MAX_WORKERS, timeout=None):
+		"""
+		This function will submit many operations and wait on them together. At most max_workers
+		operations are in flight at once. A failure is recorded in that operation's result, it does
+		not stop the others.
+		Args:
+			operations (list): (name, function, args) tuples. function(*args) must return an operation,
+			such as start_instance, stop_instance or create_instance_from_image
+			max_workers (int): [optional] How many operations may run at the same time
+			timeout (float): [optional] Seconds to wait on each operation, see wait_for_operation
+		Example:
+		>>> c.run_operations([('restserver-0', c.stop_instance, ('restserver-0', 'us-central1-c'))])
+		Returns:
+			list (BulkResult): One result for each operation, in the order they were given
+		"""
+
+		def run(function, args):
+			return self.wait_for_operation(function(*args), timeout=timeout)
+
+		if len(operations) == 0:
+			return []
+		with ThreadPoolExecutor(max_workers=min(max_workers, len(operations))) as executor:
+			futures = [(name, executor.submit(run, function, args)) for name, function, args in operations]
+		results = []
+		for name, future in futures:
+			try:
+				results.append(BulkResult(name, future.result(), None))
+			except Exception as error:
+				results.append(BulkResult(name, None, error))
+		return results
+
+	def start_instances(self, instances, max_workers=BULK_MAX_WORKERS, timeout=None):
+		"""
+		This function will start many instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to start
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return self.run_operations([(name, self.start_instance, (name, zone)) for name, zone in instances], max_workers, timeout)
+
+	def stop_instances(self, instances, max_workers=BULK_MAX_WORKERS, timeout=None):
+		"""
+		This function will stop many instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to stop
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return self.run_operations([(name, self.stop_instance, (name, zone)) for name, zone in instances], max_workers, timeout)
+
+	def suspend_instances(self, instances, max_workers=BULK_MAX_WORKERS, timeout=None):
+		"""
+		This function will suspend many instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to suspend
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return self.run_operations([(name, self.suspend_instance, (name, zone)) for name, zone in instances], max_workers, timeout)
+
+	def resume_instances(self, instances, max_workers=BULK_MAX_WORKERS, timeout=None):
+		"""
+		This function will resume many suspended instances at once, see run_operations.
+		Args:
+			instances (list): (name, zone) tuples of the instances to resume
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		return self.run_operations([(name, self.resume_instance, (name, zone)) for name, zone in instances], max_workers, timeout)
+
+	def create_instances_from_image(self, my_image, instances, max_workers=BULK_MAX_WORKERS, timeout=None, bulk_insert=False, machine_type=MACHINE_TYPE):
+		"""
+		This function will create many instances at once from the same image, see run_operations. The
+		image and startup script are resolved once for all of them, see get_instance_template.
+		Args:
+			my_image (str): The name of the image to use
+			instances (list): (name, zone) tuples of the instances to create, see next_rest_server_names
+			bulk_insert (bool): [optional] Send one instances().bulkInsert per zone instead of one insert
+			per instance. The instances of a zone are then created, or fail, together
+			machine_type (str): [optional] The name of the machine type, see can_suspend
+		Returns:
+			list (BulkResult): One result for each instance
+		"""
+
+		self.get_instance_template(my_image)
+		if not bulk_insert:
+			return self.run_operations([(name, self.create_instance_from_image, (my_image, zone, name, machine_type)) for name, zone in instances], max_workers, timeout)
+		zones = {}
+		for name, zone in instances:
+			zones.setdefault(zone, []).append(name)
+		results = self.run_operations([(zone, self.bulk_insert_instances, (my_image, zone, names, machine_type)) for zone, names in zones.items()], max_workers, timeout)
+		by_zone = {result.name: result for result in results}
+		return [BulkResult(name, by_zone[zone].result, by_zone[zone].error) for name, zone in instances]
@@ -0,0 +1,97 @@
+"""
+	@file : healthCheck.py
+	@desc : Probes the REST servers' http endpoints, so the load balancer only sends traffic to servers
+	whose Flask process (started by startup.sh) is answering, weighted by how fast they answer.
+	A server is ready if it answers every probe with a status below 500, and its latency is the median
+	of HEALTH_CHECK_SAMPLES probes. All servers are probed at the same time.
+
+	The servers are probed at their internal ips, so run this from inside the project's network, such as
+	on the load balancer, to get real results. See updateLoadBalancer.create_upstream for what happens
+	when no server answers, and can_reach to find out whether this host is inside the network.
+
+	Example:
+	>>> probe_backends(['10.128.0.5', '10.128.0.6'])
+	{'10.128.0.5': 0.0042, '10.128.0.6': None}
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import statistics
+import socket
+import time
+
+# Where the REST servers listen, see startup.sh. Any answer below 500 means Flask is up
+HEALTH_CHECK_PORT = 80
+HEALTH_CHECK_PATH = '/'
+# Seconds to wait for a connection or an answer, and how many probes each server gets
+HEALTH_CHECK_TIMEOUT = 2
+HEALTH_CHECK_SAMPLES = 3
+# The most servers probed at the same time
+HEALTH_CHECK_WORKERS = 32
+
+def probe_backend(ip, port=HEALTH_CHECK_PORT, path=HEALTH_CHECK_PATH, timeout=HEALTH_CHECK_TIMEOUT, samples=HEALTH_CHECK_SAMPLES):
+	"""
+	This function will probe one server.
+	Args:
+		ip (str): The address of the server
+		port (int): [optional] The port it listens on
+		path (str): [optional] The path to request
+		timeout (float): [optional] Seconds to wait for each probe
+		samples (int): [optional] How many probes to send
+	Returns:
+		float: The median seconds a probe took, or None if the server is not ready
+	"""
+
+	connection = http.client.HTTPConnection(ip, port, timeout=timeout)
+	latencies = []
+	try:
+		for _ in range(samples):
+			start = time.perf_counter()
+			connection.request('GET', path)
+			response = connection.getresponse()
+			response.read()
+			if response.status >= 500:
+				return None
+			latencies.append(time.perf_counter() - start)
+	except (OSError, http.client.HTTPException):
+		return None
+	finally:
+		connection.close()
+	return statistics.median(latencies)
+
+def can_reach(ip, port=HEALTH_CHECK_PORT, timeout=HEALTH_CHECK_TIMEOUT):
+	"""
+	This function will tell whether this host can reach an address, such as the load balancer's
+	internal ip, which tells whether it is inside the project's network. A refused connection still
+	reached the host.
+	Args:
+		ip (str): The address
+		port (int): [optional] The port to connect to
+		timeout (float): [optional] Seconds to wait for the connection
+	Returns:
+		bool: False if the connection timed out, or there is no route to the address
+	"""
+
+	try:
+		socket.create_connection((ip, port), timeout).close()
+		return True
+	except ConnectionRefusedError:
+		return True
+	except OSError:
+		return False
+
+def probe_backends(ips, port=HEALTH_CHECK_PORT, path=HEALTH_CHECK_PATH, timeout=HEALTH_CHECK_TIMEOUT, samples=HEALTH_CHECK_SAMPLES):
+	"""
+	This function will probe many servers at the same time, see probe_backend.
+	Args:
+		ips (list): The addresses of the servers
+	Returns:
+		dict: The latency of each server, keyed by its address, None for servers that are not ready
+	"""
+
+	ips = list(ips)
+	if len(ips) == 0:
+		return {}
+	with ThreadPoolExecutor(max_workers=min(len(ips), HEALTH_CHECK_WORKERS)) as executor:
+		latencies = executor.map(lambda ip: probe_backend(ip, port, path, timeout, samples), ips)
+		return dict(zip(ips, latencies))
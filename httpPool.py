@@ -0,0 +1,118 @@
+"""
+	@file : httpPool.py
+	@desc : The HttpPool class hands out authorized http connections to the threads of a GoogleCloudClient.
+	The httplib2 connection of a discovery service is not thread safe, so each request borrows a
+	connection from the pool, and gives it back once the response is read. Connections are kept alive
+	and reused by whichever thread asks next, so threads started for one bulk operation (see
+	GoogleCloudClient.run_operations) reuse the TLS connections of the ones before them, instead of each
+	opening its own. At most size requests use a connection at once, a thread that finds them all in use
+	waits for one. Long polls, such as zoneOperations().wait, which hold a connection for up to 2 minutes
+	while sending nothing, are not counted against size, so a fleet waiting on many operations does not
+	hold up its other requests, or wait on itself in turns. At most size idle connections are kept.
+
+	Responses are gzipped: the compute API only compresses for clients that accept gzip and whose
+	User-Agent contains '(gzip)', and httplib2 sends both by default, batch requests included.
+
+	Example:
+	>>> pool = HttpPool(credentials, size=20)
+	>>> with pool.connection() as http:
+	... 	response = request.execute(http=http)
+	>>> client = GoogleCloudClient('project-name', http_pool=pool)
+"""
+
+from contextlib import contextmanager
+import threading
+
+# The most connections a pool lends out at once, long polls aside, and seconds a connection waits for a response. None waits as
+# long as the request takes, zoneOperations().wait can hold a request for 2 minutes
+HTTP_POOL_SIZE = 20
+HTTP_TIMEOUT = None
+
+class HttpPool:
+
+	def __init__(self, credentials=None, size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+		"""
+		The constructor will set up an empty pool, connections are opened as they are needed. It is safe
+		to use from many threads, and can be shared by the clients of many projects.
+		Args:
+			credentials (Credentials): [optional] The credentials to authorize requests with, None sends
+			them unauthorized, as a fakeCompute.py server expects
+			size (int): [optional] The most connections in use at once, long polls aside, and the most kept idle
+			timeout (float): [optional] Seconds to wait for a response
+		"""
+
+		self.credentials = credentials
+		self.size = size
+		self.timeout = timeout
+		self.created = 0
+		self._idle = []
+		self._available = threading.BoundedSemaphore(size)
+		self._lock = threading.Lock()
+
+	def _new_http(self):
+		import google_auth_httplib2
+		import httplib2
+		http = httplib2.Http(timeout=self.timeout)
+		if self.credentials is not None:
+			http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=http)
+		return http
+
+	def acquire(self, long_poll=False):
+		"""
+		This function will take a connection from the pool, waiting if they are all in use. The most
+		recently used connection is handed out first, as it is the most likely to still be open.
+		Args:
+			long_poll (bool): [optional] The request may be held open for minutes, it does not wait for
+			a connection and is not counted against the pool's size
+		Returns:
+			obj: An http object, give it back with release, passing the same long_poll
+		"""
+
+		if not long_poll:
+			self._available.acquire()
+		with self._lock:
+			if len(self._idle) > 0:
+				return self._idle.pop()
+			self.created += 1
+		try:
+			return self._new_http()
+		except Exception:
+			if not long_poll:
+				self._available.release()
+			raise
+
+	def release(self, http, long_poll=False):
+		with self._lock:
+			keep = len(self._idle) < self.size
+			if keep:
+				self._idle.append(http)
+		if not keep:
+			_close(http)
+		if not long_poll:
+			self._available.release()
+
+	@contextmanager
+	def connection(self, long_poll=False):
+		"""
+		This function will lend a connection for the body of a with statement, see acquire.
+		"""
+
+		http = self.acquire(long_poll)
+		try:
+			yield http
+		finally:
+			self.release(http, long_poll)
+
+	def close(self):
+		"""
+		This function will close the idle connections.
+		"""
+
+		with self._lock:
+			idle, self._idle = self._idle, []
+		for http in idle:
+			_close(http)
+
+def _close(http):
+	for connection in list(getattr(http, 'connections', {}).values()):
+		connection.close()
@@ -0,0 +1,177 @@
+"""
+	@file : inventoryStore.py
+	@desc : The InventoryStore class keeps the instances of one or more projects in a SQLite file, so a
+	script can answer its queries from local indexes instead of listing the project every time it runs.
+	Instances are indexed by status, zone and name, and their labels by key and value. GoogleCloudClient
+	keeps the store in sync, see GoogleCloudClient.sync_inventory: the first sync lists the project, later
+	ones only fetch the instances that recent operations touched.
+
+	Example:
+	>>> store = InventoryStore()
+	>>> client = GoogleCloudClient('project-name', inventory=store)
+	>>> client.get_rest_servers('RUNNING')
+	>>> store.query('project-name', status='RUNNING', labels={'persistent': 'true'})
+"""
+
+from googlecloudclient import CACHE_DIR
+import threading
+import sqlite3
+import json
+import os
+
+INVENTORY_PATH = os.path.join(CACHE_DIR, 'inventory.sqlite')
+# How many rows iter_query reads at a time
+FETCH_SIZE = 500
+
+SCHEMA = '''
+	CREATE TABLE IF NOT EXISTS instances (project TEXT, zone TEXT, name TEXT, status TEXT, data TEXT, PRIMARY KEY (project, zone, name));
+	CREATE INDEX IF NOT EXISTS instances_status ON instances (project, status);
+	CREATE INDEX IF NOT EXISTS instances_name ON instances (project, name);
+	CREATE TABLE IF NOT EXISTS labels (project TEXT, zone TEXT, name TEXT, key TEXT, value TEXT, PRIMARY KEY (project, zone, name, key));
+	CREATE INDEX IF NOT EXISTS labels_value ON labels (project, key, value);
+	CREATE TABLE IF NOT EXISTS syncs (project TEXT PRIMARY KEY, marker REAL, full_sync REAL);
+'''
+
+class InventoryStore:
+
+	def __init__(self, path=INVENTORY_PATH):
+		"""
+		The constructor will open the store, creating the file and its tables if needed. It is safe to
+		use from many threads.
+		Args:
+			path (str): [optional] The SQLite file, ':memory:' keeps the store for the life of the object
+		"""
+
+		if path != ':memory:':
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self._connection = sqlite3.connect(path, check_same_thread=False)
+		self._connection.executescript(SCHEMA)
+		self._lock = threading.Lock()
+
+	def close(self):
+		self._connection.close()
+
+	def _upsert(self, project, instance):
+		zone = instance['zone'].rsplit('/', 1)[-1]
+		self._connection.execute('INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?)',
+			(project, zone, instance['name'], instance['status'], json.dumps(instance)))
+		self._connection.execute('DELETE FROM labels WHERE project = ? AND zone = ? AND name = ?', (project, zone, instance['name']))
+		self._connection.executemany('INSERT INTO labels VALUES (?, ?, ?, ?, ?)',
+			[(project, zone, instance['name'], key, value) for key, value in instance.get('labels', {}).items()])
+
+	def replace_all(self, project, instances, marker):
+		"""
+		This function will replace every instance of a project, after a full listing.
+		Args:
+			project (str): The project name
+			instances (iterable): The json of every instance in the project
+			marker (float): The time the listing started, in seconds since the epoch
+		"""
+
+		with self._lock, self._connection:
+			self._connection.execute('DELETE FROM instances WHERE project = ?', (project,))
+			self._connection.execute('DELETE FROM labels WHERE project = ?', (project,))
+			for instance in instances:
+				self._upsert(project, instance)
+			self._connection.execute('INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)', (project, marker, marker))
+
+	def apply_changes(self, project, changed, deleted, marker=None):
+		"""
+		This function will record instances that changed, and remove deleted ones.
+		Args:
+			project (str): The project name
+			changed (list): The json of the instances that changed
+			deleted (list): (zone, name) tuples of the instances that no longer exist
+			marker (float): [optional] The time the sync started, recorded as the last sync
+		"""
+
+		with self._lock, self._connection:
+			for instance in changed:
+				self._upsert(project, instance)
+			for zone, name in deleted:
+				self._connection.execute('DELETE FROM instances WHERE project = ? AND zone = ? AND name = ?', (project, zone, name))
+				self._connection.execute('DELETE FROM labels WHERE project = ? AND zone = ? AND name = ?', (project, zone, name))
+			if marker is not None:
+				self._connection.execute('UPDATE syncs SET marker = ? WHERE project = ?', (marker, project))
+
+	def set_status(self, project, zone, name, status):
+		"""
+		This function will change the status of one instance, after an operation on it finished.
+		Returns:
+			bool: False if the store does not have the instance
+		"""
+
+		with self._lock, self._connection:
+			row = self._connection.execute('SELECT data FROM instances WHERE project = ? AND zone = ? AND name = ?', (project, zone, name)).fetchone()
+			if row is None:
+				return False
+			data = dict(json.loads(row[0]), status=status)
+			self._connection.execute('UPDATE instances SET status = ?, data = ? WHERE project = ? AND zone = ? AND name = ?',
+				(status, json.dumps(data), project, zone, name))
+			return True
+
+	def last_sync(self, project):
+		"""
+		This function will return when a project was last synced.
+		Returns:
+			tuple (float, float): The marker of the last sync and the time of the last full sync, in seconds
+			since the epoch, or (None, None) if the project was never synced
+		"""
+
+		with self._lock:
+			row = self._connection.execute('SELECT marker, full_sync FROM syncs WHERE project = ?', (project,)).fetchone()
+		return row if row is not None else (None, None)
+
+	def _where(self, project, status, zone, name_prefix, labels):
+		clauses = ['i.project = ?']
+		params = [project]
+		if status is not None:
+			clauses.append('i.status = ?')
+			params.append(status)
+		if zone is not None:
+			clauses.append('i.zone = ?')
+			params.append(zone)
+		if name_prefix:
+			# GLOB is case sensitive, so a prefix uses the name index
+			clauses.append('i.name GLOB ?')
+			params.append(name_prefix.replace('[', '[[]').replace('*', '[*]').replace('?', '[?]') + '*')
+		for key, value in (labels or {}).items():
+			clauses.append('EXISTS (SELECT 1 FROM labels l WHERE l.project = i.project AND l.zone = i.zone AND l.name = i.name AND l.key = ? AND l.value = ?)')
+			params += [key, value]
+		return ' AND '.join(clauses), params
+
+	def iter_query(self, project, status=None, zone=None, name_prefix=None, labels=None):
+		"""
+		This function will yield the json of the instances that match every given condition, reading
+		FETCH_SIZE rows at a time.
+		Args:
+			project (str): The project name
+			status (str): [optional] The status the instances must have
+			zone (str): [optional] The zone the instances must be in
+			name_prefix (str): [optional] What the instance names must start with
+			labels (dict): [optional] Labels the instances must have, with these values
+		Returns:
+			generator (json): The matching instances, ordered by zone and name
+		"""
+
+		where, params = self._where(project, status, zone, name_prefix, labels)
+		last = ('', '')
+		while True:
+			with self._lock:
+				rows = self._connection.execute('SELECT i.zone, i.name, i.data FROM instances i WHERE ' + where +
+					' AND (i.zone, i.name) > (?, ?) ORDER BY i.zone, i.name LIMIT ?', params + list(last) + [FETCH_SIZE]).fetchall()
+			for _, _, data in rows:
+				yield json.loads(data)
+			if len(rows) < FETCH_SIZE:
+				return
+			last = rows[-1][:2]
+
+	def query(self, project, status=None, zone=None, name_prefix=None, labels=None):
+		"""
+		This function will return the json of the instances that match every given condition, see iter_query.
+		Returns:
+			list (json): The matching instances
+		"""
+
+		return list(self.iter_query(project, status, zone, name_prefix, labels))
@@ -0,0 +1,143 @@
+"""
+	@file : loadBalancerTransport.py
+	@desc : Transports that push a rendered nginx config to a load balancer and reload nginx. They all
+	have the same two methods, push(config) and close(), so updateLoadBalancer.py can use any of them.
+
+	SshTransport keeps one multiplexed OpenSSH connection per load balancer (ControlMaster), and uploads
+	the config and reloads nginx in a single command over it. The connection stays open for
+	CONTROL_PERSIST after the last push, so later pushes, even from another run, skip the handshake.
+	GcloudTransport is the old 'gcloud compute scp' then 'gcloud compute ssh' pair.
+	LocalTransport writes the config to a local directory, and stands in for a load balancer in tests.
+
+	Example:
+	>>> transport = SshTransport('35.193.133.78', host_key_alias='compute.1234567890')
+	>>> transport.push(config)
+	True
+"""
+
+import subprocess
+import tempfile
+import getpass
+import os
+
+NGINX_CONFIG_PATH = '/etc/nginx/sites-available/default'
+# The key and known hosts file 'gcloud compute ssh' sets up
+GCLOUD_SSH_KEY = os.path.join(os.path.expanduser('~'), '.ssh', 'google_compute_engine')
+GCLOUD_KNOWN_HOSTS = os.path.join(os.path.expanduser('~'), '.ssh', 'google_compute_known_hosts')
+# How long the master connection stays open after the last push
+CONTROL_PERSIST = '10m'
+
+class SshTransport:
+
+	def __init__(self, host, user=None, key_file=GCLOUD_SSH_KEY, host_key_alias=None):
+		"""
+		The constructor will set where to connect to. The connection itself is opened by the first push.
+		Args:
+			host (str): The external ip address of the load balancer
+			user (str): [optional] The user to log in as, by default the local user, like gcloud
+			key_file (str): [optional] The private key, by default the one gcloud sets up
+			host_key_alias (str): [optional] The name the host key is known by, gcloud uses 'compute.<id>'
+		"""
+
+		self.host = host
+		self.user = user or getpass.getuser()
+		self.key_file = key_file
+		self.host_key_alias = host_key_alias
+		self.control_path = os.path.join(tempfile.gettempdir(), 'lb-ssh-{}@{}'.format(self.user, host))
+
+	def _ssh(self, *args):
+		options = [
+			'-i', self.key_file,
+			'-o', 'ControlMaster=auto',
+			'-o', 'ControlPath=' + self.control_path,
+			'-o', 'ControlPersist=' + CONTROL_PERSIST,
+			'-o', 'UserKnownHostsFile=' + GCLOUD_KNOWN_HOSTS,
+			'-o', 'StrictHostKeyChecking=accept-new',
+			'-o', 'BatchMode=yes'
+		]
+		if self.host_key_alias is not None:
+			options += ['-o', 'HostKeyAlias=' + self.host_key_alias]
+		return ['ssh'] + options + list(args)
+
+	def push(self, config):
+		"""
+		This function will upload the config and reload nginx, in one command over the shared connection.
+		Args:
+			config (str): The rendered config
+		Returns:
+			bool: True if the config was uploaded and nginx reloaded
+		"""
+
+		command = 'sudo tee {} > /dev/null && sudo service nginx reload'.format(NGINX_CONFIG_PATH)
+		return subprocess.run(self._ssh(self.user + '@' + self.host, command), input=config.encode()).returncode == 0
+
+	def close(self):
+		"""
+		This function will close the master connection, if one is open.
+		"""
+
+		subprocess.run(self._ssh('-O', 'exit', self.user + '@' + self.host), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class GcloudTransport:
+
+	def __init__(self, lb_name, zone):
+		"""
+		The constructor will set the load balancer to push to.
+		Args:
+			lb_name (str): The name of the load balancer
+			zone (str): The zone it is located in
+		"""
+
+		self.lb_name = lb_name
+		self.zone = zone
+
+	def push(self, config):
+		"""
+		This function will scp the config to the load balancer, then ssh in and reload nginx.
+		Args:
+			config (str): The rendered config
+		Returns:
+			bool: True if the config was uploaded and nginx reloaded
+		"""
+
+		with tempfile.NamedTemporaryFile('w', prefix='default.', delete=False) as rendered:
+			rendered.write(config)
+		try:
+			status = os.system('gcloud compute scp {} root@{}:{} --zone {}'.format(rendered.name, self.lb_name, NGINX_CONFIG_PATH, self.zone))
+			if status == 0:
+				status = os.system('gcloud compute ssh {} --zone {} --command \"sudo service nginx reload\"'.format(self.lb_name, self.zone))
+		finally:
+			os.remove(rendered.name)
+		return status == 0
+
+	def close(self):
+		pass
+
+class LocalTransport:
+
+	def __init__(self, directory):
+		"""
+		The constructor will set the directory the config is written to.
+		Args:
+			directory (str): Where to write the config, as 'default'
+		"""
+
+		self.directory = directory
+		self.reloads = 0
+
+	def push(self, config):
+		"""
+		This function will write the config to the directory, and count a reload.
+		Args:
+			config (str): The rendered config
+		Returns:
+			bool: True
+		"""
+
+		with open(os.path.join(self.directory, 'default'), 'w') as pushed:
+			pushed.write(config)
+		self.reloads += 1
+		return True
+
+	def close(self):
+		pass
@@ -0,0 +1,174 @@
+"""
+	@file : profiler.py
+	@desc : The Profiler class records where a script spends its time: for every compute API method the
+	number of calls, errors and retries, the bytes received and a latency histogram, and the time spent in
+	named phases, such as a script's steps or GoogleCloudClient.wait_for_operation. Every GoogleCloudClient
+	has one, as its profiler attribute, and the scripts dump it when run with -profile.
+
+	A path ending in '.prom' is written in the Prometheus text format, for node_exporter's textfile
+	collector, any other path as json.
+
+	Example:
+	>>> client = GoogleCloudClient('project-name')
+	>>> with client.profiler.phase('find running servers'):
+	... 	servers = client.get_rest_servers('RUNNING')
+	>>> client.profiler.dump('scale.prom', 'scale')
+"""
+
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+# Upper bounds, in seconds, of the latency histogram buckets. zoneOperations().wait can take 120 seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRIC_PREFIX = 'google_cloud_scripts_'
+
+class Profiler:
+
+	def __init__(self):
+		"""
+		The constructor will start an empty profile. It is safe to record from many threads at once.
+		"""
+
+		self.started = time.time()
+		self.calls = {}
+		self.phases = {}
+		self._lock = threading.Lock()
+
+	def _call(self, method):
+		if method not in self.calls:
+			self.calls[method] = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'seconds': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+		return self.calls[method]
+
+	def record_call(self, method, seconds=None, received=0, error=False):
+		"""
+		This function will record one API call.
+		Args:
+			method (str): The API method, such as 'compute.instances.list'
+			seconds (float): [optional] How long the call took. Calls sent inside a batch have no latency
+			of their own, the batch does
+			received (int): [optional] The bytes received
+			error (bool): [optional] True if the call failed
+		"""
+
+		with self._lock:
+			call = self._call(method)
+			call['count'] += 1
+			call['bytes'] += received
+			call['errors'] += int(error)
+			if seconds is not None:
+				call['seconds'] += seconds
+				call['buckets'][sum(1 for bound in LATENCY_BUCKETS if seconds > bound)] += 1
+
+	def record_retry(self, method):
+		"""
+		This function will record that a call to an API method is being retried.
+		Args:
+			method (str): The API method
+		"""
+
+		with self._lock:
+			self._call(method)['retries'] += 1
+
+	def record_phase(self, name, seconds):
+		with self._lock:
+			phase = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0})
+			phase['count'] += 1
+			phase['seconds'] += seconds
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		This function will time the body of a with statement as a phase. A phase may run more than once,
+		and in more than one thread, its time is the sum of all of them.
+		Args:
+			name (str): The name of the phase
+		"""
+
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.record_phase(name, time.perf_counter() - start)
+
+	def to_dict(self, script=None):
+		"""
+		This function will return the profile, with cumulative histogram buckets keyed by their bound.
+		Args:
+			script (str): [optional] The name of the script that was profiled
+		Returns:
+			dict: {'script', 'started', 'wall_seconds', 'calls': {method: {...}}, 'phases': {name: {...}}}
+		"""
+
+		with self._lock:
+			calls = {}
+			for method, call in sorted(self.calls.items()):
+				cumulative = 0
+				buckets = {}
+				for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], call['buckets']):
+					cumulative += count
+					buckets[bound] = cumulative
+				calls[method] = dict(call, buckets=buckets)
+			return {'script': script, 'started': self.started, 'wall_seconds': time.time() - self.started,
+				'calls': calls, 'phases': {name: dict(phase) for name, phase in sorted(self.phases.items())}}
+
+	def to_prometheus(self, script=None):
+		"""
+		This function will return the profile in the Prometheus text exposition format.
+		Args:
+			script (str): [optional] Added to every sample as a 'script' label
+		Returns:
+			str: The metrics
+		"""
+
+		profile = self.to_dict(script)
+		extra = '' if script is None else ',script="{}"'.format(script)
+		lines = []
+
+		def metric(name, kind, help_text, samples):
+			lines.append('# HELP {}{} {}'.format(METRIC_PREFIX, name, help_text))
+			lines.append('# TYPE {}{} {}'.format(METRIC_PREFIX, name, kind))
+			lines.extend(METRIC_PREFIX + sample for sample in samples)
+
+		calls = profile['calls'].items()
+		metric('api_calls_total', 'counter', 'Compute API calls by method.',
+			['api_calls_total{{method="{}"{}}} {}'.format(method, extra, call['count']) for method, call in calls])
+		metric('api_errors_total', 'counter', 'Compute API calls that failed, by method.',
+			['api_errors_total{{method="{}"{}}} {}'.format(method, extra, call['errors']) for method, call in calls])
+		metric('api_retries_total', 'counter', 'Compute API calls that were retried, by method.',
+			['api_retries_total{{method="{}"{}}} {}'.format(method, extra, call['retries']) for method, call in calls])
+		metric('api_received_bytes_total', 'counter', 'Bytes received from the compute API, by method.',
+			['api_received_bytes_total{{method="{}"{}}} {}'.format(method, extra, call['bytes']) for method, call in calls])
+		samples = []
+		for method, call in calls:
+			samples += ['api_call_duration_seconds_bucket{{method="{}"{},le="{}"}} {}'.format(method, extra, bound, count) for bound, count in call['buckets'].items()]
+			samples.append('api_call_duration_seconds_sum{{method="{}"{}}} {}'.format(method, extra, call['seconds']))
+			samples.append('api_call_duration_seconds_count{{method="{}"{}}} {}'.format(method, extra, call['buckets']['+Inf']))
+		metric('api_call_duration_seconds', 'histogram', 'Latency of compute API calls, by method.', samples)
+		phases = profile['phases'].items()
+		metric('phase_seconds_total', 'counter', 'Seconds spent in each phase of the script.',
+			['phase_seconds_total{{phase="{}"{}}} {}'.format(name, extra, phase['seconds']) for name, phase in phases])
+		metric('phase_runs_total', 'counter', 'Times each phase of the script ran.',
+			['phase_runs_total{{phase="{}"{}}} {}'.format(name, extra, phase['count']) for name, phase in phases])
+		metric('wall_seconds', 'gauge', 'Seconds the script ran for.', ['wall_seconds{{{}}} {}'.format(extra.lstrip(','), profile['wall_seconds'])])
+		return '\n'.join(lines) + '\n'
+
+	def dump(self, path, script=None):
+		"""
+		This function will write the profile to a file, in the Prometheus text format if the path ends
+		with '.prom' and as json otherwise. The file is replaced in one step, so a collector never reads
+		half of it.
+		Args:
+			path (str): Where to write the profile
+			script (str): [optional] The name of the script that was profiled
+		"""
+
+		if path.endswith('.prom'):
+			content = self.to_prometheus(script)
+		else:
+			content = json.dumps(self.to_dict(script), indent=2)
+		with open(path + '.tmp', 'w') as profile_file:
+			profile_file.write(content)
+		os.replace(path + '.tmp', path)
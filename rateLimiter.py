@@ -0,0 +1,146 @@
+"""
+	@file : rateLimiter.py
+	@desc : The RateLimiter class keeps a client's calls within the compute API's per-project rate
+	limits. Reads and writes have separate token buckets, as the API counts them separately. Each call
+	takes a token first, waiting for one if the bucket is empty, so concurrent threads share the budget
+	and together run as fast as it allows, without being throttled by the API.
+
+	When the API does throttle a call anyway, penalize empties that bucket for the given time, so every
+	thread backs off together instead of each finding out with its own failed call.
+
+	Example:
+	>>> limiter = RateLimiter(read_rate=20, write_rate=10)
+	>>> limiter.acquire(reads=1)
+	>>> client = GoogleCloudClient('project-name', rate_limiter=limiter)
+"""
+
+import threading
+import time
+
+# Calls per second, kept below the compute API's default per-project limits. The buckets hold
+# BURST_SECONDS worth of calls, so a short burst goes through at once
+READ_RATE = 20
+WRITE_RATE = 10
+BURST_SECONDS = 2
+
+class TokenBucket:
+
+	def __init__(self, rate, capacity):
+		"""
+		The constructor will set up a full bucket.
+		Args:
+			rate (float): Tokens added per second
+			capacity (float): The most tokens the bucket holds
+		"""
+
+		self.rate = rate
+		self.capacity = capacity
+		self._tokens = capacity
+		self._updated = time.monotonic()
+		self._lock = threading.Lock()
+
+	def _refill(self, now):
+		self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+		self._updated = now
+
+	def reserve(self, tokens=1):
+		"""
+		This function will take tokens from the bucket without waiting for them, and return how long the
+		caller has to wait before using them. Tokens are reserved at once, so callers are served in the
+		order they arrive.
+		Args:
+			tokens (float): [optional] How many tokens to take
+		Returns:
+			float: The seconds to wait
+		"""
+
+		with self._lock:
+			self._refill(time.monotonic())
+			self._tokens -= tokens
+			return -self._tokens / self.rate if self._tokens < 0 else 0
+
+	def acquire(self, tokens=1):
+		"""
+		This function will take tokens from the bucket, waiting until they are there, see reserve.
+		Args:
+			tokens (float): [optional] How many tokens to take
+		Returns:
+			float: The seconds spent waiting
+		"""
+
+		wait = self.reserve(tokens)
+		if wait > 0:
+			time.sleep(wait)
+		return wait
+
+	def drain(self, seconds):
+		"""
+		This function will empty the bucket, so no tokens are handed out for the given time.
+		Args:
+			seconds (float): How long to hold back
+		"""
+
+		with self._lock:
+			self._refill(time.monotonic())
+			self._tokens = min(self._tokens, -seconds * self.rate)
+
+class RateLimiter:
+
+	def __init__(self, read_rate=READ_RATE, write_rate=WRITE_RATE, burst_seconds=BURST_SECONDS):
+		"""
+		The constructor will set up a bucket for reads and one for writes. One limiter can be shared by
+		clients of the same project, so they share its limits.
+		Args:
+			read_rate (float): [optional] Reads (get, list, and waiting on operations) per second
+			write_rate (float): [optional] Writes (insert, start, stop ...) per second
+			burst_seconds (float): [optional] How many seconds worth of calls may go through at once
+		"""
+
+		self.buckets = {
+			'read': TokenBucket(read_rate, read_rate * burst_seconds),
+			'write': TokenBucket(write_rate, write_rate * burst_seconds)
+		}
+
+	def reserve(self, reads=0, writes=0):
+		"""
+		This function will take the tokens for the calls without waiting for them, and return how long
+		the caller has to wait before sending them. Coroutines use it to wait with asyncio.sleep instead
+		of blocking the event loop.
+		Args:
+			reads (int): [optional] The number of reads about to be sent
+			writes (int): [optional] The number of writes about to be sent
+		Returns:
+			float: The seconds to wait
+		"""
+
+		wait = 0
+		if reads > 0:
+			wait = max(wait, self.buckets['read'].reserve(reads))
+		if writes > 0:
+			wait = max(wait, self.buckets['write'].reserve(writes))
+		return wait
+
+	def acquire(self, reads=0, writes=0):
+		"""
+		This function will wait until the calls are within the limits.
+		Args:
+			reads (int): [optional] The number of reads about to be sent
+			writes (int): [optional] The number of writes about to be sent
+		Returns:
+			float: The seconds spent waiting
+		"""
+
+		wait = self.reserve(reads, writes)
+		if wait > 0:
+			time.sleep(wait)
+		return wait
+
+	def penalize(self, kind, seconds):
+		"""
+		This function will hold back every call of a kind, after the API reported it is rate limited.
+		Args:
+			kind (str): 'read' or 'write'
+			seconds (float): How long to hold back
+		"""
+
+		self.buckets[kind].drain(seconds)
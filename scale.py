@@ -3,18 +3,59 @@
 	@desc   : This script will scale a Google Cloud Project's rest servers to @param:instance_count.
 	@param  : project (str) name of the google cloud project.
 	@param  : instance_count (int) number of servers to scale to.
-	@param  : zone (str) name of default zone for creating a server.
+	@param  : zone (str) name of default zone for creating a server. New servers are spread over the
+	zones of its region (then other regions) that have quota left, see GoogleCloudClient.plan_placement.
+	@param  : -profile (str) [optional] write the API calls and the time of each step to this file, as
+	json, or in the Prometheus text format if it ends with '.prom', see profiler.py
+	@param  : -inventory (str) [optional] keep the inventory in a local SQLite store between runs, and
+	only fetch what changed since the last run, see inventoryStore.py. The path is optional
+	@param  : -warm_pool (int) [optional] keep this many REST servers SUSPENDED, ready to resume in seconds.
+	Scaling up resumes them before starting stopped servers or creating new ones, scaling down suspends
+	servers until the pool is full, and after scaling the pool is refilled in the background. Only servers
+	whose machine type can be suspended join the pool, see googlecloudclient.can_suspend
+	@param  : -machine_type (str) [optional] the machine type of new REST servers, by default MACHINE_TYPE,
+	or SUSPENDABLE_MACHINE_TYPE with -warm_pool
 
 	Example:
 	>>> python3 scale.py project instance_count zone
+	>>> python3 scale.py project instance_count zone -profile scale.json
+	>>> python3 scale.py project instance_count zone -inventory
+	>>> python3 scale.py project instance_count zone -warm_pool 3
+	>>> python3 scale.py project instance_count zone -warm_pool 3 -machine_type e2-small
 '''
 
-from googlecloudclient import GoogleCloudClient
-from random import randint
-from googleapiclient.errors import HttpError
+from googlecloudclient import GoogleCloudClient, Instance, is_capacity_error, can_suspend, MACHINE_TYPE, SUSPENDABLE_MACHINE_TYPE
+from inventoryStore import InventoryStore, INVENTORY_PATH
 from argparse import ArgumentParser
 from colorama import init, Fore
 from updateLoadBalancer import *
+from healthCheck import probe_backends, can_reach
+import threading
+import time
+
+# Seconds the inventory snapshot is reused for during a run, see GoogleCloudClient
+INVENTORY_CACHE_TTL = 60
+
+# The most REST servers scale will run, unless it is given another limit
+MAX_INSTANCES = 10
+
+# The image new REST servers are created from
+REST_SERVER_IMAGE = 'lab02-restserver'
+
+# The load balancer updated after scaling, in front of the upstream PROXY
+LOAD_BALANCER = 'loadbalancer-0'
+LOAD_BALANCER_ZONE = 'us-central1-c'
+PROXY = 'fibonacci'
+
+# New servers are only added to the load balancer, and servers joining the warm pool only suspended,
+# once their REST server answers. They are probed every SERVER_PROBE_INTERVAL seconds, for at most
+# SERVER_BOOT_TIMEOUT seconds. Outside the project's network they cannot be probed, see
+# probes_reach_servers, and new servers are not waited for
+SERVER_PROBE_INTERVAL = 2
+SERVER_BOOT_TIMEOUT = 180
+# Seconds a server joining the warm pool gets to run its startup script once it is RUNNING, when it
+# cannot be probed
+SERVER_BOOT_GRACE = 30
 
 def need_to_scale_down(instance_count, num_running_instances):
 	return instance_count < num_running_instances
@@ -28,7 +69,131 @@ def done_scaling(instance_count, num_running_instances):
 def still_need_to_scale(instance_count, num_running_instances):
 	return instance_count != num_running_instances
 
-def scale(project, instance_count, zone):
+def instance_locations(instances):
+	return [(instance['name'], instance['zone'].rsplit('/', 1)[-1]) for instance in instances]
+
+def suspendable(instance):
+	# Instances cached before the machine type was read are taken to be of the default type
+	return can_suspend(instance.get('machineType', MACHINE_TYPE))
+
+def new_server_machine_type(machine_type, warm_pool):
+	# Servers taken out of service join the warm pool, so with a pool new servers must be able to suspend
+	if machine_type is None:
+		return SUSPENDABLE_MACHINE_TYPE if warm_pool > 0 else MACHINE_TYPE
+	return machine_type
+
+def wait_until_serving(client, instances, timeout=SERVER_BOOT_TIMEOUT):
+	"""
+	This function will wait until the REST servers of running instances answer their health check, see
+	healthCheck.py, or until the timeout.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+		instances (list): (name, zone) tuples of the instances
+		timeout (float): [optional] The most seconds to wait
+	Returns:
+		list (str): The names of the instances that did not answer in time
+	"""
+	ips = {Instance.from_json(data).internal_ip: name for (name, _), data in zip(instances, client.get_instances_data([(zone, name) for name, zone in instances]))}
+	deadline = time.monotonic() + timeout
+	while len(ips) > 0 and time.monotonic() < deadline:
+		health = probe_backends(list(ips))
+		ips = {ip: name for ip, name in ips.items() if health[ip] is None}
+		if len(ips) > 0:
+			time.sleep(SERVER_PROBE_INTERVAL)
+	return sorted(ips.values())
+
+def probes_reach_servers(client):
+	"""
+	This function will tell whether the health checks can reach the REST servers' network, by
+	connecting to the load balancer's internal ip, see healthCheck.can_reach. From a workstation
+	outside the network no server would ever answer.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+	Returns:
+		bool: True if this host is inside the project's network
+	"""
+	from googleapiclient.errors import HttpError
+	try:
+		ip = Instance.from_json(client.get_instance_data(LOAD_BALANCER_ZONE, LOAD_BALANCER)).internal_ip
+	except HttpError:
+		return False
+	return ip is not None and can_reach(ip)
+
+def wait_for_new_servers(client, new_servers, reachable):
+	"""
+	This function will wait until the servers just started, resumed or created answer their health
+	check, so the load balancer update lists them, see wait_until_serving. If the checks cannot reach
+	the servers' network, the load balancer lists every running server anyway, so it does not wait.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+		new_servers (list): (name, zone) tuples of the new servers
+		reachable (bool): Whether the checks reach the servers, see probes_reach_servers
+	Returns:
+		list (str): The names of the new servers that did not answer in time
+	"""
+	if len(new_servers) == 0 or not reachable:
+		return []
+	print('{:<70}'.format('Waiting for {} new REST servers to answer ...'.format(len(new_servers))), end='', flush=True),
+	with client.profiler.phase('wait for new servers'):
+		not_serving = wait_until_serving(client, new_servers, SERVER_BOOT_TIMEOUT)
+	if len(not_serving) == 0:
+		print(Fore.GREEN + '[COMPLETE]')
+	else:
+		print(Fore.YELLOW + '[WARNING]')
+		print(Fore.CYAN + 'Not answering yet, listed as backup servers until the next update: {}'.format(', '.join(not_serving)))
+	return not_serving
+
+def refill_warm_pool(client, size, zone, machine_type=SUSPENDABLE_MACHINE_TYPE, reachable=None):
+	"""
+	This function will bring the number of SUSPENDED REST servers up to size. Stopped servers that can be
+	suspended are started, and new servers created if there are not enough, then each is suspended once
+	its REST server answers. If the checks cannot reach the servers, each is suspended SERVER_BOOT_GRACE
+	seconds after it is RUNNING instead. Servers that still fail to suspend are stopped.
+	Args:
+		client (obj): An instantiated GoogleCloudClient object
+		size (int): How many REST servers the pool should hold
+		zone (str): The preferred zone for new servers
+		machine_type (str): [optional] The machine type of new servers, one that can be suspended
+		reachable (bool): [optional] Whether the checks reach the servers, by default see probes_reach_servers
+	Returns:
+		list (str): The names of the servers added to the pool
+	"""
+	missing = size - len(client.get_rest_servers('SUSPENDED'))
+	if missing <= 0:
+		return []
+	warming = []
+	stopped = instance_locations([instance for instance in client.get_rest_servers('TERMINATED') if suspendable(instance)][:missing])
+	for (name, zone_name), result in zip(stopped, client.start_instances(stopped)):
+		if result.error is None:
+			warming.append((name, zone_name))
+	if len(stopped) < missing:
+		names = client.next_rest_server_names(missing - len(stopped))
+		placements = list(zip(names, client.plan_placement(len(names), zone)))
+		for placement, result in zip(placements, client.create_instances_from_image(REST_SERVER_IMAGE, placements, machine_type=machine_type)):
+			if result.error is None:
+				warming.append(placement)
+			else:
+				client.release_placement([placement[1]])
+	if len(warming) > 0:
+		if reachable is None:
+			reachable = probes_reach_servers(client)
+		if reachable:
+			wait_until_serving(client, warming, SERVER_BOOT_TIMEOUT)
+		else:
+			# The operations finished, so the servers are RUNNING
+			time.sleep(SERVER_BOOT_GRACE)
+	added = []
+	failed = []
+	for (name, zone_name), result in zip(warming, client.suspend_instances(warming)):
+		if result.error is None:
+			added.append(name)
+		else:
+			failed.append((name, zone_name))
+	# A server that could not be suspended must not keep running unseen
+	client.stop_instances(failed)
+	return added
+
+def scale(project, instance_count, zone, client=None, transport=None, warm_pool=0, max_instances=MAX_INSTANCES, machine_type=None):
 	"""
 	This function will scale a Google Cloud project horizontally, so that instance_count
 	number of instances are running.
@@ -36,81 +201,186 @@ def scale(project, instance_count, zone):
 		project (str): The name of the GCP project
 		instance_count (int): The number of instances to scale to
 		zone (str): If an instance needs to be created, it will be in this zone
+		client (obj): [optional] A GoogleCloudClient to use instead of creating one
+		transport (obj): [optional] How to push the load balancer config, see updateLoadBalancer.py
+		warm_pool (int): [optional] How many REST servers to keep SUSPENDED, see refill_warm_pool
+		max_instances (int): [optional] The most instances it may scale to
+		machine_type (str): [optional] The machine type of new servers, see new_server_machine_type
 	Returns:
-		Nothing
+		Thread: The thread refilling the warm pool, or None
 	"""
-	if instance_count > 10:
-		print(Fore.CYAN + 'You may only scale up to 10 instances. Exiting ...')
+	if instance_count > max_instances:
+		print(Fore.CYAN + 'You may only scale up to {} instances. Exiting ...'.format(max_instances))
+		return
+	machine_type = new_server_machine_type(machine_type, warm_pool)
+	if warm_pool > 0 and not can_suspend(machine_type):
+		print(Fore.CYAN + '{} servers cannot be suspended, so they cannot fill a warm pool. Exiting ...'.format(machine_type))
 		return
 
 	print('Scaling project {} to {} rest servers'.format(project, str(instance_count)))
-	c = GoogleCloudClient(project)
+	c = client or GoogleCloudClient(project, cache_ttl=INVENTORY_CACHE_TTL)
+	# The quotas' usage may have changed since the last run of a long-lived client
+	c.reset_placement()
 	print('{:<70}'.format('Searching for running REST servers ...'), end='', flush=True),
-	running_rest_servers = c.get_rest_servers('RUNNING')
+	with c.profiler.phase('find running servers'):
+		running_rest_servers = c.get_rest_servers('RUNNING')
 	print(Fore.GREEN + '[COMPLETE]')
 	num_running_rest_servers = len(running_rest_servers)
 	print('REST servers running: {}'.format(str(num_running_rest_servers)))
+	# (name, zone) of the servers resumed, started or created, waited for before the load balancer update
+	new_servers = []
 
 	if need_to_scale_up(instance_count, num_running_rest_servers):
 		print('Scaling up ...')
+		print('{:<70}'.format('Searching for suspended REST servers ...'), end='', flush=True),
+		with c.profiler.phase('find suspended servers'):
+			suspended_rest_servers = c.get_rest_servers('SUSPENDED')
+		print(Fore.GREEN + '[COMPLETE]')
+		# Resuming skips the boot and the startup script, so the warm pool is used first
+		instances_to_resume = suspended_rest_servers[:instance_count - num_running_rest_servers]
+		if len(instances_to_resume) > 0:
+			print('{:<70}'.format('Resuming {} suspended REST servers ...'.format(len(instances_to_resume))), end='', flush=True),
+			with c.profiler.phase('resume suspended servers'):
+				results = c.resume_instances(instance_locations(instances_to_resume))
+			print(Fore.GREEN + '[COMPLETE]')
+			for location, result in zip(instance_locations(instances_to_resume), results):
+				print('{:<70}'.format('Resuming {}'.format(result.name)), end='', flush=True),
+				if result.error is None:
+					print(Fore.GREEN + '[COMPLETE]')
+					num_running_rest_servers += 1
+					new_servers.append(location)
+				else:
+					print(Fore.RED + '[FAILED]')
+	if need_to_scale_up(instance_count, num_running_rest_servers):
 		print('{:<70}'.format('Searching for stopped REST servers ...'), end='', flush=True),
-		stopped_rest_servers = c.get_rest_servers('TERMINATED')
+		with c.profiler.phase('find stopped servers'):
+			stopped_rest_servers = c.get_rest_servers('TERMINATED')
 		print(Fore.GREEN + '[COMPLETE]')
-		while still_need_to_scale(instance_count, num_running_rest_servers):
-			if len(stopped_rest_servers) > 0: # Do we have any servers we can start?
-				instance_to_start = stopped_rest_servers.pop()
-				zone_name = instance_to_start['zone'].rsplit('/', 1)[-1]
-				instance_name = instance_to_start['name']
-				print('{:<70}'.format('Starting {}'.format(instance_name)), end='', flush=True),
-				operation = c.start_instance(instance_name, zone_name)
-				result = c.wait_for_operation(operation)
-				if result['status'] == 'DONE':
+		# Start as many stopped servers as we can, all at once
+		instances_to_start = stopped_rest_servers[:instance_count - num_running_rest_servers]
+		if len(instances_to_start) > 0:
+			print('{:<70}'.format('Starting {} stopped REST servers ...'.format(len(instances_to_start))), end='', flush=True),
+			with c.profiler.phase('start stopped servers'):
+				results = c.start_instances(instance_locations(instances_to_start))
+			print(Fore.GREEN + '[COMPLETE]')
+			for location, result in zip(instance_locations(instances_to_start), results):
+				print('{:<70}'.format('Starting {}'.format(result.name)), end='', flush=True),
+				if result.error is None:
 					print(Fore.GREEN + '[COMPLETE]')
 					num_running_rest_servers += 1
+					new_servers.append(location)
 				else:
 					print(Fore.RED + '[FAILED]')
-			else: # No servers are available to start, create one
-				print('All stopped REST servers have been started'),
-				print('{:<70}'.format('Creating a new REST server in {} ...'.format(zone)), end='', flush=True),
-				try:
-					operation = c.create_instance_from_image('lab02-restserver', zone)
-					result = c.wait_for_operation(operation)
-				except HttpError:
-					print(Fore.YELLOW + '[WARNING]')
-					print(Fore.CYAN + 'Cannot create instance in {}. It has reached it\'s quota.'.format(zone))
-					print('{:<70}'.format('Choosing alternate zone ... '), end='', flush=True),
-					zones = c.get_zone_names_list()
-					zone = zones[randint(0, len(zones) - 1)]
+		# No servers are available to start, create the rest
+		failed_zones = []
+		if still_need_to_scale(instance_count, num_running_rest_servers):
+			print('All stopped REST servers have been started'),
+			with c.profiler.phase('name new servers'):
+				names = c.next_rest_server_names(instance_count - num_running_rest_servers)
+		while still_need_to_scale(instance_count, num_running_rest_servers):
+			# Choose zones that have quota left before sending any insert
+			print('{:<70}'.format('Planning zones for {} new REST servers ...'.format(len(names))), end='', flush=True),
+			with c.profiler.phase('plan placement'):
+				zones = c.plan_placement(len(names), zone, exclude=failed_zones)
+			print(Fore.GREEN + '[COMPLETE]')
+			if len(zones) < len(names):
+				print(Fore.CYAN + 'Only {} of {} new REST servers fit within the project\'s quotas.'.format(len(zones), len(names)))
+			if len(zones) == 0:
+				break
+			placements = list(zip(names, zones))
+			print('{:<70}'.format('Creating {} new REST servers in {} ...'.format(len(placements), ', '.join(sorted(set(zones))))), end='', flush=True),
+			with c.profiler.phase('create servers'):
+				results = c.create_instances_from_image(REST_SERVER_IMAGE, placements, machine_type=machine_type)
+			print(Fore.GREEN + '[COMPLETE]')
+			names = []
+			for (name, zone_name), result in zip(placements, results):
+				print('{:<70}'.format('Creating {} in {}'.format(name, zone_name)), end='', flush=True),
+				if result.error is None:
 					print(Fore.GREEN + '[COMPLETE]')
-					print('Selected {} as the alternate zone'.format(zone))
+					num_running_rest_servers += 1
+					new_servers.append((name, zone_name))
+				elif is_capacity_error(result.error):
+					# Try again elsewhere, the zone is out of quota or resources
+					c.release_placement([zone_name])
+					print(Fore.YELLOW + '[WARNING]')
+					print(Fore.CYAN + str(result.error))
+					names.append(name)
+					failed_zones.append(zone_name)
 				else:
-					if result['status'] == 'DONE':
-						print(Fore.GREEN + '[COMPLETE]')
-						num_running_rest_servers += 1
+					# Transient errors were already retried by the client, another zone will not help
+					c.release_placement([zone_name])
+					print(Fore.RED + '[FAILED]')
+					print(Fore.CYAN + str(result.error))
 
 	if need_to_scale_down(instance_count, num_running_rest_servers):
 		print('Scaling down ...')
-		while still_need_to_scale(instance_count, num_running_rest_servers):
-			print('{:<70}'.format('Searching for the longest running server ...'), end='', flush=True),
-			instance_to_stop = c.get_oldest_running_rest_server()
+		print('{:<70}'.format('Searching for the longest running servers ...'), end='', flush=True),
+		with c.profiler.phase('find oldest servers'):
+			instances_to_stop = c.get_oldest_running_rest_servers(num_running_rest_servers - instance_count)
+		print(Fore.GREEN + '[COMPLETE]')
+		# Servers taken out of service fill the warm pool first, if they can be suspended, the rest are stopped
+		pool_room = max(0, warm_pool - len(c.get_rest_servers('SUSPENDED'))) if warm_pool > 0 else 0
+		instances_to_suspend = instance_locations([instance for instance in instances_to_stop if suspendable(instance)][:pool_room])
+		instances_to_stop = [location for location in instance_locations(instances_to_stop) if location not in instances_to_suspend]
+		if len(instances_to_suspend) > 0:
+			print('{:<70}'.format('Suspending {} REST servers into the warm pool ...'.format(len(instances_to_suspend))), end='', flush=True),
+			with c.profiler.phase('suspend servers'):
+				results = c.suspend_instances(instances_to_suspend)
 			print(Fore.GREEN + '[COMPLETE]')
-			zone_name = instance_to_stop['zone'].rsplit('/', 1)[-1]
-			instance_name = instance_to_stop['targetLink'].rsplit('/', 1)[-1]
-			print('{:<70}'.format('Stopping {}'.format(instance_name)), end='', flush=True),
-			operation = c.stop_instance(instance_name, zone_name)
-			result = c.wait_for_operation(operation)
-			if result['status'] == 'DONE':
+			for (name, zone_name), result in zip(instances_to_suspend, results):
+				print('{:<70}'.format('Suspending {}'.format(result.name)), end='', flush=True),
+				if result.error is None:
+					print(Fore.GREEN + '[COMPLETE]')
+					num_running_rest_servers -= 1
+				else:
+					print(Fore.YELLOW + '[WARNING]')
+					instances_to_stop.append((name, zone_name))
+		print('{:<70}'.format('Stopping {} REST servers ...'.format(len(instances_to_stop))), end='', flush=True),
+		with c.profiler.phase('stop servers'):
+			results = c.stop_instances(instances_to_stop)
+		print(Fore.GREEN + '[COMPLETE]')
+		for result in results:
+			print('{:<70}'.format('Stopping {}'.format(result.name)), end='', flush=True),
+			if result.error is None:
 				print(Fore.GREEN + '[COMPLETE]')
 				num_running_rest_servers -= 1
+			else:
+				print(Fore.RED + '[FAILED]')
 
+	reachable = None
+	if len(new_servers) > 0:
+		with c.profiler.phase('check network'):
+			reachable = probes_reach_servers(c)
+		wait_for_new_servers(c, new_servers, reachable)
 	print('Initializing upstream update on nginx load balancer')
-	update_load_balancer_upstream(c, 'us-central1-c', 'loadbalancer-0', 'fibonacci')
+	with c.profiler.phase('update load balancer'):
+		update_load_balancer_upstream(c, LOAD_BALANCER_ZONE, LOAD_BALANCER, PROXY, transport=transport)
 	print('{:<70}'.format('Scaling project {} to {} rest servers ...'.format(project, str(instance_count))), end='', flush=True),
 	print(Fore.GREEN + '[COMPLETE]')
+	if warm_pool > 0:
+		# The servers are already serving, the pool is refilled behind them
+		print('Refilling the warm pool to {} suspended REST servers in the background'.format(warm_pool))
+		refill = threading.Thread(target=_timed_refill, args=(c, warm_pool, zone, machine_type, reachable))
+		refill.start()
+		return refill
+	return None
+
+def _timed_refill(client, size, zone, machine_type, reachable):
+	with client.profiler.phase('refill warm pool'):
+		added = refill_warm_pool(client, size, zone, machine_type, reachable)
+	print('{:<70}'.format('Warm pool refilled with {} REST servers ...'.format(len(added))), end='', flush=True),
+	print(Fore.GREEN + '[COMPLETE]')
 
-def main(project, instance_count, zone):
+def main(project, instance_count, zone, profile=None, inventory=None, warm_pool=0, machine_type=None):
 	init(autoreset=True)
-	scale(project, instance_count, zone)
+	client = GoogleCloudClient(project, cache_ttl=INVENTORY_CACHE_TTL, inventory=None if inventory is None else InventoryStore(inventory))
+	try:
+		refill = scale(project, instance_count, zone, client, warm_pool=warm_pool, machine_type=machine_type)
+		if refill is not None:
+			refill.join()
+	finally:
+		if profile is not None:
+			client.profiler.dump(profile, 'scale')
 
 if __name__ == "__main__":
 	parser = ArgumentParser(description='This script will scale a Google Cloud project\'s rest servers \
@@ -118,5 +388,9 @@ if __name__ == "__main__":
 	parser.add_argument('project', help='The name of your google cloud project')
 	parser.add_argument('instance_count', help='The number of instances to scale to')
 	parser.add_argument('zone', help='The zone to create an instance in, if needed')
+	parser.add_argument('-profile', help='Write a profile of the API calls to this file, .json or .prom')
+	parser.add_argument('-inventory', nargs='?', const=INVENTORY_PATH, help='Keep the inventory in a local store, at this path if given')
+	parser.add_argument('-warm_pool', type=int, default=0, help='The number of REST servers to keep suspended, ready to resume')
+	parser.add_argument('-machine_type', help='The machine type of new REST servers, one that can be suspended with -warm_pool')
 	args = parser.parse_args()
-	main(args.project, int(args.instance_count), args.zone)
\ No newline at end of file
+	main(args.project, int(args.instance_count), args.zone, args.profile, args.inventory, args.warm_pool, args.machine_type)
\ No newline at end of file
@@ -1,36 +1,266 @@
 """
 	@file   : sendEmail.py
-	@desc   : This function will send an email
+	@desc   : send_email will send an email, and a Notifier sends emails in the background. A Notifier
+	queues notifications and sends them as one digest per NOTIFY_WINDOW seconds, so a script that
+	notifies about every event is not held up by the mail server, and does not send a mail per event.
+	Failed sends are retried with backoff, and a Notifier sends what it still holds when the script exits.
 	@param  : subject (str) subject of the email
 	@param  : content (any type convertable to a str) content of the email
 	@param  : from_email (str) sender of the email
 	@param  : to_email (str) recipient of the email
 	NOTE    : Your SENDGRID_API_KEY must be set in your environment. See their website
-	for details.
+	for details. LocalSink stands in for sendgrid in tests.
+
+	Example:
+	>>> send_email('Instances Shut Down', ['restserver-1'], 'sender@gmail.com', 'recipient@gmail.com')
+	>>> notifier = Notifier('sender@gmail.com', 'recipient@gmail.com')
+	>>> notifier.notify('Scaled to 4 REST servers', 'from 3, 210 requests per second')
+	>>> notifier.close()
 """
 
-import sendgrid
 import os
-from sendgrid.helpers.mail import *
+import json
+import time
+import random
+import atexit
+import threading
 from colorama import init, Fore
-from python_http_client.exceptions import UnauthorizedError
 
-def send_email(subject, email_content, from_email, to_email):
+# Seconds a Notifier gathers notifications for before sending them as one digest, and the most
+# notifications in a digest
+NOTIFY_WINDOW = 60
+NOTIFY_MAX_EVENTS = 100
+# Sends that fail with a transient error are tried up to NOTIFY_MAX_ATTEMPTS times, waiting a random
+# time of up to NOTIFY_INITIAL_DELAY * 2 ** attempt seconds, at most NOTIFY_MAX_DELAY, in between
+NOTIFY_MAX_ATTEMPTS = 5
+NOTIFY_INITIAL_DELAY = 1
+NOTIFY_MAX_DELAY = 30
+# Http statuses worth sending again
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+class SendError(Exception):
+
+	def __init__(self, status_code, message=''):
+		super().__init__('The email was not sent ({}) {}'.format(status_code, message).strip())
+		self.status_code = status_code
+
+class SendGridBackend:
+
+	def __init__(self, api_key=None):
+		"""
+		The constructor will set up sending with sendgrid. The client is made by the first send, and
+		reused by the ones after it.
+		Args:
+			api_key (str): [optional] The sendgrid api key, by default SENDGRID_API_KEY from the environment
+		"""
+
+		self.api_key = api_key
+		self._client = None
+		self._lock = threading.Lock()
+
+	def send(self, subject, email_content, from_email, to_email):
+		# sendgrid is slow to import, so it is only imported once an email is sent
+		import sendgrid
+		from sendgrid.helpers.mail import Email, Content, Mail
+		with self._lock:
+			if self._client is None:
+				self._client = sendgrid.SendGridAPIClient(apikey=self.api_key or os.environ.get('SENDGRID_API_KEY'))
+		mail = Mail(Email(from_email), subject, Email(to_email), Content("text/plain", str(email_content)))
+		response = self._client.client.mail.send.post(request_body=mail.get())
+		if response.status_code not in (200, 201, 202):
+			raise SendError(response.status_code)
+
+class LocalSink:
+
+	def __init__(self, path=None, failures=0):
+		"""
+		The constructor will set up a backend that keeps the emails instead of sending them, for tests.
+		Args:
+			path (str): [optional] Also append each email to this file, as a line of json
+			failures (int): [optional] How many sends fail with a transient error before they succeed
+		"""
+
+		self.path = path
+		self.failures = failures
+		self.sent = []
+		self._lock = threading.Lock()
+
+	def send(self, subject, email_content, from_email, to_email):
+		email = {'time': time.time(), 'subject': subject, 'content': str(email_content), 'from': from_email, 'to': to_email}
+		with self._lock:
+			if self.failures > 0:
+				self.failures -= 1
+				raise SendError(503, 'LocalSink failure')
+			self.sent.append(email)
+			if self.path is not None:
+				with open(self.path, 'a') as sink:
+					sink.write(json.dumps(email) + '\n')
+
+# Shared by every send_email call and Notifier that is not given a backend
+default_backend = SendGridBackend()
+
+def is_transient_send_error(error):
+	"""
+	This function will tell whether a failed send is worth trying again.
+	Args:
+		error (Exception): What the send raised
+	Returns:
+		bool: True for rate limits, server errors, and network errors
+	"""
+
+	# python_http_client's HTTPError has the status as status_code, urllib's as code
+	status = getattr(error, 'status_code', getattr(error, 'code', None))
+	if status is not None:
+		return status in TRANSIENT_STATUSES
+	return isinstance(error, OSError)
+
+def send_with_retry(backend, subject, email_content, from_email, to_email, max_attempts=NOTIFY_MAX_ATTEMPTS):
+	"""
+	This function will send an email, trying transient failures again with backoff, see is_transient_send_error.
+	Args:
+		backend (obj): What sends the email, a SendGridBackend or a LocalSink
+		max_attempts (int): [optional] The most times to try
+	Returns:
+		Nothing, the last error is raised if every attempt failed
+	"""
+
+	for attempt in range(max_attempts):
+		try:
+			return backend.send(subject, email_content, from_email, to_email)
+		except Exception as error:
+			if attempt == max_attempts - 1 or not is_transient_send_error(error):
+				raise
+			time.sleep(random.uniform(0, min(NOTIFY_MAX_DELAY, NOTIFY_INITIAL_DELAY * 2 ** attempt)))
+
+def send_email(subject, email_content, from_email, to_email, backend=None):
+	from python_http_client.exceptions import UnauthorizedError
 	print('{:<70}'.format('Sending email from {} to {}'.format(from_email, to_email)), end='', flush=True),
-	sg = sendgrid.SendGridAPIClient(apikey=os.environ.get('SENDGRID_API_KEY'))
-	from_email = Email(from_email)
-	to_email = Email(to_email)
-	subject = subject
-	content = Content("text/plain", email_content)
-	mail = Mail(from_email, subject, to_email, content)
 	try:
-		response = sg.client.mail.send.post(request_body=mail.get())
-		if response.status_code in (200, 201, 202):
-			print(Fore.GREEN + '[COMPLETE]')
-			print(Fore.WHITE + 'Subject: {}'.format(subject))
-			print(Fore.WHITE + 'Content: {}'.format(email_content))
-		else:
-			print(Fore.RED + '[FAILED]')
+		send_with_retry(backend or default_backend, subject, email_content, from_email, to_email)
+		print(Fore.GREEN + '[COMPLETE]')
+		print(Fore.WHITE + 'Subject: {}'.format(subject))
+		print(Fore.WHITE + 'Content: {}'.format(email_content))
 	except UnauthorizedError:
 		print(Fore.RED + '[FAILED]')
-		print(Fore.CYAN + 'Did you remember to set your sendgrid api key?')
\ No newline at end of file
+		print(Fore.CYAN + 'Did you remember to set your sendgrid api key?')
+	except Exception as error:
+		print(Fore.RED + '[FAILED]')
+		print(Fore.CYAN + str(error))
+
+def digest(notifications):
+	"""
+	This function will combine notifications into one email. A single notification is sent as it is.
+	Args:
+		notifications (list): (time, subject, content) tuples
+	Returns:
+		tuple (str, str): The subject and content of the email
+	"""
+
+	if len(notifications) == 1:
+		return notifications[0][1], notifications[0][2]
+	subjects = list(dict.fromkeys(subject for _, subject, _ in notifications))
+	subject = '{} notifications: {}'.format(len(notifications), '; '.join(subjects[:3]) + ('; ...' if len(subjects) > 3 else ''))
+	content = '\n\n'.join('{} {}\n{}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sent)), subject, content).rstrip()
+		for sent, subject, content in notifications)
+	return subject, content
+
+class Notifier:
+
+	def __init__(self, from_email, to_email, backend=None, window=NOTIFY_WINDOW, max_events=NOTIFY_MAX_EVENTS):
+		"""
+		The constructor will start the thread that sends the digests. What is still queued when the
+		script exits is sent then, see close.
+		Args:
+			from_email (str): The sender of the emails
+			to_email (str): The recipient of the emails
+			backend (obj): [optional] What sends the emails, by default sendgrid, see LocalSink for tests
+			window (float): [optional] Seconds to gather notifications for, from the first one queued
+			max_events (int): [optional] A digest is sent straight away once it has this many notifications
+		"""
+
+		self.from_email = from_email
+		self.to_email = to_email
+		self.backend = backend or default_backend
+		self.window = window
+		self.max_events = max_events
+		self._pending = []
+		self._first_at = None
+		self._sending = 0
+		self._flush = False
+		self._closed = False
+		self._condition = threading.Condition()
+		self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+		self._thread.start()
+		atexit.register(self.close)
+
+	def notify(self, subject, content=''):
+		"""
+		This function will queue a notification, and return straight away.
+		Args:
+			subject (str): What happened
+			content (any type convertable to a str): [optional] The details
+		"""
+
+		with self._condition:
+			if self._closed:
+				raise RuntimeError('The notifier is closed')
+			if len(self._pending) == 0:
+				self._first_at = time.monotonic()
+			self._pending.append((time.time(), subject, str(content)))
+			self._condition.notify_all()
+
+	def flush(self, timeout=None):
+		"""
+		This function will send what is queued now, without waiting for the window to end.
+		Args:
+			timeout (float): [optional] The most seconds to wait for it to be sent
+		Returns:
+			bool: True if everything queued was sent, or failed for good
+		"""
+
+		with self._condition:
+			# With nothing queued there is nothing to send now, the next notification waits for its window
+			self._flush = len(self._pending) > 0
+			self._condition.notify_all()
+			return self._condition.wait_for(lambda: len(self._pending) == 0 and self._sending == 0, timeout)
+
+	def close(self, timeout=None):
+		"""
+		This function will send what is queued and stop the thread. It is called when the script exits.
+		Args:
+			timeout (float): [optional] The most seconds to wait
+		"""
+
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+		self._thread.join(timeout)
+		atexit.unregister(self.close)
+
+	def _run(self):
+		while True:
+			with self._condition:
+				self._condition.wait_for(lambda: len(self._pending) > 0 or self._closed)
+				if len(self._pending) == 0:
+					return
+				# Gather until the window ends, unless asked to send now
+				while not (self._closed or self._flush or len(self._pending) >= self.max_events):
+					remaining = self._first_at + self.window - time.monotonic()
+					if remaining <= 0:
+						break
+					self._condition.wait(remaining)
+				notifications = self._pending[:self.max_events]
+				self._pending = self._pending[self.max_events:]
+				self._first_at = time.monotonic()
+				self._flush = self._flush and len(self._pending) > 0
+				self._sending = len(notifications)
+			subject, content = digest(notifications)
+			try:
+				send_with_retry(self.backend, subject, content, self.from_email, self.to_email)
+				print('{:<70}'.format('Sent {} notifications to {}'.format(len(notifications), self.to_email)) + Fore.GREEN + '[COMPLETE]')
+			except Exception as error:
+				print('{:<70}'.format('Sending {} notifications to {}'.format(len(notifications), self.to_email)) + Fore.RED + '[FAILED]')
+				print(Fore.CYAN + str(error))
+			with self._condition:
+				self._sending = 0
+				self._condition.notify_all()
@@ -0,0 +1,80 @@
+from google.auth.credentials import AnonymousCredentials
+from asyncgooglecloudclient import AsyncGoogleCloudClient
+from fakeCompute import seed
+from rateLimiter import RateLimiter
+import asyncio
+import time
+
+def async_client(fake):
+	return AsyncGoogleCloudClient('p', credentials=AnonymousCredentials(), api_endpoint=fake.url)
+
+def test_creates_at_the_same_time_get_their_own_names(fake, tmp_path, monkeypatch):
+	seed(fake, 'p', 4, 2)
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'startup.sh').write_text('#!/bin/bash\n')
+
+	async def create(count):
+		async with async_client(fake) as client:
+			return await asyncio.gather(*[client.create_instance_from_image('lab02-restserver', 'us-central1-c') for _ in range(count)])
+
+	operations = asyncio.run(create(5))
+	names = sorted(operation['targetLink'].rsplit('/', 1)[-1] for operation in operations)
+	assert names == ['restserver-{}'.format(number) for number in range(2, 7)]
+
+def test_writes_carry_a_request_id(fake, tmp_path, monkeypatch):
+	seed(fake, 'p', 3, 2, 0, 'TERMINATED')
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'startup.sh').write_text('#!/bin/bash\n')
+	sent = []
+
+	async def write():
+		async with async_client(fake) as client:
+			request = client._request
+
+			async def record(method, path, params=None, body=None):
+				sent.append((method, path, dict(params or {})))
+				return await request(method, path, params, body)
+
+			client._request = record
+			await client.start_instance('restserver-0', 'us-central1-b')
+			await client.stop_instance('restserver-0', 'us-central1-b')
+			await client.create_instance_from_image('lab02-restserver', 'us-central1-c', 'restserver-9')
+
+	asyncio.run(write())
+	writes = [params for method, _, params in sent if method == 'POST']
+	assert len(writes) == 3
+	assert len(set(params['requestId'] for params in writes)) == 3
+
+def test_operation_waits_do_not_hold_up_other_requests(fake):
+	fake.operation_duration = 1
+	seed(fake, 'p', 5, 4, 0, 'TERMINATED')
+
+	async def start_and_list():
+		async with AsyncGoogleCloudClient('p', credentials=AnonymousCredentials(), api_endpoint=fake.url, max_connections=2) as client:
+			servers = [(instance['name'], instance['zone'].rsplit('/', 1)[-1]) for instance in await client.get_rest_servers('TERMINATED')]
+			starting = asyncio.ensure_future(client.start_instances(servers))
+			await asyncio.sleep(0.3)
+			# Two connections, and four operations waited on, a listing still goes through at once
+			start = time.perf_counter()
+			await client.get_zone_names_list()
+			listed = time.perf_counter() - start
+			return listed, await starting
+
+	listed, results = asyncio.run(start_and_list())
+	assert listed < 0.5
+	assert [result.error for result in results] == [None] * 4
+
+def test_calls_take_from_a_shared_rate_limiter(fake):
+	seed(fake, 'p', 3, 2, 0, 'TERMINATED')
+	limiter = RateLimiter(read_rate=100, write_rate=1, burst_seconds=1)
+
+	async def start():
+		async with AsyncGoogleCloudClient('p', credentials=AnonymousCredentials(), api_endpoint=fake.url, rate_limiter=limiter) as client:
+			await client.start_instance('restserver-0', 'us-central1-b')
+			start = time.perf_counter()
+			await client.stop_instance('restserver-0', 'us-central1-b')
+			return time.perf_counter() - start
+
+	# The second write waits for the token the first one took, and a client sharing the limiter waits behind it
+	assert asyncio.run(start()) >= 0.9
+	assert limiter.reserve(writes=1) > 0.5
@@ -0,0 +1,74 @@
+from autoscaler import Autoscaler, RequestLogSource, replay, run
+from sendEmail import Notifier, LocalSink
+from fakeCompute import seed
+import pytest
+import json
+import scale
+import os
+
+def test_rate_covers_an_observation_that_spans_a_long_scale():
+	autoscaler = Autoscaler(target_rps=50)
+	now = 0
+	autoscaler.observe(now, 0)
+	for _ in range(4):
+		now += 15
+		autoscaler.observe(now, 100 * 15)
+	assert autoscaler.load(now)[0] == pytest.approx(100)
+	# The read after a 200 second scale holds 200 seconds of the same traffic, not a burst
+	now += 200
+	autoscaler.observe(now, 100 * 200)
+	assert autoscaler.load(now)[0] == pytest.approx(100)
+	assert autoscaler.decide(now, 2) is None
+
+def test_replay_follows_the_traffic(tmp_path):
+	log = tmp_path / 'requests.log'
+	with open(log, 'w') as requests:
+		# 60 requests per second for 5 minutes, then 240 per second for 5 minutes
+		for second in range(600):
+			for _ in range(60 if second < 300 else 240):
+				requests.write(json.dumps({'time': 1000 + second, 'request_time': 0.05, 'status': 200}) + '\n')
+	decisions = replay(str(log), Autoscaler(target_rps=50), interval=30)
+	scaled = [decision['desired'] for decision in decisions if decision['desired'] is not None]
+	assert scaled[0] == 2
+	assert scaled[-1] == 5
+
+def test_request_log_moved_away_by_logrotate_is_read_from_its_start(tmp_path):
+	log = tmp_path / 'requests.log'
+	line = json.dumps({'time': 1000, 'request_time': 0.05, 'status': 200}) + '\n'
+	log.write_text(line * 5)
+	source = RequestLogSource(str(log))
+	with open(log, 'a') as requests:
+		requests.write(line * 2)
+	assert source.read()[0] == 2
+	# The new log is already longer than where the old one was read up to
+	os.rename(log, tmp_path / 'requests.log.1')
+	log.write_text(line * 20)
+	assert source.read()[0] == 20
+
+class SteadySource:
+
+	def __init__(self, requests):
+		self.requests = requests
+
+	def read(self):
+		return self.requests, []
+
+def test_run_survives_a_failed_scale(fake, new_client, monkeypatch):
+	seed(fake, 'p', 2, 1)
+	attempts = []
+
+	def fail(*args, **kwargs):
+		attempts.append(args[1])
+		raise ConnectionError('ssh: connect to host 35.0.0.2 port 22: Connection timed out')
+
+	monkeypatch.setattr(scale, 'scale', fail)
+	sink = LocalSink()
+	notifier = Notifier('from@example.com', 'to@example.com', sink, window=60)
+	autoscaler = Autoscaler(target_rps=50)
+	# 30 requests in each 0.1 second interval, about 300 per second
+	run(new_client(), 'us-central1-c', SteadySource(30), autoscaler, interval=0.1, checks=3, notifier=notifier)
+	# The cooldown only starts once a scaling is done, so each interval tries again
+	assert len(attempts) == 3 and min(attempts) > 1
+	notifier.flush(5)
+	notifier.close(5)
+	assert sink.sent[0]['subject'].startswith('3 notifications: p failed to scale to ')
@@ -0,0 +1,50 @@
+"""
+	@file : test_fakes.py
+	@desc : Checks of the stand-ins the other tests and benchmark.py run against: fakeCompute.py for the
+	compute API, LocalTransport for the load balancer, and LocalSink for email.
+"""
+
+from googleapiclient.errors import HttpError
+from fakeCompute import seed
+from sendEmail import LocalSink, SendError, send_with_retry
+import benchmark
+import pytest
+import os
+
+def test_fake_compute_serves_and_counts_requests(fake, new_client):
+	seed(fake, 'p', 10, 4)
+	client = new_client()
+	assert len(client.get_rest_servers('RUNNING')) == 4
+	assert sorted(client.get_instance_name_list())[0] == 'loadbalancer-0'
+	assert fake.calls['instances.aggregatedList'] >= 1
+	assert fake.bytes_sent > 0
+
+def test_fake_compute_fails_inserts_in_full_zones(fake, new_client, tmp_path, monkeypatch):
+	fake.full_zones.add('us-central1-a')
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'startup.sh').write_text('#!/bin/bash\n')
+	with pytest.raises(HttpError) as error:
+		new_client().create_instance_from_image('lab02-restserver', 'us-central1-a', 'restserver-0')
+	assert error.value.resp.status == 403
+	assert 'quotaExceeded' in str(error.value)
+
+def test_local_transport_keeps_the_pushed_config(transport, tmp_path):
+	assert transport.push('upstream proxy_data {}')
+	assert (tmp_path / 'default').read_text() == 'upstream proxy_data {}'
+	assert transport.reloads == 1
+
+def test_local_sink_fails_then_keeps_the_email(tmp_path, monkeypatch):
+	monkeypatch.setattr('sendEmail.NOTIFY_INITIAL_DELAY', 0)
+	sink = LocalSink(str(tmp_path / 'sent.jsonl'), failures=2)
+	send_with_retry(sink, 'Subject', 'Content', 'from@example.com', 'to@example.com')
+	assert [email['subject'] for email in sink.sent] == ['Subject']
+	assert (tmp_path / 'sent.jsonl').read_text().count('\n') == 1
+	with pytest.raises(SendError):
+		send_with_retry(LocalSink(failures=1), 'Subject', 'Content', 'from@example.com', 'to@example.com', max_attempts=1)
+
+def test_benchmark_runs_every_scenario(monkeypatch):
+	# scale.py reads startup.sh from the working directory
+	monkeypatch.chdir(os.path.dirname(os.path.abspath(benchmark.__file__)))
+	results = benchmark.run_scenarios(10, operation_duration=0.1)
+	assert [result['scenario'] for result in results] == ['scale-up', 'lb-sync', 'cleaner', 'scale-down']
+	assert all(result['calls'] > 0 for result in results)
@@ -0,0 +1,85 @@
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.errors import HttpError
+from googlecloudclient import RETRY_MAX_ATTEMPTS, RETRY_INITIAL_DELAY, INVENTORY_MAX_AGE, GoogleCloudClient, is_rate_limit_error, retry_delay
+from inventoryStore import InventoryStore
+import httplib2
+import json
+import pytest
+import time
+
+def http_error(status, reason=None, headers=None):
+	content = json.dumps({'error': {'code': status, 'errors': [{'reason': reason}] if reason else []}}).encode()
+	return HttpError(httplib2.Response(dict(headers or {}, status=status)), content)
+
+@pytest.mark.parametrize('error', [http_error(429), http_error(500), http_error(503), http_error(403, 'rateLimitExceeded'),
+	http_error(403, 'userRateLimitExceeded'), ConnectionError(), TimeoutError()])
+def test_transient_errors_are_retried(error):
+	delay = retry_delay(error, 0)
+	assert delay is not None and 0 <= delay <= RETRY_INITIAL_DELAY
+
+@pytest.mark.parametrize('error', [http_error(403, 'quotaExceeded'), http_error(400), http_error(404), ValueError()])
+def test_permanent_errors_are_not_retried(error):
+	assert retry_delay(error, 0) is None
+
+def test_retries_stop_after_the_last_attempt():
+	assert retry_delay(http_error(503), RETRY_MAX_ATTEMPTS - 1) is not None
+	assert retry_delay(http_error(503), RETRY_MAX_ATTEMPTS) is None
+
+def test_retry_after_is_the_least_delay():
+	assert retry_delay(http_error(429, headers={'retry-after': '7'}), 0) >= 7
+	assert retry_delay(http_error(429, headers={'retry-after': 'Fri, 31 Dec 1999 23:59:59 GMT'}), 0) <= RETRY_INITIAL_DELAY
+
+def test_rate_limits_are_told_apart_from_quotas():
+	assert is_rate_limit_error(http_error(429))
+	assert is_rate_limit_error(http_error(403, 'rateLimitExceeded'))
+	assert not is_rate_limit_error(http_error(403, 'quotaExceeded'))
+	assert not is_rate_limit_error(http_error(503))
+
+@pytest.fixture
+def synced(fake, tmp_path, monkeypatch):
+	# A client whose store was just listed in full, with no overlap, so a sync only sees later operations
+	monkeypatch.setattr('googlecloudclient.INVENTORY_SYNC_OVERLAP', 0)
+	fake.add_instance('p', 'restserver-1', 'us-central1-a')
+	fake.add_instance('p', 'restserver-2', 'us-central1-b')
+	client = GoogleCloudClient('p', api_endpoint=fake.url, credentials=AnonymousCredentials(), inventory=InventoryStore(str(tmp_path / 'inventory.db')))
+	client.wait_for_operation(client.stop_instance('restserver-1', 'us-central1-a'))
+	time.sleep(0.01)
+	assert client.sync_inventory() == 2
+	return client
+
+def statuses(client):
+	return {instance['name']: instance['status'] for instance in client.inventory.query('p')}
+
+def test_sync_fetches_only_the_instances_touched_since_the_last_sync(fake, synced):
+	synced.wait_for_operation(synced.stop_instance('restserver-2', 'us-central1-b'))
+	execute = synced._execute
+	listed = []
+
+	def record(request, *args, **kwargs):
+		response = execute(request, *args, **kwargs)
+		if getattr(request, 'methodId', '') == 'compute.globalOperations.aggregatedList':
+			listed.extend(operation['targetLink'] for scoped in response.get('items', {}).values() for operation in scoped.get('operations', []))
+		return response
+
+	synced._execute = record
+	fake.calls.clear()
+	assert synced.sync_inventory() == 1
+	# The stop of restserver-1 ended before the last sync, the API does not send it again
+	assert [link.rsplit('/', 1)[-1] for link in listed] == ['restserver-2']
+	assert fake.calls['instances.aggregatedList'] == 0
+	assert statuses(synced) == {'restserver-1': 'TERMINATED', 'restserver-2': 'TERMINATED'}
+
+def test_sync_removes_instances_that_are_gone(fake, synced):
+	with fake._lock:
+		fake._operation('p', 'us-central1-b', 'delete', fake.instances.pop(('p', 'us-central1-b', 'restserver-2')))
+	assert synced.sync_inventory() == 1
+	assert statuses(synced) == {'restserver-1': 'TERMINATED'}
+
+def test_stale_store_is_listed_again_in_full(fake, synced):
+	# Added without an operation, only a full listing finds it
+	fake.add_instance('p', 'restserver-3', 'us-central1-c')
+	synced.inventory.apply_changes('p', [], [], time.time() - INVENTORY_MAX_AGE - 1)
+	fake.calls.clear()
+	assert synced.sync_inventory() == 3
+	assert fake.calls['instances.aggregatedList'] == 1
+	assert sorted(statuses(synced)) == ['restserver-1', 'restserver-2', 'restserver-3']
@@ -0,0 +1,17 @@
+from fakeCompute import seed
+from httpPool import HttpPool
+import time
+
+def test_operation_waits_are_not_counted_against_the_pool_size(fake, new_client):
+	fake.operation_duration = 1
+	seed(fake, 'p', 12, 10, 0, 'TERMINATED')
+	pool = HttpPool(None, size=2)
+	client = new_client()
+	client._http_pool = pool
+	servers = [(instance['name'], instance['zone'].rsplit('/', 1)[-1]) for instance in client.get_rest_servers('TERMINATED')]
+	start = time.perf_counter()
+	results = client.start_instances(servers)
+	# The 10 waits run together, not 2 at a time
+	assert [result.error for result in results] == [None] * 10
+	assert time.perf_counter() - start < 3
+	assert len(pool._idle) <= 2
@@ -0,0 +1,39 @@
+from rateLimiter import RateLimiter, TokenBucket
+import pytest
+
+def test_bucket_lets_a_burst_through_then_spaces_calls():
+	bucket = TokenBucket(rate=10, capacity=2)
+	assert bucket.reserve() == 0
+	assert bucket.reserve() == 0
+	assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+	# Reserved tokens are handed out in order, the next caller waits behind the previous one
+	assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+def test_bucket_refills_over_time(monkeypatch):
+	now = [100.0]
+	monkeypatch.setattr('rateLimiter.time.monotonic', lambda: now[0])
+	bucket = TokenBucket(rate=10, capacity=2)
+	bucket.reserve(2)
+	now[0] += 0.1
+	assert bucket.reserve() == pytest.approx(0)
+	now[0] += 10
+	# Never more than capacity
+	assert bucket.reserve(3) == pytest.approx(0.1)
+
+def test_drained_bucket_holds_back_every_call(monkeypatch):
+	now = [100.0]
+	monkeypatch.setattr('rateLimiter.time.monotonic', lambda: now[0])
+	bucket = TokenBucket(rate=10, capacity=20)
+	bucket.drain(3)
+	assert bucket.reserve() == pytest.approx(3.1)
+	now[0] += 5
+	assert bucket.reserve() == 0
+
+def test_reads_and_writes_have_their_own_buckets(monkeypatch):
+	sleeps = []
+	monkeypatch.setattr('rateLimiter.time.sleep', sleeps.append)
+	limiter = RateLimiter(read_rate=10, write_rate=1, burst_seconds=1)
+	limiter.penalize('write', 5)
+	assert limiter.acquire(reads=10) == 0
+	assert limiter.acquire(writes=1) == pytest.approx(6, abs=0.01)
+	assert sleeps == [pytest.approx(6, abs=0.01)]
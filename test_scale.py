@@ -0,0 +1,90 @@
+from fakeCompute import seed
+from updateLoadBalancer import upstream_servers
+import collections
+import scale
+import time
+
+def statuses(client):
+	return collections.Counter(instance.status for instance in client.iter_instances() if 'restserver' in instance.name)
+
+def test_scale_up_adds_new_servers_to_the_load_balancer(fake, new_client, transport, silent_ips, tmp_path):
+	seed(fake, 'p', 6, 3, 0, 'TERMINATED')
+	assert scale.scale('p', 4, 'us-central1-c', client=new_client(), transport=transport) is None
+	assert statuses(new_client()) == {'RUNNING': 4}
+	config = (tmp_path / 'default').read_text()
+	assert config.count(' weight=10 ') == 4
+	assert 'backup' not in config
+
+def test_servers_not_ready_are_listed_as_backups():
+	servers = upstream_servers(['10.0.0.2', '10.0.0.3'], {'10.0.0.2': 0.01, '10.0.0.3': None})
+	assert servers == ['server 10.0.0.2 weight=10 max_fails=3 fail_timeout=10s;', 'server 10.0.0.3 weight=1 max_fails=3 fail_timeout=10s backup;']
+
+def test_new_servers_not_answering_in_time_are_backups(fake, new_client, transport, silent_ips, tmp_path, monkeypatch):
+	monkeypatch.setattr(scale, 'SERVER_BOOT_TIMEOUT', 0.5)
+	seed(fake, 'p', 3, 2, 0, 'TERMINATED')
+	client = new_client()
+	silent_ips.add(client.get_instance_data('us-central1-c', 'restserver-1')['networkInterfaces'][0]['networkIP'])
+	scale.scale('p', 2, 'us-central1-c', client=client, transport=transport)
+	config = (tmp_path / 'default').read_text()
+	assert config.count(' weight=10 ') == 1
+	assert config.count(' backup;') == 1
+
+def test_new_servers_are_not_waited_for_outside_the_network(fake, new_client, transport, silent_ips, tmp_path, monkeypatch):
+	monkeypatch.setattr(scale, 'can_reach', lambda ip: False)
+	seed(fake, 'p', 3, 2, 0, 'TERMINATED')
+	client = new_client()
+	silent_ips.update(instance['networkInterfaces'][0]['networkIP'] for instance in client.get_rest_servers('TERMINATED'))
+	start = time.monotonic()
+	scale.scale('p', 2, 'us-central1-c', client=client, transport=transport)
+	assert time.monotonic() - start < scale.SERVER_PROBE_INTERVAL
+	# No server answers, so all of them are listed
+	assert (tmp_path / 'default').read_text().count(' weight=') == 2
+
+def test_warm_pool_does_not_start_servers_that_cannot_suspend(fake, new_client, transport, silent_ips):
+	seed(fake, 'p', 4, 3, 0, 'TERMINATED')
+	refill = scale.scale('p', 1, 'us-central1-c', client=new_client(), transport=transport, warm_pool=2)
+	refill.join()
+	# One f1-micro server serves, the other two stay stopped, and the pool is made of new e2-micro servers
+	assert statuses(new_client()) == {'RUNNING': 1, 'TERMINATED': 2, 'SUSPENDED': 2}
+	suspended = [instance for instance in fake.instances.values() if instance['status'] == 'SUSPENDED']
+	assert all(instance['machineType'].endswith('/e2-micro') for instance in suspended)
+
+def test_warm_pool_is_refused_for_machines_that_cannot_suspend(fake, new_client, transport):
+	seed(fake, 'p', 3, 2, 0, 'TERMINATED')
+	assert scale.scale('p', 2, 'us-central1-c', client=new_client(), transport=transport, warm_pool=2, machine_type='f1-micro') is None
+	assert statuses(new_client()) == {'TERMINATED': 2}
+
+def test_a_failed_insert_gives_its_quota_back(fake, new_client, transport, silent_ips, tmp_path, monkeypatch):
+	fake.zones = ['us-central1-a', 'us-central1-b', 'us-central1-c', 'us-central1-f']
+	fake.quota_limit = {'us-central1': 4}
+	fake.full_zones.add('us-central1-a')
+	seed(fake, 'p', 3, 2)
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'startup.sh').write_text('#!/bin/bash\n')
+	# The only slot left is planned into the empty us-central1-a first, where the insert fails
+	scale.scale('p', 3, 'us-central1-c', client=new_client(), transport=transport)
+	assert statuses(new_client()) == {'RUNNING': 3}
+
+def test_each_scaling_plans_against_the_current_quota(fake, new_client, transport, silent_ips, tmp_path, monkeypatch):
+	fake.zones = ['us-central1-c']
+	fake.quota_limit = {'us-central1': 3}
+	seed(fake, 'p', 2, 1)
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'startup.sh').write_text('#!/bin/bash\n')
+	client = new_client()
+	scale.scale('p', 2, 'us-central1-c', client=client, transport=transport)
+	scale.scale('p', 1, 'us-central1-c', client=client, transport=transport)
+	fake.quota_limit = {'us-central1': 4}
+	# The servers planned by the first scaling are in the usage now, and not taken off the quota again
+	scale.scale('p', 3, 'us-central1-c', client=client, transport=transport)
+	assert statuses(new_client()) == {'RUNNING': 3}
+
+def test_warm_pool_outside_the_network_waits_a_grace_period(fake, new_client, transport, silent_ips, monkeypatch):
+	monkeypatch.setattr(scale, 'can_reach', lambda ip: False)
+	monkeypatch.setattr(scale, 'SERVER_BOOT_GRACE', 0.2)
+	seed(fake, 'p', 2, 1)
+	silent_ips.update('10.0.0.{}'.format(number) for number in range(2, 10))
+	start = time.monotonic()
+	scale.scale('p', 1, 'us-central1-c', client=new_client(), transport=transport, warm_pool=2).join()
+	assert time.monotonic() - start < scale.SERVER_PROBE_INTERVAL + 1
+	assert statuses(new_client()) == {'RUNNING': 1, 'SUSPENDED': 2}
@@ -0,0 +1,16 @@
+from sendEmail import Notifier, LocalSink
+import time
+
+def test_flush_with_nothing_queued_does_not_send_the_next_notification_at_once():
+	sink = LocalSink()
+	notifier = Notifier('from@example.com', 'to@example.com', sink, window=1)
+	try:
+		assert notifier.flush(1)
+		notifier.notify('Scaled to 2 REST servers')
+		time.sleep(0.3)
+		assert sink.sent == []
+		notifier.notify('Scaled to 3 REST servers')
+		assert notifier.flush(5)
+		assert [email['subject'] for email in sink.sent] == ['2 notifications: Scaled to 2 REST servers; Scaled to 3 REST servers']
+	finally:
+		notifier.close(5)
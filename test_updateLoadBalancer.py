@@ -0,0 +1,23 @@
+from loadBalancerTransport import LocalTransport
+from updateLoadBalancer import reconcile
+from fakeCompute import seed
+import subprocess
+
+class FlakyTransport(LocalTransport):
+
+	def __init__(self, directory, failures):
+		super().__init__(directory)
+		self.failures = failures
+
+	def push(self, config):
+		if self.failures > 0:
+			self.failures -= 1
+			raise subprocess.CalledProcessError(255, ['ssh', 'loadbalancer-0'])
+		return super().push(config)
+
+def test_reconcile_pushes_again_after_a_failed_push(fake, new_client, transport, silent_ips, tmp_path):
+	seed(fake, 'p', 3, 2)
+	flaky = FlakyTransport(str(tmp_path), failures=1)
+	reconcile(new_client(), 'us-central1-c', 'loadbalancer-0', 'fibonacci', interval=0.01, debounce=0, transport=flaky, checks=2)
+	assert flaky.reloads == 1
+	assert (tmp_path / 'default').read_text().count(' weight=10 ') == 2
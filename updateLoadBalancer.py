@@ -5,35 +5,200 @@
   @arg  : zone (str): The name of the zone the load balancer is in.
   @arg  : lb_name (str): The name of the load balancer.
   @arg  : proxy (str): The name of the proxy route.
+  @arg  : -force (flag) [optional] push the config even if it is the same as the last one pushed
+  @arg  : -watch (flag) [optional] keep running, and push whenever the set of running REST servers changes
+  @arg  : -interval (float) [optional] with -watch, seconds between checks of the running REST servers
+  @arg  : -debounce (float) [optional] with -watch, seconds the set must stay the same before it is pushed
+  @arg  : -profile (str) [optional] write the API calls and the time of each step to this file, as json,
+  or in the Prometheus text format if it ends with '.prom', see profiler.py. With -watch it is written on exit
+  @arg  : -lb (project zone lb_name) [optional] another load balancer to update, may be given many times.
+  All the load balancers are updated at the same time, and a report is printed, see fleet.py
+  @arg  : -workers (int) [optional] with -lb, the most load balancers updated at the same time
+
+  The upstream only lists REST servers that answer a health check, weighted by how fast they answer,
+  see create_upstream and healthCheck.py. The config is rendered from the 'default' template, and is only pushed (and nginx reloaded) if it
+  differs from the last config pushed to that load balancer. The fingerprints of pushed configs are
+  kept in PUSHED_CONFIGS_FILE. Configs are pushed over a multiplexed ssh connection, or with gcloud if
+  the gcloud ssh key has not been set up yet, see loadBalancerTransport.py.
 
   Example:
   >>> python3 updateLoadBalancer.py project zone lb_name proxy
+  >>> python3 updateLoadBalancer.py project zone lb_name proxy -watch -interval 15
+  >>> python3 updateLoadBalancer.py project-a zone lb_name proxy -lb project-b us-east1-b loadbalancer-0
 """
 
-from googlecloudclient import GoogleCloudClient
+from googlecloudclient import GoogleCloudClient, CACHE_DIR
+from loadBalancerTransport import SshTransport, GcloudTransport, GCLOUD_SSH_KEY
+from healthCheck import probe_backends
+from fleet import fleet_clients, run_fleet, FLEET_WORKERS
 from argparse import ArgumentParser
 from colorama import init, Fore
+import threading
+import hashlib
+import time
+import json
 import os
 
-def create_upstream(client, upstream_name):
+# The nginx sites-available/default template, upstream_data and proxy_data are replaced when rendering
+CONFIG_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default')
+PUSHED_CONFIGS_FILE = os.path.join(CACHE_DIR, 'pushed-configs.json')
+
+# Defaults for reconcile: seconds between checks, how long a change must settle before it is pushed,
+# and the longest a change may wait while the set keeps changing
+WATCH_INTERVAL = 15
+WATCH_DEBOUNCE = 10
+WATCH_MAX_DELAY = 60
+
+# Upstream weights run from 1 to MAX_WEIGHT, the fastest server gets MAX_WEIGHT. Latencies below
+# LATENCY_FLOOR count as LATENCY_FLOOR, so network jitter does not change the weights, and servers
+# more than SLOW_FACTOR times slower than the fastest are only used as backups
+MAX_WEIGHT = 10
+LATENCY_FLOOR = 0.05
+SLOW_FACTOR = 3
+# nginx stops sending traffic to a server for FAIL_TIMEOUT after MAX_FAILS failed attempts
+MAX_FAILS = 3
+FAIL_TIMEOUT = '10s'
+# With no servers the upstream still needs one, nginx refuses an empty upstream. It is marked down,
+# so nginx answers 502 straight away
+PLACEHOLDER_SERVER = 'server 127.0.0.1:1 down;'
+
+# Transports opened by get_transport, reused by later pushes to the same load balancer
+transports = {}
+# Load balancers updated at the same time share the transports and PUSHED_CONFIGS_FILE
+_shared_lock = threading.Lock()
+
+def ready_ips(running_ips, health):
+  """
+  This function will return the running servers that passed their health check. If none of them did,
+  which is also what happens when the checks cannot reach the servers' network, it returns all of
+  them, so the load balancer is never emptied by the checks alone.
+  Args:
+    running_ips (list): The internal ips of the running REST servers
+    health (dict): The latency of each server, None if it is not ready, see healthCheck.probe_backends
+  Returns:
+    list (str): The ips, sorted
+  """
+  ready = sorted(ip for ip in running_ips if health.get(ip) is not None)
+  return ready if len(ready) > 0 else sorted(running_ips)
+
+def upstream_servers(running_ips, health):
+  """
+  This function will return the nginx server entries of the upstream. Ready servers are weighted by
+  their latency, and slow ones become backups. Servers that are running but not ready yet, such as
+  ones still booting, are listed as backups too, so they are not lost if no update follows once they
+  are ready, and nginx only sends them traffic if the ready servers fail.
+  Args:
+    running_ips (list): The internal ips of the running REST servers
+    health (dict): The latency of each server, None if it is not ready, see healthCheck.probe_backends
+  Example:
+  >>> upstream_servers(['10.128.0.5', '10.128.0.6', '10.128.0.7'], {'10.128.0.5': 0.01, '10.128.0.6': 0.4, '10.128.0.7': None})
+  ['server 10.128.0.5 weight=10 max_fails=3 fail_timeout=10s;', 'server 10.128.0.6 weight=1 max_fails=3 fail_timeout=10s backup;',
+  'server 10.128.0.7 weight=1 max_fails=3 fail_timeout=10s backup;']
+  Returns:
+    list (str): The entries, or PLACEHOLDER_SERVER if there are no running servers
+  """
+  if len(running_ips) == 0:
+    return [PLACEHOLDER_SERVER]
+  ips = ready_ips(running_ips, health)
+  latencies = {ip: max(health.get(ip) or LATENCY_FLOOR, LATENCY_FLOOR) for ip in ips}
+  fastest = min(latencies.values())
+  servers = []
+  for ip in ips:
+    server = 'server {} weight={} max_fails={} fail_timeout={}'.format(ip, max(1, round(MAX_WEIGHT * fastest / latencies[ip])), MAX_FAILS, FAIL_TIMEOUT)
+    if latencies[ip] > SLOW_FACTOR * fastest:
+      server += ' backup'
+    servers.append(server + ';')
+  for ip in sorted(set(running_ips) - set(ips)):
+    servers.append('server {} weight=1 max_fails={} fail_timeout={} backup;'.format(ip, MAX_FAILS, FAIL_TIMEOUT))
+  return servers
+
+def create_upstream(client, upstream_name, running_ips=None, health=None):
   """
   This function will generate the upstream data that will be uploaded to the load balancer.
   Args:
     client (obj): An instantiated GoogleCloudClient object
     upstream_name (str): The name of the upstream route
+    running_ips (list): [optional] The internal ips of the running REST servers, by default they are fetched
+    health (dict): [optional] The latency of each server, by default the servers are probed, see healthCheck.py
   Returns:
     str: the upstream data
   """
-  running_ips = client.get_all_running_rest_server_internal_ips()
-  if len(running_ips) == 0:
-    running_ips.append('00.000.0.00')
-  upstream = 'upstream ' + upstream_name + ' { '
-  for ip in running_ips:
-    upstream += ' server ' + ip + ';'
-  upstream += ' }'
-  return upstream
+  if running_ips is None:
+    running_ips = client.get_all_running_rest_server_internal_ips()
+  running_ips = list(running_ips)
+  if health is None:
+    with client.profiler.phase('health check'):
+      health = probe_backends(running_ips)
+  return 'upstream ' + upstream_name + ' {  ' + ' '.join(upstream_servers(running_ips, health)) + ' }'
+
+def render_config(upstream_data, proxy):
+  """
+  This function will render the nginx sites-available/default file from CONFIG_TEMPLATE.
+  Args:
+    upstream_data (str): The upstream block, see create_upstream
+    proxy (str): The name of the proxy route
+  Returns:
+    str: the contents of the file
+  """
+  with open(CONFIG_TEMPLATE, 'r') as template:
+    return template.read().replace('upstream_data', upstream_data).replace('proxy_data', proxy)
 
-def update_load_balancer_upstream(client, zone, lb_name, proxy):
+def config_fingerprint(config):
+  """
+  This function will return a fingerprint of a rendered config.
+  Args:
+    config (str): The rendered config, see render_config
+  Returns:
+    str: the sha256 hex digest of the config
+  """
+  return hashlib.sha256(config.encode()).hexdigest()
+
+def load_pushed_fingerprints():
+  """
+  This function will return the fingerprints of the last configs pushed to each load balancer.
+  Returns:
+    dict: fingerprints, keyed by 'project/zone/lb_name'
+  """
+  try:
+    with open(PUSHED_CONFIGS_FILE, 'r') as pushed:
+      return json.load(pushed)
+  except (OSError, ValueError):
+    return {}
+
+def save_pushed_fingerprint(key, fingerprint):
+  """
+  This function will record the fingerprint of the config just pushed to a load balancer.
+  Args:
+    key (str): 'project/zone/lb_name'
+    fingerprint (str): see config_fingerprint
+  """
+  with _shared_lock:
+    fingerprints = load_pushed_fingerprints()
+    fingerprints[key] = fingerprint
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(PUSHED_CONFIGS_FILE + '.tmp', 'w') as pushed:
+      json.dump(fingerprints, pushed, indent=2)
+    os.replace(PUSHED_CONFIGS_FILE + '.tmp', PUSHED_CONFIGS_FILE)
+
+def get_transport(lb_data, zone):
+  """
+  This function will return the transport used to push configs to a load balancer. An ssh transport
+  is opened once for each load balancer address and reused, see loadBalancerTransport.py.
+  Args:
+    lb_data (json): The instance data of the running load balancer
+    zone (str): The name of the zone the load balancer is in
+  Returns:
+    obj: A transport, with push(config) and close() methods
+  """
+  if not os.path.exists(GCLOUD_SSH_KEY):
+    return GcloudTransport(lb_data['name'], zone)
+  host = lb_data['networkInterfaces'][0]['accessConfigs'][0]['natIP']
+  with _shared_lock:
+    if host not in transports:
+      transports[host] = SshTransport(host, host_key_alias='compute.' + lb_data['id'])
+    return transports[host]
+
+def update_load_balancer_upstream(client, zone, lb_name, proxy, force=False, transport=None, running_ips=None, health=None):
   """
   This function will update an nginx load balancer in a Google Cloud project.
   Specifically, it will update it's upstream, and then reload nginx so that the
@@ -43,46 +208,171 @@ def update_load_balancer_upstream(client, zone, lb_name, proxy):
     zone (str): The name of the zone the load balancer is in
     lb_name (str): The name of the load balancer
     proxy (str): The name of the proxy route
+    force (bool): [optional] Push the config even if it matches the last config pushed
+    transport (obj): [optional] How to push the config, see get_transport for the default
+    running_ips (list): [optional] The internal ips of the running REST servers, by default they are fetched
+    health (dict): [optional] The latency of each server, by default the servers are probed, see create_upstream
   Returns:
-    Nothing
+    bool: True if the load balancer has the config, because it was pushed or was already there,
+    False if it could not be pushed
   """
   # First we need our IPs and our data
   print('Preparing to update {} upstream'.format(lb_name))
   #	Make sure the load balancer is on, if not turn it on
-  lb_data = client.get_instance_data(zone, lb_name)
+  with client.profiler.phase('read load balancer'):
+    lb_data = client.get_instance_data(zone, lb_name)
   if lb_data['status'] != 'RUNNING':
     print('{:<70}'.format('{} was off, starting it now ... '.format(lb_name)), end='', flush=True),
     operation = client.start_instance(lb_name, zone)
     result = client.wait_for_operation(operation)
     if result['status'] == 'DONE':
       print(Fore.GREEN + '[COMPLETE]')
-  # Now get the data we need
-  print('{:<70}'.format('Fetching {} external IP address ... '.format(lb_name)), end='', flush=True),
-  lb_external_ip = client.get_external_ip(zone, lb_name)
-  print(Fore.GREEN + '[COMPLETE]')
+    # A restarted load balancer may have a new external IP address
+    lb_data = client.get_instance_data(zone, lb_name)
   print('{:<70}'.format('Creating upstream and proxy_pass data ... '), end='', flush=True),
-  upstream_data = create_upstream(client, proxy)
+  with client.profiler.phase('create upstream'):
+    upstream_data = create_upstream(client, proxy, running_ips, health)
   print(Fore.GREEN + '[COMPLETE]')
-  # Edit a local file to send to nginx
+  # Render the file to send to nginx, and compare it with what we pushed last time
   print('{:<70}'.format('Creating nginx/sites-available/default file ... '), end='', flush=True),
-  os.system("sed -i -e \'s/upstream_data/" + upstream_data + "/g\' default")
-  os.system("sed -i -e \'s/proxy_data/" + proxy + "/g\' default")
+  config = render_config(upstream_data, proxy)
+  fingerprint = config_fingerprint(config)
+  key = '/'.join([client.project, zone, lb_name])
   print(Fore.GREEN + '[COMPLETE]')
-  print('Preparing to scp sites-available/default file to {}'.format(lb_name))
-  # Now use gcloud to send it
-  os.system('gcloud compute scp default root@loadbalancer-0:/etc/nginx/sites-available/default --zone us-central1-c')
-  # Now ssh into the load balancer, and reload nginx
-  print('Reloading nginx on {}'.format(lb_name))
-  os.system('gcloud compute ssh {} --zone {} --command \"sudo service nginx reload\"'.format(lb_name, zone))
-  # Change our local file back to a template
-  os.system("cp default.backup default")
+  if not force and load_pushed_fingerprints().get(key) == fingerprint:
+    print('{:<70}'.format('{} upstream is unchanged ...'.format(lb_name)), end='', flush=True),
+    print(Fore.GREEN + '[SKIPPED]')
+    return True
+  if transport is None:
+    transport = get_transport(lb_data, zone)
+  print('{:<70}'.format('Pushing config to {} and reloading nginx ... '.format(lb_name)), end='', flush=True),
+  with client.profiler.phase('push config'):
+    pushed = transport.push(config)
+  if pushed:
+    print(Fore.GREEN + '[COMPLETE]')
+  else:
+    print(Fore.RED + '[FAILED]')
+    # Nothing is recorded, so the next run tries again
+    return False
+  save_pushed_fingerprint(key, fingerprint)
   print('{:<70}'.format('{} updates ...'.format(lb_name)), end='', flush=True),
   print(Fore.GREEN + '[COMPLETE]')
+  return True
+
+def reconcile(client, zone, lb_name, proxy, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, max_delay=WATCH_MAX_DELAY, transport=None, checks=None):
+  """
+  This function will keep a load balancer's upstream in line with the running REST servers, for servers
+  started, stopped or preempted outside scale.py. Every interval seconds it reads the running REST server
+  ips with one filtered listing, probes them, and compares the ready ones with the set last pushed, so a
+  new server is added once it answers, and one that stops answering is taken out. A changed set is pushed
+  once it has stayed the same for debounce seconds, or has been pending for max_delay seconds. A push that
+  fails is tried again at the next check.
+  Args:
+    client (obj): An instantiated GoogleCloudClient object
+    zone (str): The name of the zone the load balancer is in
+    lb_name (str): The name of the load balancer
+    proxy (str): The name of the proxy route
+    interval (float): [optional] Seconds between checks
+    debounce (float): [optional] Seconds a changed set must stay the same before it is pushed
+    max_delay (float): [optional] The most seconds a change waits while the set keeps changing
+    transport (obj): [optional] How to push the config, see get_transport for the default
+    checks (int): [optional] Stop after this many checks, by default run until interrupted
+  Returns:
+    Nothing
+  """
+  from googleapiclient.errors import HttpError
+  pushed_ips = None
+  pending_ips = None
+  pending_since = changed_at = 0
+  count = 0
+  while checks is None or count < checks:
+    count += 1
+    try:
+      running_ips = sorted(set(client.get_all_running_rest_server_internal_ips()))
+    except HttpError as error:
+      print(Fore.YELLOW + 'Could not read the running REST servers, trying again in {} seconds: {}'.format(interval, error))
+      time.sleep(interval)
+      continue
+    with client.profiler.phase('health check'):
+      health = probe_backends(running_ips)
+    current_ips = ready_ips(running_ips, health)
+    now = time.monotonic()
+    if current_ips == pushed_ips:
+      pending_ips = None
+    elif current_ips != pending_ips:
+      if pending_ips is None:
+        pending_since = now
+      pending_ips = current_ips
+      changed_at = now
+    # The first check always goes through, the fingerprint skips the push if nothing changed since the last run
+    if pending_ips is not None and (pushed_ips is None or now - changed_at >= debounce or now - pending_since >= max_delay):
+      print('REST servers ready: {}'.format(', '.join(pending_ips) or 'none'))
+      try:
+        pushed = update_load_balancer_upstream(client, zone, lb_name, proxy, transport=transport, running_ips=running_ips, health=health)
+      except Exception as error:
+        # Reading or starting the load balancer, or pushing to it, failed. The set stays pending and is pushed again
+        print(Fore.YELLOW + 'Could not update {}, trying again in {} seconds: {}'.format(lb_name, interval, error))
+        pushed = False
+      if pushed:
+        pushed_ips = pending_ips
+        pending_ips = None
+    if checks is None or count < checks:
+      time.sleep(interval)
+
+def update_load_balancers(targets, proxy, force=False, workers=FLEET_WORKERS, clients=None):
+  """
+  This function will update many load balancers at the same time, see update_load_balancer_upstream
+  and fleet.run_fleet, and print a report.
+  Args:
+    targets (list): (project, zone, lb_name) tuples of the load balancers
+    proxy (str): The name of the proxy route
+    force (bool): [optional] Push the configs even if they match the last configs pushed
+    workers (int): [optional] The most load balancers updated at the same time
+    clients (dict): [optional] A GoogleCloudClient for each project, by default made with fleet.fleet_clients
+  Returns:
+    list (FleetResult): The result of each load balancer, True if it has the config
+  """
+  if clients is None:
+    projects = list(dict.fromkeys(project for project, _, _ in targets))
+    clients = dict(zip(projects, fleet_clients(projects)))
+  results = run_fleet([('/'.join(target), lambda target=target: update_load_balancer_upstream(clients[target[0]], target[1], target[2], proxy, force))
+    for target in targets], workers)
+  print('{:<60}{:>10}{:>10}'.format('load balancer', 'status', 'seconds'))
+  for result in results:
+    if result.error is None and result.result:
+      print('{:<60}{:>10}{:>10.1f}'.format(result.name, 'updated', result.seconds))
+    else:
+      print(Fore.RED + '{:<60}{:>10}{:>10.1f}  {}'.format(result.name, 'FAILED', result.seconds, result.error or ''))
+  return results
 
-def main(project, zone, lb, proxy):
+def main(project, zone, lb, proxy, force, watch, interval, debounce, profile=None, lbs=(), workers=FLEET_WORKERS):
   init(autoreset=True)
+  if len(lbs) > 0:
+    targets = [(project, zone, lb)] + [tuple(target) for target in lbs]
+    projects = list(dict.fromkeys(target[0] for target in targets))
+    clients = dict(zip(projects, fleet_clients(projects)))
+    try:
+      update_load_balancers(targets, proxy, force, workers, clients)
+    finally:
+      for transport in transports.values():
+        transport.close()
+      if profile is not None:
+        clients[project].profiler.dump(profile, 'updateLoadBalancer')
+    return
   client = GoogleCloudClient(project)
-  update_load_balancer_upstream(client, zone, lb, proxy)
+  try:
+    if watch:
+      print('Watching the REST servers of {}, press Ctrl+C to stop'.format(project))
+      try:
+        reconcile(client, zone, lb, proxy, interval, debounce)
+      except KeyboardInterrupt:
+        for transport in transports.values():
+          transport.close()
+    else:
+      update_load_balancer_upstream(client, zone, lb, proxy, force)
+  finally:
+    if profile is not None:
+      client.profiler.dump(profile, 'updateLoadBalancer')
 
 if __name__ == '__main__':
   parser = ArgumentParser(description='This script will update the upstream and proxy_pass of an \
@@ -91,5 +381,14 @@ if __name__ == '__main__':
   parser.add_argument("zone", help="the zone your load balancer is located in")
   parser.add_argument("lb_name", help="the name of your load balancer instance")
   parser.add_argument("proxy", help="the route you want to proxy requests too")
+  parser.add_argument("-force", help="flag to push the config even if it has not changed", action="store_true")
+  parser.add_argument("-watch", help="flag to keep running and push whenever the running REST servers change", action="store_true")
+  parser.add_argument("-interval", type=float, default=WATCH_INTERVAL, help="with -watch, seconds between checks")
+  parser.add_argument("-debounce", type=float, default=WATCH_DEBOUNCE, help="with -watch, seconds a change must settle before it is pushed")
+  parser.add_argument("-profile", help="write a profile of the API calls to this file, .json or .prom")
+  parser.add_argument("-lb", nargs=3, action="append", default=[], metavar=("PROJECT", "ZONE", "LB_NAME"), help="another load balancer to update at the same time, may be given many times")
+  parser.add_argument("-workers", type=int, default=FLEET_WORKERS, help="with -lb, the most load balancers updated at the same time")
   args = parser.parse_args()
-  main(args.project, args.zone, args.lb_name, args.proxy)
+  if args.watch and len(args.lb) > 0:
+    parser.error('-watch updates one load balancer, -lb cannot be used with it')
+  main(args.project, args.zone, args.lb_name, args.proxy, args.force, args.watch, args.interval, args.debounce, args.profile, args.lb, args.workers)